@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date
+from typing import List, Optional
+
+from app.database.settings import get_session
+from app.services.analytics_services import AnalyticsService
+from app.schemas.analytics import DefectSummary, BurndownGetting, ResolutionReport
+from app.schemas.defect import DefectPriority
+from app.schemas.defect_history import StatusTimeGetting
+from app.core.security import get_current_user
+
+an_router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+@an_router.get("/summary", response_model=DefectSummary)
+async def get_summary(
+    group_by: List[str] = Query(["status"], description="project, status, priority, assignee"),
+    project_id: Optional[int] = None,
+    assigned_to_id: Optional[int] = None,
+    session: AsyncSession = Depends(get_session),
+    current_user: dict = Depends(get_current_user)
+):
+    """Количество дефектов по группам. Читает только сводную таблицу defect_counts."""
+    return await AnalyticsService.get_summary(group_by, session, project_id=project_id, assigned_to_id=assigned_to_id)
+
+@an_router.get("/projects/{project_id}/time-in-status", response_model=List[StatusTimeGetting])
+async def get_time_in_status(
+    project_id: int,
+    session: AsyncSession = Depends(get_session),
+    current_user: dict = Depends(get_current_user)
+):
+    """Суммарное и среднее время дефектов проекта в каждом статусе (завершённые интервалы)."""
+    return await AnalyticsService.get_time_in_status(project_id, session)
+
+@an_router.get("/projects/{project_id}/burndown", response_model=BurndownGetting)
+async def get_burndown(
+    project_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    session: AsyncSession = Depends(get_session),
+    current_user: dict = Depends(get_current_user)
+):
+    """Открыто/закрыто/переоткрыто за день и число открытых дефектов по дням (UTC) из дневных корзин."""
+    return await AnalyticsService.get_burndown(project_id, session, start=start, end=end)
+
+@an_router.get("/resolution-times", response_model=ResolutionReport)
+async def get_resolution_times(
+    group_by: List[str] = Query([], description="project, priority, assignee"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    project_id: Optional[int] = None,
+    priority: Optional[DefectPriority] = None,
+    assigned_to_id: Optional[int] = None,
+    session: AsyncSession = Depends(get_session),
+    current_user: dict = Depends(get_current_user)
+):
+    """p50/p90/p99 времени от создания до закрытия (секунды) по дефектам, закрытым за период. Значения приближённые."""
+    return await AnalyticsService.get_resolution_times(
+        group_by, session, start=start, end=end, project_id=project_id, priority=priority, assigned_to_id=assigned_to_id
+    )
@@ -1,22 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from email.utils import format_datetime
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 
+from app.core.config import ATTACHMENT_CACHE_MAX_AGE
+from app.core.derivatives import derivative_pipeline
+from app.core.file_response import content_disposition, file_response
+from app.core.pagination import set_pagination_headers
+from app.core.serialization import list_response
+from app.core.streaming import stream_response
 from app.database.settings import get_session
 from app.services.attachment_services import DefectAttachmentService
-from app.schemas.attachment import DefectAttachmentCreate, DefectAttachmentUpdate, DefectAttachmentGetting
+from app.schemas.attachment import DefectAttachmentCreate, DefectAttachmentUpdate, DefectAttachmentGetting, ResumableUploadCreate, ResumableUploadGetting
 from app.core.security import get_current_user
 
 a_router = APIRouter(prefix="/attachments", tags=["Attachments"])
 
 @a_router.get("/", response_model=List[DefectAttachmentGetting])
 async def get_all_attachments(
+    request: Request,
+    response: Response,
     limit: int = 100,
     offset: int = 0,
+    cursor: Optional[str] = None,
+    sort: str = "id",
     session: AsyncSession = Depends(get_session),
     current_user: dict = Depends(get_current_user)
 ):
-    return await DefectAttachmentService.get_all_attachments(limit, offset, session)
+    attachments = await DefectAttachmentService.get_all_attachments(limit, offset, session, cursor=cursor, sort=sort)
+    set_pagination_headers(request, response, attachments, sort, limit)
+    return list_response(request, attachments, response)
 
 @a_router.get("/{attachment_id}", response_model=DefectAttachmentGetting)
 async def get_attachment_by_id(
@@ -26,13 +40,118 @@ async def get_attachment_by_id(
 ):
     return await DefectAttachmentService.get_attachment_by_id(attachment_id, session)
 
+def upload_headers(upload: ResumableUploadGetting) -> dict:
+    headers = {
+        "Upload-Offset": str(upload.offset),
+        "Upload-Length": str(upload.size),
+        "Upload-Expires": format_datetime(upload.expires_at, usegmt=True),
+        "Cache-Control": "no-store",
+    }
+    if upload.attachment_id is not None:
+        headers["Location"] = f"/attachments/{upload.attachment_id}"
+    return headers
+
+@a_router.post("/uploads", response_model=ResumableUploadGetting, status_code=status.HTTP_201_CREATED)
+async def create_upload(
+    upload_data: ResumableUploadCreate,
+    response: Response,
+    session: AsyncSession = Depends(get_session),
+    current_user: dict = Depends(get_current_user)
+):
+    upload = await DefectAttachmentService.create_upload(upload_data, current_user.id, session)
+    response.headers.update(upload_headers(upload))
+    response.headers["Location"] = f"/attachments/uploads/{upload.id}"
+    return upload
+
+@a_router.head("/uploads/{upload_id}")
+async def get_upload_progress(
+    upload_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    upload = await DefectAttachmentService.get_upload(upload_id, current_user.id)
+    return Response(status_code=status.HTTP_200_OK, headers=upload_headers(upload))
+
+@a_router.patch("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def append_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(...),
+    session: AsyncSession = Depends(get_session),
+    current_user: dict = Depends(get_current_user)
+):
+    # Тело - сырые байты куска с Upload-Offset; Location появляется, когда вложение создано
+    upload = await DefectAttachmentService.append_upload(upload_id, upload_offset, request, current_user.id, session)
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=upload_headers(upload))
+
+@a_router.delete("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_upload(
+    upload_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    await DefectAttachmentService.delete_upload(upload_id, current_user.id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+def cache_control(version: Optional[str], tag: str) -> str:
+    # Под одним id содержимое может смениться (PUT file_path), под ?v=<sha256> (у производных - ?v=<ETag>) - никогда
+    if version == tag:
+        return f"private, max-age={ATTACHMENT_CACHE_MAX_AGE}, immutable"
+    return "private, no-cache"
+
+@a_router.api_route("/{attachment_id}/content", methods=["GET", "HEAD"], response_class=Response)
+async def get_attachment_content(
+    attachment_id: int,
+    request: Request,
+    v: Optional[str] = None,
+    session: AsyncSession = Depends(get_session),
+    current_user: dict = Depends(get_current_user)
+):
+    attachment, path = await DefectAttachmentService.get_attachment_content(attachment_id, session)
+    media_type = attachment.content_type or "application/octet-stream"
+    headers = {
+        "cache-control": cache_control(v, attachment.file_path),
+        "content-disposition": content_disposition(attachment.file_name, media_type),
+        "x-content-type-options": "nosniff",
+    }
+    return file_response(request, path, attachment.size, f'"{attachment.file_path}"', media_type, headers)
+
+@a_router.api_route("/{attachment_id}/derivatives/{name}", methods=["GET", "HEAD"], response_class=Response)
+async def get_attachment_derivative(
+    attachment_id: int,
+    name: str,
+    request: Request,
+    v: Optional[str] = None,
+    session: AsyncSession = Depends(get_session),
+    current_user: dict = Depends(get_current_user)
+):
+    attachment, original, derivative = await DefectAttachmentService.get_attachment_derivative(attachment_id, name, session)
+    headers = {"x-content-type-options": "nosniff"}
+    if derivative is None:
+        # Миниатюра ещё строится: отдаём оригинал без долгого кеша, следующий запрос получит уменьшенную копию
+        headers.update({"cache-control": "private, no-cache", "content-disposition": content_disposition(attachment.file_name, attachment.content_type)})
+        return file_response(request, original, attachment.size, f'"{attachment.file_path}"', attachment.content_type, headers)
+    path, size = derivative
+    tag = derivative_pipeline.tag(attachment.file_path, name)
+    headers.update({"cache-control": cache_control(v, tag), "content-disposition": "inline"})
+    return file_response(request, path, size, f'"{tag}"', derivative_pipeline.media_type, headers)
+
 @a_router.get("/defect/{defect_id}", response_model=List[DefectAttachmentGetting])
 async def get_attachments_by_defect(
     defect_id: int,
+    request: Request,
+    response: Response,
+    limit: int = 100,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    stream: bool = False,
     session: AsyncSession = Depends(get_session),
     current_user: dict = Depends(get_current_user)
 ):
-    return await DefectAttachmentService.get_attachments_by_defect(defect_id, session)
+    if stream:
+        return stream_response(request, DefectAttachmentService.stream_attachments_by_defect(defect_id, session, sort=sort))
+    attachments = await DefectAttachmentService.get_attachments_by_defect(defect_id, session, limit=limit, offset=offset, cursor=cursor, sort=sort)
+    set_pagination_headers(request, response, attachments, sort, limit)
+    return list_response(request, attachments, response)
 
 @a_router.post("/", response_model=DefectAttachmentGetting, status_code=status.HTTP_201_CREATED)
 async def create_attachment(
@@ -42,6 +161,24 @@ async def create_attachment(
 ):
     return await DefectAttachmentService.create_attachment(attachment_data, session)
 
+@a_router.post(
+    "/upload",
+    response_model=DefectAttachmentGetting,
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra={"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "required": ["defect_id", "file"],
+        "properties": {"defect_id": {"type": "integer"}, "file": {"type": "string", "format": "binary"}},
+    }}}}},
+)
+async def upload_attachment(
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    current_user: dict = Depends(get_current_user)
+):
+    # Тело разбирается потоком в сервисе, а не через UploadFile: файл не копится в памяти и в /tmp
+    return await DefectAttachmentService.upload_attachment(request, session)
+
 @a_router.put("/{attachment_id}", response_model=DefectAttachmentGetting)
 async def update_attachment(
     attachment_id: int,
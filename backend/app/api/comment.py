@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 
+from app.core.pagination import set_pagination_headers
+from app.core.projection import Projection, projection_params
+from app.core.serialization import list_response
+from app.core.streaming import stream_response
 from app.database.settings import get_session
 from app.services.comment_services import CommentService
 from app.schemas.comment import CommentCreate, CommentUpdate, CommentGetting
@@ -11,12 +15,19 @@ c_router = APIRouter(prefix="/comments", tags=["Comments"])
 
 @c_router.get("/", response_model=List[CommentGetting])
 async def get_all_comments(
+    request: Request,
+    response: Response,
     limit: int = 100,
     offset: int = 0,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    projection: Projection = Depends(projection_params),
     session: AsyncSession = Depends(get_session),
     current_user: dict = Depends(get_current_user)
 ):
-    return await CommentService.get_all_comments(limit, offset, session)
+    comments = await CommentService.get_all_comments(limit, offset, session, cursor=cursor, sort=sort, projection=projection)
+    set_pagination_headers(request, response, comments, sort, limit)
+    return list_response(request, comments, response)
 
 @c_router.get("/{comment_id}", response_model=CommentGetting)
 async def get_comment_by_id(
@@ -29,18 +40,42 @@ async def get_comment_by_id(
 @c_router.get("/defect/{defect_id}", response_model=List[CommentGetting])
 async def get_comments_by_defect(
     defect_id: int,
+    request: Request,
+    response: Response,
+    limit: int = 100,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    projection: Projection = Depends(projection_params),
+    stream: bool = False,
     session: AsyncSession = Depends(get_session),
     current_user: dict = Depends(get_current_user)
 ):
-    return await CommentService.get_comments_by_defect(defect_id, session)
+    if stream:
+        return stream_response(request, CommentService.stream_comments_by_defect(defect_id, session, sort=sort))
+    comments = await CommentService.get_comments_by_defect(defect_id, session, limit=limit, offset=offset, cursor=cursor, sort=sort, projection=projection)
+    set_pagination_headers(request, response, comments, sort, limit)
+    return list_response(request, comments, response)
 
 @c_router.get("/user/{user_id}", response_model=List[CommentGetting])
 async def get_comments_by_author(
     user_id: int,
+    request: Request,
+    response: Response,
+    limit: int = 100,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    projection: Projection = Depends(projection_params),
+    stream: bool = False,
     session: AsyncSession = Depends(get_session),
     current_user: dict = Depends(get_current_user)
 ):
-    return await CommentService.get_comments_by_author(user_id, session)
+    if stream:
+        return stream_response(request, CommentService.stream_comments_by_author(user_id, session, sort=sort))
+    comments = await CommentService.get_comments_by_author(user_id, session, limit=limit, offset=offset, cursor=cursor, sort=sort, projection=projection)
+    set_pagination_headers(request, response, comments, sort, limit)
+    return list_response(request, comments, response)
 
 @c_router.post("/", response_model=CommentGetting, status_code=status.HTTP_201_CREATED)
 async def create_comment(
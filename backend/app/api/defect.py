@@ -1,46 +1,149 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Literal, Optional
 
+from app.core.conditional import conditional_get
+from app.core.pagination import set_pagination_headers
+from app.core.projection import Projection, projection_params
+from app.core.serialization import list_response
+from app.core.streaming import stream_response
 from app.database.settings import get_session
 from app.services.defects_services import DefectService
-from app.schemas.defect import DefectCreate, DefectUpdate, DefectGetting
+from app.services.defect_import_services import DefectImportService
+from app.services.defect_export_services import DefectExportService
+from app.schemas.defect import DefectCreate, DefectUpdate, DefectGetting, DefectFull, DefectImportResult, DefectFilter, DefectStatus, DefectPriority
+from app.schemas.user import UserGetting
+from app.schemas.defect_history import DefectStatusEventGetting
 from app.core.security import get_current_user
 
 d_router = APIRouter(prefix="/defects", tags=["Defects"])
 
+# ETag по счётчику изменений defects; повторный запрос с If-None-Match получает 304 без чтения строк.
+# ?include= читает пользователей и комментарии, такие запросы идут без ETag
+defects_etag = conditional_get("defects", skip_params=("include",))
+
+def defect_filters(
+    status: Optional[List[DefectStatus]] = Query(None),
+    priority: Optional[List[DefectPriority]] = Query(None),
+    project_id: Optional[int] = None,
+    assigned_to_id: Optional[int] = None,
+    created_by_id: Optional[int] = None,
+    q: Optional[str] = Query(None, min_length=1, max_length=200, description="Поиск по названию"),
+) -> DefectFilter:
+    """?status=new&status=in_progress&priority=high&project_id=1&q=трещина"""
+    return DefectFilter(status=status, priority=priority, project_id=project_id,
+                        assigned_to_id=assigned_to_id, created_by_id=created_by_id, q=q)
+
 @d_router.get("/", response_model=List[DefectGetting])
 async def get_all_defects(
+    request: Request,
+    response: Response,
     limit: int = 100,
     offset: int = 0,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    projection: Projection = Depends(projection_params),
+    filters: DefectFilter = Depends(defect_filters),
+    session: AsyncSession = Depends(get_session),
+    current_user: dict = Depends(get_current_user),
+    _: None = Depends(defects_etag)
+):
+    defects = await DefectService.get_all_defects(limit, offset, session, cursor=cursor, sort=sort, filters=filters, projection=projection)
+    set_pagination_headers(request, response, defects, sort, limit)
+    return list_response(request, defects, response)
+
+@d_router.get("/export", response_class=StreamingResponse)
+async def export_defects(
+    export_format: Literal["csv", "xlsx"] = Query("csv", alias="format"),
+    filters: DefectFilter = Depends(defect_filters),
     session: AsyncSession = Depends(get_session),
     current_user: dict = Depends(get_current_user)
 ):
-    return await DefectService.get_all_defects(limit, offset, session)
+    """Выгрузка всех дефектов по фильтрам списка; файл формируется по мере чтения из БД."""
+    media_type, content = DefectExportService.export_defects(export_format, filters, session)
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="defects.{export_format}"'},
+    )
 
 @d_router.get("/{defect_id}", response_model=DefectGetting)
 async def get_defect_by_id(
     defect_id: int,
     session: AsyncSession = Depends(get_session),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    _: None = Depends(defects_etag)
 ):
     return await DefectService.get_defect_by_id(defect_id, session)
 
+@d_router.get("/{defect_id}/full", response_model=DefectFull)
+async def get_defect_full(
+    defect_id: int,
+    session: AsyncSession = Depends(get_session),
+    current_user: dict = Depends(get_current_user)
+):
+    """Дефект с проектом, автором, исполнителем, комментариями и вложениями за один запрос к API."""
+    return await DefectService.get_defect_full(defect_id, session)
+
+@d_router.get("/{defect_id}/history", response_model=List[DefectStatusEventGetting])
+async def get_defect_history(
+    defect_id: int,
+    request: Request,
+    response: Response,
+    limit: int = 100,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    session: AsyncSession = Depends(get_session),
+    current_user: dict = Depends(get_current_user)
+):
+    """Смены статуса дефекта с длительностью предыдущего статуса."""
+    events = await DefectService.get_defect_history(defect_id, session, limit=limit, offset=offset, cursor=cursor, sort=sort)
+    set_pagination_headers(request, response, events, sort, limit)
+    return events
+
 @d_router.get("/project/{project_id}", response_model=List[DefectGetting])
 async def get_defects_by_project(
     project_id: int,
+    request: Request,
+    response: Response,
+    limit: int = 100,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    projection: Projection = Depends(projection_params),
+    stream: bool = False,
     session: AsyncSession = Depends(get_session),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    _: None = Depends(defects_etag)
 ):
-    return await DefectService.get_defects_by_project(project_id, session)
+    if stream:
+        return stream_response(request, DefectService.stream_defects_by_project(project_id, session, sort=sort))
+    defects = await DefectService.get_defects_by_project(project_id, session, limit=limit, offset=offset, cursor=cursor, sort=sort, projection=projection)
+    set_pagination_headers(request, response, defects, sort, limit)
+    return list_response(request, defects, response)
 
 @d_router.get("/user/{user_id}", response_model=List[DefectGetting])
 async def get_defects_by_assignee(
     user_id: int,
+    request: Request,
+    response: Response,
+    limit: int = 100,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    projection: Projection = Depends(projection_params),
+    stream: bool = False,
     session: AsyncSession = Depends(get_session),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    _: None = Depends(defects_etag)
 ):
-    return await DefectService.get_defects_by_assignee(user_id, session)
+    if stream:
+        return stream_response(request, DefectService.stream_defects_by_assignee(user_id, session, sort=sort))
+    defects = await DefectService.get_defects_by_assignee(user_id, session, limit=limit, offset=offset, cursor=cursor, sort=sort, projection=projection)
+    set_pagination_headers(request, response, defects, sort, limit)
+    return list_response(request, defects, response)
 
 @d_router.post("/", response_model=DefectGetting, status_code=status.HTTP_201_CREATED)
 async def create_defect(
@@ -50,14 +153,34 @@ async def create_defect(
 ):
     return await DefectService.create_defect(defect_data, session)
 
+@d_router.post("/bulk", response_model=DefectImportResult)
+async def import_defects(
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    current_user: UserGetting = Depends(get_current_user)
+):
+    """JSON массив дефектов или файл CSV/XLSX в поле file (multipart/form-data)."""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        async with request.form() as form:
+            upload = form.get("file")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=400, detail="File field 'file' is required")
+            rows = DefectImportService.rows_from_upload(upload)
+            return await DefectImportService.import_defects(rows, current_user.id, session)
+    if content_type.startswith("application/json"):
+        rows = DefectImportService.rows_from_json(request.stream())
+        return await DefectImportService.import_defects(rows, current_user.id, session)
+    raise HTTPException(status_code=415, detail="Expected application/json or multipart/form-data")
+
 @d_router.put("/{defect_id}", response_model=DefectGetting)
 async def update_defect(
     defect_id: int,
     defect_data: DefectUpdate,
     session: AsyncSession = Depends(get_session),
-    current_user: dict = Depends(get_current_user)
+    current_user: UserGetting = Depends(get_current_user)
 ):
-    return await DefectService.update_defect(defect_id, defect_data, session)
+    return await DefectService.update_defect(defect_id, defect_data, session, changed_by_id=current_user.id)
 
 @d_router.delete("/{defect_id}", status_code=status.HTTP_200_OK)
 async def delete_defect(
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends
+
+from app.core.security import get_current_user, password_hasher, principal_cache
+from app.database.instrumentation import query_totals
+from app.core.entity_cache import ENTITY_CACHES
+
+metrics_router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+@metrics_router.get("/", response_model=dict)
+async def get_metrics(current_user: dict = Depends(get_current_user)):
+    return {
+        "password_hashing": password_hasher.metrics.snapshot(),
+        "principal_cache": principal_cache.stats(),
+        "entity_cache": {name: cache.stats() for name, cache in ENTITY_CACHES.items()},
+        "database": query_totals.snapshot(),
+    }
@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 
+from app.core.conditional import conditional_get
+from app.core.pagination import set_pagination_headers
+from app.core.projection import Projection, projection_params
+from app.core.serialization import list_response
 from app.database.settings import get_session
 from app.services.project_services import ProjectService
 from app.schemas.projects import ProjectCreate, ProjectUpdate, ProjectGetting
@@ -9,22 +13,34 @@ from app.core.security import get_current_user
 
 p_router = APIRouter(prefix="/projects", tags=["Projects"])
 
+projects_etag = conditional_get("projects", skip_params=("include",))
+
 @p_router.get("/", response_model=List[ProjectGetting])
 async def get_all_projects(
+    request: Request,
+    response: Response,
     limit: int = 100,
     offset: int = 0,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    projection: Projection = Depends(projection_params),
     session: AsyncSession = Depends(get_session),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    _: None = Depends(projects_etag)
 ):
-    return await ProjectService.get_all_projects(limit, offset, session)
+    projects = await ProjectService.get_all_projects(limit, offset, session, cursor=cursor, sort=sort, projection=projection)
+    set_pagination_headers(request, response, projects, sort, limit)
+    return list_response(request, projects, response)
 
 @p_router.get("/{project_id}", response_model=ProjectGetting)
 async def get_project_by_id(
     project_id: int,
     session: AsyncSession = Depends(get_session),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    version: Optional[int] = Depends(projects_etag)
 ):
-    return await ProjectService.get_project_by_id(project_id, session)
+    # Запись кеша, загруженная до изменения из ETag, перечитывается из БД
+    return await ProjectService.get_project_by_id(project_id, session, version)
 
 @p_router.post("/", response_model=ProjectGetting, status_code=status.HTTP_201_CREATED)
 async def create_project(
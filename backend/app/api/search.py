@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from app.core.pagination import set_next_cursor_headers
+from app.database.settings import get_session
+from app.services.search_services import SearchService
+from app.schemas.search import SearchHit
+from app.core.security import get_current_user
+
+s_router = APIRouter(prefix="/search", tags=["Search"])
+
+@s_router.get("/", response_model=List[SearchHit])
+async def search(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_session),
+    current_user: dict = Depends(get_current_user)
+):
+    """Полнотекстовый поиск по названию и описанию дефектов и тексту комментариев."""
+    hits = await SearchService.search(q, session, limit=limit, cursor=cursor)
+    set_next_cursor_headers(request, response, SearchService.next_cursor(hits, limit))
+    return hits
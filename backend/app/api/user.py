@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 
+from app.core.pagination import set_pagination_headers
+from app.core.serialization import list_response
 from app.database.settings import get_session
 from app.services.user_services import UserService
 from app.schemas.user import UserCreate, UserUpdate, UserGetting
@@ -11,12 +13,18 @@ user_router = APIRouter(prefix="/users", tags=["Users"])
 
 @user_router.get("/", response_model=List[UserGetting])
 async def get_all_users(
+    request: Request,
+    response: Response,
     limit: int = 100,
     offset: int = 0,
+    cursor: Optional[str] = None,
+    sort: str = "id",
     session: AsyncSession = Depends(get_session),
     current_user: UserGetting = Depends(get_current_user)
 ):
-    return await UserService.get_all_users(limit, offset, session)
+    users = await UserService.get_all_users(limit, offset, session, cursor=cursor, sort=sort)
+    set_pagination_headers(request, response, users, sort, limit)
+    return list_response(request, users, response)
 
 @user_router.get("/{user_id}", response_model=UserGetting)
 async def get_user_by_id(
@@ -0,0 +1,48 @@
+from typing import Callable, Optional, Sequence
+
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.serialization import negotiate
+from app.database.settings import get_session
+from app.repository.version_repos import VersionRepos
+
+
+def make_etag(name: str, version: int, suffix: str = "") -> str:
+    return f'"{name}.{version}{suffix}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Сравнение для If-None-Match: слабое (W/ не учитывается), "*" совпадает с любым."""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def conditional_get(name: str, skip_params: Sequence[str] = ()) -> Callable:
+    """Зависимость для GET: ETag по счётчику изменений таблицы name, возвращает прочитанный счётчик.
+
+    Если If-None-Match совпал, отвечаем 304 до запроса строк и сериализации:
+    из БД читается только счётчик. Счётчик читается раньше данных, поэтому ETag
+    не может оказаться новее ответа - в худшем случае клиент лишний раз получит 200.
+    Запросы с параметрами из skip_params отдаются без ETag: они читают другие таблицы,
+    изменения которых счётчик name не видит, и зависимость возвращает None.
+    Счётчик передают в EntityCache.get(version=...), чтобы тело из кеша не оказалось старше ETag.
+    """
+    async def dependency(request: Request, response: Response, session: AsyncSession = Depends(get_session)) -> Optional[int]:
+        if any(request.query_params.get(param) for param in skip_params):
+            return None
+        # Представление зависит от Accept (JSON, колонки, MessagePack), поэтому и ETag
+        list_format = negotiate(request.headers.get("accept"))
+        version = await VersionRepos.get(name, session)
+        etag = make_etag(name, version, list_format.etag_suffix)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return version
+
+    return dependency
@@ -5,4 +5,63 @@ load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60  # Время жизни токена (в минутах)
\ No newline at end of file
+ACCESS_TOKEN_EXPIRE_MINUTES = 60  # Время жизни токена (в минутах)
+# Хеширование паролей выполняется в пуле: thread или process
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_CONCURRENCY = int(os.getenv("PASSWORD_HASH_MAX_CONCURRENCY", "8"))  # Сколько хешей может выполняться одновременно
+
+# Кеш пользователей для get_current_user
+PRINCIPAL_CACHE_ENABLED = os.getenv("PRINCIPAL_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_SIZE = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", "10000"))
+
+# Кеш проектов и пользователей по id
+ENTITY_CACHE_ENABLED = os.getenv("ENTITY_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ENTITY_CACHE_BACKEND = os.getenv("ENTITY_CACHE_BACKEND", "memory")  # memory или redis
+ENTITY_CACHE_REDIS_URL = os.getenv("ENTITY_CACHE_REDIS_URL", "redis://localhost:6379/0")
+ENTITY_CACHE_TTL_SECONDS = float(os.getenv("ENTITY_CACHE_TTL_SECONDS", "60"))  # Верхняя граница устаревания, если уведомление потерялось
+ENTITY_CACHE_MAX_SIZE = int(os.getenv("ENTITY_CACHE_MAX_SIZE", "10000"))
+ENTITY_CACHE_CHANNEL = os.getenv("ENTITY_CACHE_CHANNEL", "entity_cache")  # Канал LISTEN/NOTIFY для сброса кеша в других воркерах
+ENTITY_CACHE_LISTEN_CHECK_SECONDS = float(os.getenv("ENTITY_CACHE_LISTEN_CHECK_SECONDS", "30"))  # Как часто проверять соединение слушателя
+
+# Инструментация SQL запросов
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_PARAMS_SAMPLE = int(os.getenv("SLOW_QUERY_PARAMS_SAMPLE", "10"))  # Сколько параметров писать в лог
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))  # Сколько одинаковых запросов за HTTP запрос считать N+1
+
+# Массовый импорт дефектов
+BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "1000"))
+BULK_IMPORT_MAX_ERRORS = int(os.getenv("BULK_IMPORT_MAX_ERRORS", "1000"))  # Сколько ошибок по строкам возвращать в ответе
+BULK_IMPORT_USE_COPY = os.getenv("BULK_IMPORT_USE_COPY", "true").lower() in ("1", "true", "yes")
+
+# Потоковая выдача больших списков
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))  # Строк за одно чтение из серверного курсора
+STREAM_CHUNK_BYTES = int(os.getenv("STREAM_CHUNK_BYTES", "65536"))  # Размер блока ответа
+
+# Полнотекстовый поиск
+FULLTEXT_CONFIG = os.getenv("FULLTEXT_CONFIG", "russian")  # Конфигурация текстового поиска PostgreSQL (стемминг)
+SEARCH_SNIPPET_WORDS = int(os.getenv("SEARCH_SNIPPET_WORDS", "16"))  # Длина фрагмента с подсветкой в словах
+
+# Аналитика
+ANALYTICS_RECONCILE_INTERVAL_SECONDS = float(os.getenv("ANALYTICS_RECONCILE_INTERVAL_SECONDS", "3600"))  # 0 - не запускать сверку в приложении
+BURNDOWN_MAX_DAYS = int(os.getenv("BURNDOWN_MAX_DAYS", "3660"))  # Самый длинный период графика burndown
+RESOLUTION_SKETCH_COMPRESSION = float(os.getenv("RESOLUTION_SKETCH_COMPRESSION", "100"))  # Точность t-digest, около стольких центроидов в скетче
+RESOLUTION_DEFAULT_DAYS = int(os.getenv("RESOLUTION_DEFAULT_DAYS", "90"))  # Период перцентилей времени закрытия по умолчанию
+
+# Вложения
+ATTACHMENT_STORAGE_BACKEND = os.getenv("ATTACHMENT_STORAGE_BACKEND", "local")
+ATTACHMENT_STORAGE_DIR = os.getenv("ATTACHMENT_STORAGE_DIR", "media/attachments")  # Корень локального хранилища содержимого
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(2 * 1024 ** 3)))  # Самый большой принимаемый файл
+ATTACHMENT_FIELD_MAX_BYTES = int(os.getenv("ATTACHMENT_FIELD_MAX_BYTES", "1024"))  # Обычные поля формы загрузки
+ATTACHMENT_CACHE_MAX_AGE = int(os.getenv("ATTACHMENT_CACHE_MAX_AGE", str(365 * 24 * 3600)))  # Для ссылок вида /content?v=<sha256>
+ATTACHMENT_UPLOAD_DIR = os.getenv("ATTACHMENT_UPLOAD_DIR", os.path.join(ATTACHMENT_STORAGE_DIR, "uploads"))  # Возобновляемые загрузки; та же ФС, что и хранилище
+ATTACHMENT_UPLOAD_TTL_SECONDS = float(os.getenv("ATTACHMENT_UPLOAD_TTL_SECONDS", str(24 * 3600)))  # Загрузка без активности дольше - брошена
+ATTACHMENT_UPLOAD_CLEANUP_INTERVAL_SECONDS = float(os.getenv("ATTACHMENT_UPLOAD_CLEANUP_INTERVAL_SECONDS", "3600"))  # 0 - не чистить в приложении
+ATTACHMENT_ORPHAN_GRACE_SECONDS = float(os.getenv("ATTACHMENT_ORPHAN_GRACE_SECONDS", str(24 * 3600)))  # Содержимое без вложения моложе этого не удаляется
+ATTACHMENT_DERIVATIVE_WORKERS = int(os.getenv("ATTACHMENT_DERIVATIVE_WORKERS", str(os.cpu_count() or 1)))  # 0 - не строить миниатюры, отдавать оригинал
+ATTACHMENT_DERIVATIVE_FORMAT = os.getenv("ATTACHMENT_DERIVATIVE_FORMAT", "webp")  # webp или jpeg
+ATTACHMENT_DERIVATIVE_QUALITY = int(os.getenv("ATTACHMENT_DERIVATIVE_QUALITY", "80"))
+ATTACHMENT_PREVIEW_SIZE = int(os.getenv("ATTACHMENT_PREVIEW_SIZE", "1600"))  # Длинная сторона превью в пикселях
+ATTACHMENT_MAX_IMAGE_PIXELS = int(os.getenv("ATTACHMENT_MAX_IMAGE_PIXELS", str(120_000_000)))  # Больше - миниатюры не строятся (защита от "бомб")
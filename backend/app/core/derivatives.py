@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import math
+import os
+import tempfile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+
+from app.core.config import (
+    ATTACHMENT_DERIVATIVE_FORMAT, ATTACHMENT_DERIVATIVE_QUALITY, ATTACHMENT_DERIVATIVE_WORKERS,
+    ATTACHMENT_MAX_IMAGE_PIXELS, ATTACHMENT_PREVIEW_SIZE,
+)
+from app.core.storage import LocalStorage, attachment_storage
+
+logger = logging.getLogger("app.derivatives")
+
+# Форматы, которые Pillow читает без дополнительных плагинов
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif", "image/bmp", "image/tiff"}
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+
+
+@dataclass(frozen=True)
+class DerivativeSpec:
+    width: int
+    height: int
+    crop: bool  # True - ровно width x height с обрезкой по центру, False - вписать в рамку без увеличения
+
+
+DERIVATIVES = {
+    "preview": DerivativeSpec(ATTACHMENT_PREVIEW_SIZE, ATTACHMENT_PREVIEW_SIZE, False),
+    "thumb-256": DerivativeSpec(256, 256, True),
+    "thumb-128": DerivativeSpec(128, 128, True),
+}
+
+
+class UndecodableImage(Exception):
+    """Содержимое не читается как изображение или в нём больше пикселей, чем разрешено (max_pixels)."""
+
+
+def _scale(spec: DerivativeSpec, width: int, height: int) -> float:
+    ratios = (spec.width / width, spec.height / height)
+    return max(ratios) if spec.crop else min(ratios)
+
+
+def _save(image, target: str, image_format: str, quality: int):
+    # Запись во временный файл и replace: читатель не увидит недописанную миниатюру
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".derivative-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            image.save(file, image_format, quality=quality)
+        os.replace(temporary, target)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _init_worker():
+    # Процесс пула только строит производные: глобальную проверку Pillow заменяет max_pixels render_derivatives
+    from PIL import Image
+    Image.MAX_IMAGE_PIXELS = None
+
+
+def render_derivatives(source: str, targets: Dict[str, str], image_format: str, quality: int,
+                       max_pixels: int = ATTACHMENT_MAX_IMAGE_PIXELS) -> int:
+    """Строит производные одного изображения; выполняется в процессе пула.
+
+    Оригинал декодируется один раз. JPEG сразу читается в уменьшенном масштабе (draft),
+    а миниатюры режутся из уже уменьшенного превью, если его хватает по размеру.
+    Размер сверяется с max_pixels по заголовку, до декодирования; глобальные настройки Pillow не меняются.
+    Ошибки разбора содержимого - UndecodableImage, остальные (диск, память) - как есть.
+    """
+    from PIL import Image, ImageOps
+
+    specs = sorted(((name, DERIVATIVES[name]) for name in targets), key=lambda item: -item[1].width * item[1].height)
+    try:
+        with Image.open(source) as original:
+            width, height = original.size
+            if width * height > max_pixels:
+                raise UndecodableImage(f"{width}x{height} exceeds {max_pixels} pixels")
+            needed = min(1.0, max(_scale(spec, width, height) for _, spec in specs))
+            original.draft("RGB", (math.ceil(width * needed), math.ceil(height * needed)))
+            image = ImageOps.exif_transpose(original)
+            has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+            image = image.convert("RGBA" if has_alpha and image_format == "WEBP" else "RGB")
+    except FileNotFoundError:
+        raise
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        # UnidentifiedImageError и битые данные - OSError; повтор с тем же содержимым не поможет
+        raise UndecodableImage(f"{type(e).__name__}: {e}") from None
+
+    sources = [image]
+    for name, spec in specs:
+        # Самый маленький из уже готовых кадров, который ещё покрывает нужный размер
+        source = min((item for item in sources if _scale(spec, *item.size) <= 1.0), key=lambda item: item.width * item.height, default=image)
+        if spec.crop:
+            result = ImageOps.fit(source, (spec.width, spec.height), Image.LANCZOS)
+        else:
+            result = source.copy()
+            result.thumbnail((spec.width, spec.height), Image.LANCZOS)
+        _save(result, targets[name], image_format, quality)
+        sources.append(result)
+    return len(specs)
+
+
+class DerivativePipeline:
+    """Фоновая генерация миниатюр и превью для вложений-изображений.
+
+    Работа идёт в пуле процессов: ресайз и кодирование держат GIL. Готовые файлы лежат
+    рядом с оригиналом в хранилище, поэтому состояние переживает перезапуск; в памяти -
+    только задачи в работе и содержимое, которое не удалось разобрать.
+    kind="thread" - только для тестов: в потоках Pillow остаётся с настройками процесса приложения.
+    """
+
+    def __init__(self, storage: LocalStorage = attachment_storage, kind: str = "process", workers: int = 1,
+                 image_format: str = "webp", quality: int = 80, max_pixels: int = ATTACHMENT_MAX_IMAGE_PIXELS):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown derivative executor: {kind}")
+        if image_format not in FORMATS:
+            raise ValueError(f"Unknown derivative format: {image_format}")
+        self.storage = storage
+        self.kind = kind
+        self.workers = workers
+        self.extension = image_format
+        self.pil_format, self.media_type = FORMATS[image_format]
+        self.quality = quality
+        self.max_pixels = max_pixels
+        self._executor: Optional[Executor] = None
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._failed: Set[str] = set()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="derivatives")
+        return self._executor
+
+    def supports(self, content_type: Optional[str]) -> bool:
+        return content_type in IMAGE_TYPES
+
+    def variant(self, name: str) -> str:
+        """Производная с размером, качеством и форматом, например preview.1600x1600.q80.webp.
+
+        Входит в имя файла, ETag и ?v=: после смены настроек старые копии не отдаются и не кешируются.
+        """
+        spec = DERIVATIVES[name]
+        return f"{name}.{spec.width}x{spec.height}.q{self.quality}.{self.extension}"
+
+    def tag(self, digest: str, name: str) -> str:
+        return f"{digest}.{self.variant(name)}"
+
+    def path(self, digest: str, name: str) -> str:
+        return str(self.storage.derivative_path(digest, self.variant(name)))
+
+    def schedule(self, digest: str, content_type: Optional[str]):
+        """Ставит построение производных в очередь; повторный вызов для того же содержимого ничего не делает."""
+        if not self.workers or not self.supports(content_type) or digest in self._pending or digest in self._failed:
+            return
+        task = asyncio.get_running_loop().create_task(self._generate(digest))
+        self._pending[digest] = task
+        task.add_done_callback(lambda _: self._pending.pop(digest, None))
+
+    async def _generate(self, digest: str):
+        paths = {name: self.path(digest, name) for name in DERIVATIVES}
+        missing = await asyncio.to_thread(lambda: {name: path for name, path in paths.items() if not os.path.exists(path)})
+        if not missing:
+            return
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            await loop.run_in_executor(
+                executor, render_derivatives, self.storage.local_path(digest), missing, self.pil_format, self.quality, self.max_pixels
+            )
+        except UndecodableImage as e:
+            # Битый или неподдерживаемый файл: дальше отдаём оригинал и не пытаемся снова до перезапуска
+            logger.warning("Cannot build derivatives for %s: %s", digest, e)
+            self._failed.add(digest)
+        except BrokenProcessPool:
+            # Процесс пула умер (память, сигнал), а с ним и все задачи пула. Пул создаётся заново,
+            # содержимое не виновато: следующий запрос производной поставит генерацию снова
+            logger.exception("Derivative worker pool broke while processing %s", digest)
+            if self._executor is executor:
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+        except Exception:
+            # Временная ошибка (диск, память): повтор при следующем запросе
+            logger.exception("Failed to build derivatives for %s", digest)
+
+    async def get(self, digest: str, content_type: Optional[str], name: str) -> Optional[Tuple[str, int]]:
+        """(путь, размер) готовой производной; если её ещё нет - ставит генерацию в очередь и возвращает None."""
+        path = self.path(digest, name)
+        try:
+            return path, (await asyncio.to_thread(os.stat, path)).st_size
+        except FileNotFoundError:
+            self.schedule(digest, content_type)
+            return None
+
+    async def wait(self, digest: str):
+        task = self._pending.get(digest)
+        if task is not None:
+            await task
+
+    def shutdown(self):
+        for task in self._pending.values():
+            task.cancel()
+        self._pending.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+derivative_pipeline = DerivativePipeline(
+    workers=ATTACHMENT_DERIVATIVE_WORKERS,
+    image_format=ATTACHMENT_DERIVATIVE_FORMAT,
+    quality=ATTACHMENT_DERIVATIVE_QUALITY,
+)
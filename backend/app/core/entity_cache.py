@@ -0,0 +1,171 @@
+from typing import Awaitable, Callable, Dict, Generic, Iterable, List, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+
+from app.core.cache import TTLCache
+from app.core.principal_cache import principal_cache
+from app.core.config import (
+    ENTITY_CACHE_ENABLED, ENTITY_CACHE_BACKEND, ENTITY_CACHE_REDIS_URL, ENTITY_CACHE_TTL_SECONDS, ENTITY_CACHE_MAX_SIZE,
+)
+from app.schemas.projects import ProjectGetting
+from app.schemas.user import UserGetting
+
+SchemaT = TypeVar("SchemaT", bound=BaseModel)
+
+
+class Versioned(BaseModel, Generic[SchemaT]):
+    """Запись кеша: объект и счётчик таблицы (table_versions), прочитанный до его загрузки; 0 - неизвестен."""
+    version: int
+    value: SchemaT
+
+
+class MemoryBackend:
+    """LRU в памяти процесса; у каждого воркера своя копия."""
+
+    def __init__(self, name: str, schema: Type[BaseModel], max_size: int, ttl: float):
+        self.entries = TTLCache(max_size=max_size, ttl=ttl)
+
+    async def get_many(self, ids: List[int]) -> dict:
+        found = {}
+        for object_id in ids:
+            value = self.entries.get(object_id)
+            if value is not None:
+                found[object_id] = value
+        return found
+
+    async def set_many(self, values: dict):
+        for object_id, value in values.items():
+            self.entries.set(object_id, value)
+
+    async def delete_many(self, ids: Iterable[int]):
+        for object_id in ids:
+            self.entries.delete(object_id)
+
+    async def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return self.entries.stats()
+
+
+class RedisBackend:
+    """Общий для воркеров кеш в Redis (или совместимом сервере), значения - JSON записей Versioned."""
+
+    def __init__(self, name: str, schema: Type[BaseModel], max_size: int, ttl: float, url: str = ENTITY_CACHE_REDIS_URL):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError("ENTITY_CACHE_BACKEND=redis requires the redis package")
+        self.client = redis.from_url(url)
+        self.prefix = f"entity:{name}:"
+        self.schema = schema
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    async def get_many(self, ids: List[int]) -> dict:
+        if not ids:
+            return {}
+        values = await self.client.mget([self.prefix + str(object_id) for object_id in ids])
+        found = {
+            object_id: self.schema.model_validate_json(value)
+            for object_id, value in zip(ids, values) if value is not None
+        }
+        self.hits += len(found)
+        self.misses += len(ids) - len(found)
+        return found
+
+    async def set_many(self, values: dict):
+        if not values:
+            return
+        async with self.client.pipeline(transaction=False) as pipeline:
+            for object_id, value in values.items():
+                pipeline.set(self.prefix + str(object_id), value.model_dump_json(), px=int(self.ttl * 1000))
+            await pipeline.execute()
+
+    async def delete_many(self, ids: Iterable[int]):
+        keys = [self.prefix + str(object_id) for object_id in ids]
+        if keys:
+            await self.client.delete(*keys)
+
+    async def clear(self):
+        keys = [key async for key in self.client.scan_iter(match=self.prefix + "*")]
+        if keys:
+            await self.client.delete(*keys)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+BACKENDS = {"memory": MemoryBackend, "redis": RedisBackend}
+
+
+class EntityCache(Generic[SchemaT]):
+    """Read-through кеш объектов по id: промахи догружаются loader'ом и кладутся в backend.
+
+    None не кешируется. Запись в БД сбрасывает кеш через invalidate (см. app.database.cache_notify).
+    Сброс доходит до других воркеров с задержкой, поэтому ответы с ETag по счётчику таблицы
+    передают его в get(version=...): запись, загруженная при более старом счётчике, - промах.
+    """
+
+    def __init__(self, name: str, schema: Type[SchemaT], backend, enabled: bool = True):
+        self.name = name
+        self.schema = schema
+        self.backend = backend
+        self.enabled = enabled
+        self._on_invalidate: List[Callable[[int], None]] = []
+
+    async def get(self, object_id: int, load: Callable[[int], Awaitable[Optional[SchemaT]]], version: Optional[int] = None) -> Optional[SchemaT]:
+        if not self.enabled:
+            return await load(object_id)
+        entry = (await self.backend.get_many([object_id])).get(object_id)
+        if entry is not None and (version is None or entry.version >= version):
+            return entry.value
+        value = await load(object_id)
+        if value is not None:
+            await self.backend.set_many({object_id: Versioned(version=version or 0, value=value)})
+        return value
+
+    async def get_many(self, ids: Iterable[int], load_many: Callable[[List[int]], Awaitable[List[SchemaT]]]) -> Dict[int, SchemaT]:
+        """{id: объект} для найденных id; отсутствующие догружаются одним запросом."""
+        ids = list(dict.fromkeys(ids))
+        found = {object_id: entry.value for object_id, entry in (await self.backend.get_many(ids)).items()} if self.enabled else {}
+        missing = [object_id for object_id in ids if object_id not in found]
+        if missing:
+            loaded = {value.id: value for value in await load_many(missing)}
+            if self.enabled:
+                await self.backend.set_many({object_id: Versioned(version=0, value=value) for object_id, value in loaded.items()})
+            found.update(loaded)
+        return found
+
+    def on_invalidate(self, callback: Callable[[int], None]):
+        """Дополнительный сброс при инвалидации, например связанного кеша."""
+        self._on_invalidate.append(callback)
+
+    async def invalidate(self, ids: Iterable[int]):
+        ids = list(ids)
+        for object_id in ids:
+            for callback in self._on_invalidate:
+                callback(object_id)
+        if self.enabled:
+            await self.backend.delete_many(ids)
+
+    async def clear(self):
+        if self.enabled:
+            await self.backend.clear()
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, **self.backend.stats()}
+
+
+def make_cache(name: str, schema: Type[SchemaT]) -> EntityCache[SchemaT]:
+    backend = BACKENDS[ENTITY_CACHE_BACKEND](name, Versioned[schema], max_size=ENTITY_CACHE_MAX_SIZE, ttl=ENTITY_CACHE_TTL_SECONDS)
+    return EntityCache(name, schema, backend, enabled=ENTITY_CACHE_ENABLED)
+
+
+project_cache = make_cache("projects", ProjectGetting)
+user_cache = make_cache("users", UserGetting)
+# Пользователь из get_current_user тоже должен обновиться во всех воркерах
+user_cache.on_invalidate(principal_cache.invalidate_user)
+
+ENTITY_CACHES = {cache.name: cache for cache in (project_cache, user_cache)}
@@ -0,0 +1,145 @@
+import csv
+import io
+import re
+import zipfile
+from typing import AsyncIterator, Sequence
+from xml.sax.saxutils import escape
+
+from app.core.config import STREAM_CHUNK_BYTES
+
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Ячейка, начинающаяся с этих символов, в Excel выполняется как формула (CSV injection)
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+# Управляющие символы, которые нельзя записать в XML
+_illegal_xml = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _needs_guard(value: str) -> bool:
+    # Апострофы перед формулой тоже экранируем: иначе импорт не отличит их от нашего
+    return value.lstrip("'").startswith(_FORMULA_PREFIXES)
+
+
+def _csv_value(value):
+    if isinstance(value, str) and _needs_guard(value):
+        return "'" + value
+    return value
+
+
+def unguard_csv_value(value):
+    """Обратное к экспорту: снимает апостроф, добавленный перед формулой, чтобы выгрузка импортировалась как была."""
+    if isinstance(value, str) and value.startswith("'") and _needs_guard(value[1:]):
+        return value[1:]
+    return value
+
+
+async def csv_parts(header: Sequence[str], batches: AsyncIterator[Sequence[Sequence]]) -> AsyncIterator[bytes]:
+    """CSV в UTF-8 с BOM (иначе Excel открывает кириллицу в cp1251), по блоку на пачку строк."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    yield ("\ufeff" + buffer.getvalue()).encode()
+
+    async for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode()
+
+
+class _ZipSink:
+    """Поток без seek: zipfile пишет записи с data descriptor, архив можно отдавать по частям."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def write(self, data) -> int:
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+_XLSX_STATIC = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+
+
+def _xlsx_cell(value) -> str:
+    if value is None:
+        return "<c/>"
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f"<c><v>{value}</v></c>"
+    text = escape(_illegal_xml.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(row: Sequence) -> str:
+    return "<row>" + "".join(_xlsx_cell(value) for value in row) + "</row>"
+
+
+async def xlsx_parts(header: Sequence[str], batches: AsyncIterator[Sequence[Sequence]], sheet_name: str = "Sheet1") -> AsyncIterator[bytes]:
+    """Потоковый XLSX: лист пишется сразу в zip, строки inline, без общей таблицы строк.
+
+    Память ограничена одной пачкой строк и буфером сжатия, а не размером файла.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC.items():
+            archive.writestr(name, content)
+        archive.writestr("xl/workbook.xml", _WORKBOOK.format(name=escape(sheet_name, {'"': "&quot;"})))
+
+        # Размер листа заранее неизвестен, поэтому сразу ZIP64
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(header).encode())
+            async for rows in batches:
+                sheet.write("".join(_xlsx_row(row) for row in rows).encode())
+                if len(sink.buffer) >= STREAM_CHUNK_BYTES:
+                    yield sink.drain()
+            sheet.write(b"</sheetData></worksheet>")
+    yield sink.drain()
@@ -0,0 +1,168 @@
+import os
+import re
+import secrets
+from typing import List, Optional, Sequence, Tuple, Union
+from urllib.parse import quote
+
+import anyio
+from fastapi import Request, Response
+from starlette.types import Receive, Scope, Send
+
+from app.core.conditional import etag_matches
+
+CHUNK_SIZE = 256 * 1024
+MAX_RANGES = 16  # Больше диапазонов - отдаём файл целиком, чтобы мелкие куски не нагружали сервер
+INLINE_TYPES = ("image/", "video/", "audio/", "application/pdf")
+# SVG - документ со скриптами: открытый в браузере, он выполнится в origin API
+ATTACHMENT_ONLY_TYPES = {"image/svg+xml"}
+
+_range_spec = re.compile(r"^(\d*)-(\d*)$")
+
+# Кусок тела: готовые байты (заголовки частей multipart) или (смещение, длина) в файле
+BodyPart = Union[bytes, Tuple[int, int]]
+
+
+def parse_ranges(header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """Range: bytes=... -> отсортированные диапазоны (start, end) включительно, пересечения слиты.
+
+    None - заголовка нет, он не разбирается или диапазонов слишком много: RFC 9110 разрешает
+    такой Range игнорировать и отдать файл целиком. [] - ни один диапазон не попал в файл (416).
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    specs = [item.strip() for item in spec.split(",") if item.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for item in specs:
+        match = _range_spec.match(item)
+        if not match or match.group(0) == "-":
+            return None
+        first, last = match.groups()
+        if not first:
+            # Суффикс: последние N байт
+            length = int(last)
+            if length and size:
+                ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < size:
+            ranges.append((start, min(int(last), size - 1) if last else size - 1))
+
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def content_disposition(file_name: Optional[str], media_type: str) -> str:
+    """Картинки (кроме SVG), видео и PDF открываются в браузере, остальное - скачивается."""
+    media_type = media_type.split(";", 1)[0].strip().lower()
+    inline = media_type.startswith(INLINE_TYPES) and media_type not in ATTACHMENT_ONLY_TYPES
+    kind = "inline" if inline else "attachment"
+    if not file_name:
+        return kind
+    fallback = file_name.encode("ascii", "replace").decode("ascii").replace("?", "_")
+    return f"{kind}; filename=\"{fallback}\"; filename*=UTF-8''{quote(file_name)}"
+
+
+def _read_at(fd: int, count: int, offset: int) -> bytes:
+    if hasattr(os, "pread"):
+        return os.pread(fd, count, offset)
+    # Windows: без pread; файл открыт только этим ответом, куски читаются по очереди
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, count)
+
+
+class FilePartsResponse(Response):
+    """Тело из кусков файла на диске; файл не читается в память целиком.
+
+    Если сервер поддерживает ASGI-расширение http.response.zerocopy, куски уходят через
+    sendfile. Иначе (uvicorn) файл читается блоками CHUNK_SIZE в потоке.
+    """
+
+    def __init__(self, path: str, parts: Sequence[BodyPart], status_code: int, headers: dict, media_type: str):
+        length = sum(len(part) if isinstance(part, bytes) else part[1] for part in parts)
+        # Тип как есть: Response дописал бы charset=utf-8 к text/*, а кодировка файла неизвестна
+        super().__init__(status_code=status_code, headers={**headers, "content-length": str(length), "content-type": media_type})
+        self.path = path
+        self.parts = parts
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        file = await anyio.to_thread.run_sync(open, self.path, "rb")
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope["method"] == "HEAD":
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+                return
+            zerocopy = "http.response.zerocopy" in scope.get("extensions", {})
+            for index, part in enumerate(self.parts):
+                more_body = index < len(self.parts) - 1
+                if isinstance(part, bytes):
+                    await send({"type": "http.response.body", "body": part, "more_body": more_body})
+                elif zerocopy:
+                    offset, count = part
+                    await send({"type": "http.response.zerocopy", "file": file, "offset": offset, "count": count, "more_body": more_body})
+                else:
+                    await self._send_range(file.fileno(), *part, more_body, send)
+            if not self.parts:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            await anyio.to_thread.run_sync(file.close)
+
+    @staticmethod
+    async def _send_range(fd: int, offset: int, count: int, more_body: bool, send: Send):
+        end = offset + count
+        while offset < end:
+            chunk = await anyio.to_thread.run_sync(_read_at, fd, min(CHUNK_SIZE, end - offset), offset)
+            if not chunk:
+                raise RuntimeError("File is shorter than expected")
+            offset += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body or offset < end})
+
+
+def file_response(request: Request, path: str, size: int, etag: str, media_type: str, headers: dict) -> Response:
+    """GET/HEAD файла с сильным ETag: 304 по If-None-Match, 206 по Range (одному или нескольким), 416.
+
+    If-Range с другим ETag (или датой - Last-Modified не отдаём) отключает Range: у клиента
+    устаревшая копия, ему нужен файл целиком.
+    """
+    headers = {**headers, "etag": etag, "accept-ranges": "bytes"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    ranges = parse_ranges(request.headers.get("range"), size)
+    if_range = request.headers.get("if-range")
+    if ranges is not None and if_range is not None and if_range.strip() != etag:
+        ranges = None
+
+    if ranges is None:
+        return FilePartsResponse(path, [(0, size)] if size else [], 200, headers, media_type)
+    if not ranges:
+        return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["content-range"] = f"bytes {start}-{end}/{size}"
+        return FilePartsResponse(path, [(start, end - start + 1)], 206, headers, media_type)
+
+    boundary = secrets.token_hex(16)
+    parts: List[BodyPart] = []
+    for start, end in ranges:
+        parts.append((
+            f"--{boundary}\r\nContent-Type: {media_type}\r\nContent-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("latin-1"))
+        parts.append((start, end - start + 1))
+        parts.append(b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    # Первая часть без ведущего CRLF: граница с начала тела допустима по RFC 2046
+    return FilePartsResponse(path, parts, 206, headers, f"multipart/byteranges; boundary={boundary}")
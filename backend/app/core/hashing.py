@@ -0,0 +1,106 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Callable, Optional
+
+from passlib.context import CryptContext
+
+from app.core.config import PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_CONCURRENCY
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def _timed_call(func: Callable, *args):
+    # time.monotonic общий для всех процессов, поэтому время старта можно сравнивать с основным процессом
+    started = time.monotonic()
+    result = func(*args)
+    return result, started, time.monotonic()
+
+
+@dataclass
+class HashMetrics:
+    calls: int = 0
+    in_flight: int = 0
+    queue_wait_total: float = 0.0
+    queue_wait_max: float = 0.0
+    hash_time_total: float = 0.0
+    hash_time_max: float = 0.0
+
+    def observe(self, queue_wait: float, hash_time: float):
+        self.calls += 1
+        self.queue_wait_total += queue_wait
+        self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+        self.hash_time_total += hash_time
+        self.hash_time_max = max(self.hash_time_max, hash_time)
+
+    def snapshot(self) -> dict:
+        data = asdict(self)
+        data["queue_wait_avg"] = self.queue_wait_total / self.calls if self.calls else 0.0
+        data["hash_time_avg"] = self.hash_time_total / self.calls if self.calls else 0.0
+        return data
+
+
+class PasswordHasher:
+    """Выполняет bcrypt в отдельном пуле, чтобы не блокировать event loop."""
+
+    def __init__(self, kind: str = "thread", workers: int = 4, max_concurrency: int = 8):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown password hash executor: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.metrics = HashMetrics()
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _run(self, func: Callable, *args):
+        loop = asyncio.get_running_loop()
+        submitted = time.monotonic()
+        self.metrics.in_flight += 1
+        try:
+            async with self._get_semaphore():
+                result, started, finished = await loop.run_in_executor(
+                    self._get_executor(), _timed_call, func, *args
+                )
+        finally:
+            self.metrics.in_flight -= 1
+        self.metrics.observe(started - submitted, finished - started)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._semaphore = None
+
+
+password_hasher = PasswordHasher(
+    kind=PASSWORD_HASH_EXECUTOR,
+    workers=PASSWORD_HASH_WORKERS,
+    max_concurrency=PASSWORD_HASH_MAX_CONCURRENCY,
+)
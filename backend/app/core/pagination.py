@@ -0,0 +1,110 @@
+import base64
+import binascii
+import enum
+import json
+from datetime import date, datetime
+from typing import Any, Optional, Sequence
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import func, literal, tuple_
+
+
+class NullsAs:
+    """Ключ сортировки по nullable колонке: NULL считается равным value и в ORDER BY, и в условии курсора.
+
+    Иначе строки с NULL выпадают из keyset-выборки: сравнение с NULL не бывает истинным.
+    """
+
+    def __init__(self, column, value: Any):
+        self.column = column
+        self.value = value
+        self.key = func.coalesce(column, literal(value, column.type))
+
+
+def parse_sort(sort: str, sorts: dict):
+    """"title" - по возрастанию, "-title" - по убыванию. Возвращает (имя, колонка, desc)."""
+    descending = sort.startswith("-")
+    name = sort.lstrip("-")
+    if name not in sorts:
+        raise HTTPException(status_code=400, detail=f"Unsupported sort '{name}', expected one of: {', '.join(sorts)}")
+    return name, sorts[name], descending
+
+
+def _dump_value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _load_value(column, value):
+    python_type = column.type.python_type
+    if value is None:
+        return None
+    if issubclass(python_type, datetime):
+        return datetime.fromisoformat(value)
+    if issubclass(python_type, enum.Enum):
+        return python_type(value)
+    return value
+
+
+def encode_cursor(sort: str, value, object_id: int) -> str:
+    data = json.dumps({"s": sort, "v": _dump_value(value), "id": object_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> dict:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if data["s"] != sort or not isinstance(data["id"], int):
+            raise ValueError
+        return data
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(query, model, sorts: dict, sort: str = "id", cursor: Optional[str] = None, limit: int = 100, offset: int = 0):
+    """ORDER BY (ключ сортировки, id) и keyset условие по курсору; offset оставлен для совместимости."""
+    name, column, descending = parse_sort(sort, sorts)
+    single_key = column is model.id
+    key, null_value = column, None
+    if isinstance(column, NullsAs):
+        key, column, null_value = column.key, column.column, column.value
+    if cursor:
+        position = decode_cursor(cursor, sort)
+        if single_key:
+            keys, values = model.id, position["id"]
+        else:
+            keys = tuple_(key, model.id)
+            value = _load_value(column, position["v"])
+            # literal с типом колонки, иначе Enum внутри tuple_ не преобразуется в значение из БД
+            values = tuple_(literal(null_value if value is None else value, column.type), position["id"])
+        query = query.where(keys < values if descending else keys > values)
+    elif offset:
+        query = query.offset(offset)
+
+    order = [model.id] if single_key else [key, model.id]
+    if descending:
+        order = [item.desc() for item in order]
+    return query.order_by(*order).limit(limit)
+
+
+def next_cursor(items: Sequence, sort: str, limit: int) -> Optional[str]:
+    if not items or len(items) < limit:
+        return None
+    last = items[-1]
+    name = sort.lstrip("-")
+    return encode_cursor(sort, getattr(last, name), last.id)
+
+
+def set_pagination_headers(request: Request, response: Response, items: Sequence, sort: str, limit: int):
+    set_next_cursor_headers(request, response, next_cursor(items, sort, limit))
+
+
+def set_next_cursor_headers(request: Request, response: Response, cursor: Optional[str]):
+    if cursor is None:
+        return
+    url = request.url.remove_query_params("offset").include_query_params(cursor=cursor)
+    response.headers["Link"] = f'<{url}>; rel="next"'
+    response.headers["X-Next-Cursor"] = cursor
@@ -0,0 +1,58 @@
+import hashlib
+import time
+from typing import Optional
+
+from app.core.cache import TTLCache
+from app.core.config import PRINCIPAL_CACHE_ENABLED, PRINCIPAL_CACHE_MAX_SIZE, PRINCIPAL_CACHE_TTL_SECONDS
+from app.schemas.user import UserGetting
+
+
+class PrincipalCache:
+    """Кеш для get_current_user: хеш токена -> user_id и user_id -> UserGetting."""
+
+    def __init__(self, enabled: bool = True, max_size: int = 10000, ttl: float = 60.0):
+        self.enabled = enabled
+        self.tokens = TTLCache(max_size=max_size, ttl=ttl)
+        self.users = TTLCache(max_size=max_size, ttl=ttl)
+
+    @staticmethod
+    def token_key(token: str) -> str:
+        # Сам токен в памяти не храним
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get_user_id(self, token: str) -> Optional[int]:
+        if not self.enabled:
+            return None
+        return self.tokens.get(self.token_key(token))
+
+    def set_token(self, token: str, user_id: int, expires_at: Optional[float] = None):
+        if not self.enabled:
+            return
+        ttl = None if expires_at is None else expires_at - time.time()
+        self.tokens.set(self.token_key(token), user_id, ttl=ttl)
+
+    def get_user(self, user_id: int) -> Optional[UserGetting]:
+        if not self.enabled:
+            return None
+        return self.users.get(user_id)
+
+    def set_user(self, user: UserGetting):
+        if self.enabled:
+            self.users.set(user.id, user)
+
+    def invalidate_user(self, user_id: int):
+        self.users.delete(user_id)
+
+    def clear(self):
+        self.tokens.clear()
+        self.users.clear()
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "tokens": self.tokens.stats(), "users": self.users.stats()}
+
+
+principal_cache = PrincipalCache(
+    enabled=PRINCIPAL_CACHE_ENABLED,
+    max_size=PRINCIPAL_CACHE_MAX_SIZE,
+    ttl=PRINCIPAL_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel, ConfigDict, create_model
+
+
+@dataclass(frozen=True)
+class Projection:
+    """Разреженный ответ списка: ?fields=id,title,status&include=assignee,comment_count.
+
+    fields=None - все поля схемы. id и поле сортировки возвращаются всегда: по ним строится курсор.
+    """
+    fields: Optional[Tuple[str, ...]] = None
+    include: Tuple[str, ...] = ()
+
+    @property
+    def is_default(self) -> bool:
+        return self.fields is None and not self.include
+
+
+@dataclass(frozen=True)
+class Include:
+    """Что можно добавить через ?include=: связь (loader option), вычисляемая колонка (подзапрос)
+    или объект по внешнему ключу key из кеша (lookup(ids, session) -> {id: объект}, один запрос на промахи).
+
+    option и column - фабрики: loader option конфигурирует мапперы, а при импорте репозиториев
+    ещё не все модели объявлены.
+    """
+    annotation: Any
+    option: Optional[Callable[[], Any]] = None
+    column: Optional[Callable[[], Any]] = None
+    key: Optional[str] = None
+    lookup: Optional[Callable[..., Awaitable[Dict[int, Any]]]] = None
+
+
+def _split(value: Optional[str]) -> Tuple[str, ...]:
+    if not value:
+        return ()
+    return tuple(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+
+
+def projection_params(
+    fields: Optional[str] = Query(None, description="Поля ответа через запятую, например id,title,status"),
+    include: Optional[str] = Query(None, description="Связанные данные через запятую, например assignee,comment_count"),
+) -> Projection:
+    return Projection(fields=_split(fields) or None, include=_split(include))
+
+
+def resolve_projection(projection: Projection, schema: Type[BaseModel], includes: Dict[str, Include], sort: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """Проверенные (поля, include); неизвестное имя - 400, как и неизвестная сортировка."""
+    requested = projection.fields or tuple(schema.model_fields)
+    for name in requested:
+        if name not in schema.model_fields:
+            raise HTTPException(status_code=400, detail=f"Unsupported field '{name}', expected one of: {', '.join(schema.model_fields)}")
+    for name in projection.include:
+        if name not in includes:
+            raise HTTPException(status_code=400, detail=f"Unsupported include '{name}', expected one of: {', '.join(includes)}")
+    fields = tuple(dict.fromkeys(("id", sort.lstrip("-"), *requested)))
+    return fields, projection.include
+
+
+@lru_cache(maxsize=256)
+def projected_schema(schema: Type[BaseModel], fields: Tuple[str, ...], extra: Tuple[Tuple[str, Any], ...]) -> Type[BaseModel]:
+    """Схема ответа из части полей schema и добавленных include; одна на набор параметров."""
+    definitions = {name: (schema.model_fields[name].annotation, ...) for name in fields}
+    definitions.update({name: (annotation, ...) for name, annotation in extra})
+    return create_model(f"{schema.__name__}Projection", __config__=ConfigDict(from_attributes=True), **definitions)
+
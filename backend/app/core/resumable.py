@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import secrets
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.requests import ClientDisconnect
+
+from app.core.config import ATTACHMENT_UPLOAD_DIR, ATTACHMENT_UPLOAD_TTL_SECONDS
+from app.core.storage import LocalStorage, StoredBlob, attachment_storage
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_upload_id = re.compile(r"^[0-9a-f]{32}$")
+HASH_BLOCK = 1024 * 1024
+# msvcrt.locking блокирует байты обязательно для всех: берём байт далеко за концом файла, данные остаются доступны
+_LOCK_OFFSET = 1 << 40  # 1 ТБ, больше любого допустимого вложения
+
+
+def _try_lock(fd: int) -> bool:
+    """Неблокирующая эксклюзивная блокировка .part; снимается при закрытии fd."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            os.lseek(fd, _LOCK_OFFSET, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+@dataclass
+class UploadState:
+    """Незавершённая загрузка. На диске: <id>.json с этими полями и <id>.part с принятыми байтами.
+
+    Смещение - размер .part, отдельно не хранится: после обрыва связи или падения процесса
+    оно совпадает с тем, что реально записано.
+    """
+    id: str
+    defect_id: int
+    size: int
+    file_name: Optional[str]
+    content_type: str
+    owner_id: int
+    attachment_id: Optional[int] = None  # Заполняется после создания вложения
+    offset: int = 0
+    updated: float = 0.0
+    ttl: float = ATTACHMENT_UPLOAD_TTL_SECONDS  # Из ResumableUploads, на диск не пишется
+
+    @property
+    def expires_at(self) -> datetime:
+        return datetime.fromtimestamp(self.updated + self.ttl, tz=timezone.utc)
+
+
+class OpenUpload:
+    """Загрузка под эксклюзивной блокировкой .part: дозапись и перенос в хранилище."""
+
+    def __init__(self, uploads: "ResumableUploads", state: UploadState, fd: int):
+        self.uploads = uploads
+        self.state = state
+        self.fd = fd
+        self.remove_data = False  # Удалить .part после закрытия fd
+
+    async def append(self, offset: int, chunks: AsyncIterator[bytes]):
+        """Дописывает тело PATCH с offset. Принятое до обрыва связи остаётся на диске."""
+        state = self.state
+        if offset != state.offset:
+            raise HTTPException(status_code=409, detail="Upload-Offset does not match", headers={"Upload-Offset": str(state.offset)})
+        # SHA-256 считается по ходу, пока запросы приходят в этот же процесс; иначе - при завершении
+        cached = self.uploads._hashes.pop(state.id, None)
+        hasher = cached[1] if cached and cached[0] == state.offset else None
+        if hasher is None and state.offset == 0:
+            hasher = hashlib.sha256()
+        try:
+            async for chunk in chunks:
+                if state.offset + len(chunk) > state.size:
+                    raise HTTPException(status_code=413, detail="Upload exceeds declared size")
+                if chunk:
+                    await asyncio.to_thread(self._write, chunk, state.offset, hasher)
+                    state.offset += len(chunk)
+        except ClientDisconnect:
+            pass
+        finally:
+            if hasher is not None:
+                self.uploads._hashes[state.id] = (state.offset, hasher)
+
+    def _write(self, data: bytes, offset: int, hasher):
+        # lseek + write вместо pwrite (его нет в Windows): fd под блокировкой только у этого запроса
+        os.lseek(self.fd, offset, os.SEEK_SET)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+        if hasher is not None:
+            hasher.update(data)
+
+    async def commit(self) -> StoredBlob:
+        """Полностью принятый файл -> хранилище вложений. .part остаётся до finish()."""
+        cached = self.uploads._hashes.pop(self.state.id, None)
+        hasher = cached[1] if cached and cached[0] == self.state.size else None
+        digest = await asyncio.to_thread(self._digest, hasher)
+        created = await self.uploads.storage.adopt(str(self.uploads._data(self.state.id)), digest)
+        return StoredBlob(digest, self.state.size, created)
+
+    def _digest(self, hasher) -> str:
+        os.fsync(self.fd)
+        if hasher is None:
+            hasher = hashlib.sha256()
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            while block := os.read(self.fd, HASH_BLOCK):
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    async def finish(self, attachment_id: int):
+        """Вложение создано: запоминаем его id (для HEAD после обрыва); .part удаляется после закрытия fd."""
+        self.state.attachment_id = attachment_id
+        await asyncio.to_thread(self.uploads._save, self.state)
+        self.remove_data = True
+
+
+class ResumableUploads:
+    """Возобновляемые загрузки (по образцу tus): создание, PATCH по смещению, HEAD - прогресс.
+
+    Состояние - файлы в root, поэтому загрузка переживает перезапуск и может продолжаться
+    в любом воркере на той же машине. root должен быть на той же файловой системе, что и
+    хранилище: готовый файл переносится туда жёсткой ссылкой, без копирования.
+    """
+
+    def __init__(self, storage: LocalStorage = attachment_storage, root: str = ATTACHMENT_UPLOAD_DIR,
+                 ttl: float = ATTACHMENT_UPLOAD_TTL_SECONDS):
+        self.storage = storage
+        self.root = Path(root)
+        self.ttl = ttl
+        self._hashes: Dict[str, Tuple[int, "hashlib._Hash"]] = {}
+
+    def _data(self, upload_id: str) -> Path:
+        return self.root / f"{upload_id}.part"
+
+    def _meta(self, upload_id: str) -> Path:
+        return self.root / f"{upload_id}.json"
+
+    def _save(self, state: UploadState):
+        values = asdict(state)
+        del values["offset"], values["updated"], values["ttl"]
+        temporary = self.root / f"{state.id}.json.tmp"
+        temporary.write_text(json.dumps(values))
+        os.replace(temporary, self._meta(state.id))
+
+    def _load(self, upload_id: str) -> Optional[UploadState]:
+        if not _upload_id.match(upload_id):
+            return None
+        try:
+            values = json.loads(self._meta(upload_id).read_text())
+            meta_stat = self._meta(upload_id).stat()
+        except FileNotFoundError:
+            return None
+        state = UploadState(**values, ttl=self.ttl)
+        try:
+            data_stat = self._data(upload_id).stat()
+            state.offset, state.updated = data_stat.st_size, max(data_stat.st_mtime, meta_stat.st_mtime)
+        except FileNotFoundError:
+            if state.attachment_id is None:
+                return None
+            state.offset, state.updated = state.size, meta_stat.st_mtime
+        if state.updated + self.ttl < time.time():
+            return None
+        return state
+
+    async def create(self, defect_id: int, size: int, file_name: Optional[str], content_type: str, owner_id: int) -> UploadState:
+        state = UploadState(secrets.token_hex(16), defect_id, size, file_name, content_type, owner_id, updated=time.time(), ttl=self.ttl)
+
+        def create_files():
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._data(state.id).touch(exist_ok=False)
+            self._save(state)
+        await asyncio.to_thread(create_files)
+        return state
+
+    async def get(self, upload_id: str, owner_id: int) -> UploadState:
+        state = await asyncio.to_thread(self._load, upload_id)
+        # Чужие загрузки не видны: id попадает в URL, а с ним - в логи прокси
+        if state is None or state.owner_id != owner_id:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        return state
+
+    @asynccontextmanager
+    async def open(self, upload_id: str, owner_id: int):
+        """Эксклюзивный доступ к загрузке на время PATCH: второй параллельный PATCH получит 423."""
+        state = await self.get(upload_id, owner_id)
+        if state.attachment_id is not None:
+            yield OpenUpload(self, state, -1)
+            return
+        try:
+            # O_BINARY - без него Windows открывает файл в текстовом режиме
+            fd = await asyncio.to_thread(os.open, self._data(upload_id), os.O_RDWR | getattr(os, "O_BINARY", 0))
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        upload = None
+        try:
+            if not _try_lock(fd):
+                raise HTTPException(status_code=423, detail="Upload is in progress in another request")
+            # Пока ждали блокировку, другой запрос мог дописать или завершить загрузку
+            state = await self.get(upload_id, owner_id)
+            upload = OpenUpload(self, state, fd)
+            yield upload
+        finally:
+            os.close(fd)
+            # Открытый файл Windows не удаляет, поэтому .part - только после close
+            if upload is not None and upload.remove_data:
+                await asyncio.to_thread(self._data(upload_id).unlink, True)
+
+    async def delete(self, upload_id: str, owner_id: int):
+        """Отмена загрузки под той же блокировкой, что и PATCH: во время PATCH - 423."""
+        async with self.open(upload_id, owner_id) as upload:
+            self._hashes.pop(upload_id, None)
+            # Без .json загрузки уже нет для get(): следующий PATCH получит 404, .part удалит close
+            await asyncio.to_thread(self._meta(upload_id).unlink, True)
+            upload.remove_data = True
+
+    def _cleanup(self, now: float) -> int:
+        if not self.root.exists():
+            return 0
+        removed = 0
+        for path in self.root.iterdir():
+            upload_id = path.name.split(".", 1)[0]
+            try:
+                expired = path.stat().st_mtime + self.ttl < now
+            except FileNotFoundError:
+                continue
+            if expired and self._load(upload_id) is None:
+                path.unlink(missing_ok=True)
+                self._hashes.pop(upload_id, None)
+                removed += 1
+        return removed
+
+    async def cleanup(self) -> int:
+        """Удаляет брошенные загрузки (без активности дольше ttl) и старые временные файлы хранилища."""
+        now = time.time()
+        removed = await asyncio.to_thread(self._cleanup, now)
+        return removed + await self.storage.cleanup_tmp(now - self.ttl)
+
+
+resumable_uploads = ResumableUploads()
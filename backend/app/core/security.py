@@ -1,6 +1,5 @@
 from fastapi import Depends
 from jose import JWTError
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 import jwt
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -8,14 +7,15 @@ from sqlalchemy.future import select
 from app.models.user import User
 from app.core.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
 from app.database.settings import get_session
+from app.core.hashing import pwd_context, hash_password, verify_password, password_hasher
+from app.core.principal_cache import principal_cache
+from app.schemas.user import UserGetting
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+async def hash_password_async(password: str) -> str:
+    return await password_hasher.hash(password)
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
 
 def create_jwt_token(data: dict, expires_delta: timedelta = None) -> str:
     to_encode = data.copy()
@@ -45,22 +45,28 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 async def get_current_user(
     token: str = Depends(oauth2_scheme), 
     session: AsyncSession = Depends(get_session)
-) -> User:
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+) -> UserGetting:
+    user_id = principal_cache.get_user_id(token)
+    if user_id is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise HTTPException(status_code=401, detail="Invalid token")
         user_id: int = payload.get("user_id")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        
+        principal_cache.set_token(token, user_id, payload.get("exp"))
+
+    user = principal_cache.get_user(user_id)
+    if user is None:
         result = await session.execute(select(User).filter(User.id == user_id))
-        user = result.scalar_one_or_none()
-        if not user:
+        db_user = result.scalar_one_or_none()
+        if not db_user:
             raise HTTPException(status_code=401, detail="User not found")
-            
-        return user
-        
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        user = UserGetting.model_validate(db_user)
+        principal_cache.set_user(user)
+
+    return user
 
 """ Зависимость для получения текущего пользователя из токена
 def get_current_user(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_session)) -> int:
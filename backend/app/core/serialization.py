@@ -0,0 +1,134 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Any, Callable, List, Optional, Sequence, Type, TypeVar
+
+import msgpack
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+SchemaT = TypeVar("SchemaT", bound=BaseModel)
+
+# UTC как "Z" - так же, как datetime сериализует pydantic
+_ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+
+@lru_cache(maxsize=None)
+def list_adapter(schema: Type[SchemaT]) -> TypeAdapter:
+    """TypeAdapter(List[schema]) строится один раз на схему: сборка валидатора дороже самой валидации."""
+    return TypeAdapter(List[schema])
+
+
+def validate_rows(schema: Type[SchemaT], keys: Sequence[str], rows: Sequence[Sequence]) -> List[SchemaT]:
+    """Строки SELECT по колонкам схемы -> список схем за один проход валидатора.
+
+    Кортеж со словарём из zip проверяется вдвое быстрее, чем Row через from_attributes.
+    """
+    keys = tuple(keys)
+    return list_adapter(schema).validate_python([dict(zip(keys, row)) for row in rows])
+
+
+def dump_models(items: Sequence[SchemaT]) -> List[dict]:
+    """Схемы -> dict сериализатором pydantic (вложенные схемы, computed-поля, исключения полей).
+
+    mode="python": datetime и Enum остаются объектами, их без лишних преобразований пишут orjson и msgpack.
+    """
+    if not items:
+        return []
+    return list_adapter(type(items[0])).dump_python(items)
+
+
+def _default(value: Any):
+    # Схемы сюда не попадают: их сначала превращают в dict через dump_models/model_dump
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+
+
+class OrjsonResponse(JSONResponse):
+    """JSON-ответ через orjson; понимает схемы pydantic без jsonable_encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _msgpack_default(value: Any):
+    # Время строкой, как в JSON: клиенту не нужен отдельный разбор расширения timestamp
+    if isinstance(value, datetime):
+        text = value.isoformat()
+        return text[:-6] + "Z" if value.utcoffset() == timedelta(0) else text
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Type is not MessagePack serializable: {type(value).__name__}")
+
+
+def msgpack_dumps(content: Any) -> bytes:
+    return msgpack.packb(content, default=_msgpack_default)
+
+
+def columns(rows: Sequence[dict]) -> dict:
+    """Колоночный вид списка: {поле: [значения по строкам]}, ключи не повторяются в каждой строке."""
+    if not rows:
+        return {}
+    return {name: [row[name] for row in rows] for name in rows[0]}
+
+
+@dataclass(frozen=True)
+class ListFormat:
+    media_type: str
+    encode: Callable[[Any], bytes]
+    columnar: bool = False
+    etag_suffix: str = ""  # Разные представления одного списка должны иметь разные ETag
+
+    def render(self, items: Sequence[BaseModel]) -> bytes:
+        rows = dump_models(items)
+        return self.encode(columns(rows) if self.columnar else rows)
+
+
+JSON_FORMAT = ListFormat("application/json", dumps)
+LIST_FORMATS = {
+    JSON_FORMAT.media_type: JSON_FORMAT,
+    "application/vnd.columnar+json": ListFormat("application/vnd.columnar+json", dumps, columnar=True, etag_suffix=".columnar"),
+    "application/msgpack": ListFormat("application/msgpack", msgpack_dumps, etag_suffix=".msgpack"),
+    "application/vnd.columnar+msgpack": ListFormat("application/vnd.columnar+msgpack", msgpack_dumps, columnar=True, etag_suffix=".columnar.msgpack"),
+}
+LIST_FORMATS["application/x-msgpack"] = LIST_FORMATS["application/msgpack"]
+
+
+def negotiate(accept: Optional[str]) -> ListFormat:
+    """Формат списка по заголовку Accept с учётом q; если ничего не подошло - JSON."""
+    best, best_q = JSON_FORMAT, 0.0
+    for part in (accept or "").split(","):
+        media_type, *params = [item.strip() for item in part.split(";")]
+        list_format = LIST_FORMATS.get(media_type.lower())
+        if list_format is None and media_type in ("*/*", "application/*"):
+            list_format = JSON_FORMAT
+        if list_format is None:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = list_format, q
+    return best
+
+
+def list_response(request: Request, items: Sequence[BaseModel], response: Response) -> Response:
+    """Список уже проверенных схем без повторной валидации по response_model.
+
+    Формат выбирается по Accept: JSON, колоночный JSON или MessagePack (строками или колонками).
+    response_model у маршрута остаётся для OpenAPI. Заголовки зависимостей (курсор, ETag)
+    переносятся в собственный ответ.
+    """
+    list_format = negotiate(request.headers.get("accept"))
+    headers = {**response.headers, "vary": "Accept"}  # Ключи response.headers - в нижнем регистре
+    return Response(list_format.render(items), media_type=list_format.media_type, headers=headers)
@@ -0,0 +1,134 @@
+import math
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from typing import Iterable, List, Optional
+
+_HEADER = struct.Struct("<BdddQ")  # версия, compression, min, max, число наблюдений
+_VERSION = 1
+
+
+class TDigest:
+    """Сливаемый t-digest (merging digest, масштабная функция k1).
+
+    Наблюдения хранятся центроидами (среднее, вес); у хвостов центроиды мельче, поэтому
+    p99 точнее медианы. Два дайджеста сливаются без исходных данных - на этом построены
+    дневные скетчи: запрос за период объединяет скетчи всех дней и групп.
+    Размер ограничен примерно compression центроидами независимо от числа наблюдений.
+    """
+
+    def __init__(self, compression: float = 100):
+        self.compression = compression
+        self.means: List[float] = []
+        self.weights: List[float] = []
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer: List[tuple] = []
+
+    def add(self, value: float, weight: float = 1):
+        self._buffer.append((value, weight))
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= self.compression * 5:
+            self._compress()
+
+    def update(self, values: Iterable[float]):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "TDigest"):
+        other._compress()
+        if not other.count:
+            return
+        self._buffer.extend(zip(other.means, other.weights))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        # Сжимаем не на каждом слиянии: сортировка буфера дороже самого слияния
+        if len(self._buffer) >= self.compression * 5:
+            self._compress()
+
+    def _weight_limit(self, cumulative: float) -> float:
+        """Сколько веса может набрать центроид, начатый после cumulative: k(q_правый) - k(q_левый) <= 1.
+
+        k(q) = compression / 2π * asin(2q - 1), обратная функция считается один раз на центроид.
+        """
+        k = self.compression / (2 * math.pi) * math.asin(2 * min(cumulative / self.count, 1.0) - 1) + 1
+        angle = min(k * 2 * math.pi / self.compression, math.pi / 2)
+        return (math.sin(angle) + 1) / 2 * self.count
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        items = sorted([*zip(self.means, self.weights), *self._buffer])
+        self._buffer = []
+        means, weights = [], []
+        mean, weight = items[0]
+        cumulative = 0.0
+        limit = self._weight_limit(cumulative)
+        for next_mean, next_weight in items[1:]:
+            # Сливаем соседей, пока центроид укладывается в единицу масштабной функции
+            if cumulative + weight + next_weight <= limit:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+            else:
+                means.append(mean)
+                weights.append(weight)
+                cumulative += weight
+                limit = self._weight_limit(cumulative)
+                mean, weight = next_mean, next_weight
+        means.append(mean)
+        weights.append(weight)
+        self.means, self.weights = means, weights
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка q-квантиля, 0 <= q <= 1; None для пустого дайджеста."""
+        self._compress()
+        if not self.count:
+            return None
+        if len(self.means) == 1:
+            return self.means[0]
+        target = q * self.count
+        # Центр i-го центроида - середина его веса; между центрами интерполируем линейно
+        centers, cumulative = [], 0.0
+        for weight in self.weights:
+            centers.append(cumulative + weight / 2)
+            cumulative += weight
+        if target <= centers[0]:
+            return self._interpolate(target, 0, centers[0], self.min, self.means[0])
+        if target >= centers[-1]:
+            return self._interpolate(target, centers[-1], self.count, self.means[-1], self.max)
+        index = bisect_right(centers, target) - 1
+        return self._interpolate(target, centers[index], centers[index + 1], self.means[index], self.means[index + 1])
+
+    @staticmethod
+    def _interpolate(x: float, x0: float, x1: float, y0: float, y1: float) -> float:
+        if x1 <= x0:
+            return y0
+        return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+
+    def to_bytes(self) -> bytes:
+        self._compress()
+        values = array("d")
+        for mean, weight in zip(self.means, self.weights):
+            values.extend((mean, weight))
+        if sys.byteorder == "big":
+            values.byteswap()
+        return _HEADER.pack(_VERSION, self.compression, self.min, self.max, int(self.count)) + values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        version, compression, minimum, maximum, count = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"Unsupported t-digest version {version}")
+        digest = cls(compression)
+        values = array("d")
+        values.frombytes(data[_HEADER.size:])
+        if sys.byteorder == "big":
+            values.byteswap()
+        digest.means, digest.weights = list(values[0::2]), list(values[1::2])
+        digest.count, digest.min, digest.max = count, minimum, maximum
+        return digest
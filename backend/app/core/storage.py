@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from app.core.config import ATTACHMENT_STORAGE_BACKEND, ATTACHMENT_STORAGE_DIR
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_digest(value: str) -> bool:
+    """file_path вложения - SHA-256 содержимого; у старых записей там произвольный путь от клиента."""
+    return bool(_DIGEST.match(value or ""))
+
+
+@dataclass(frozen=True)
+class StoredBlob:
+    digest: str
+    size: int
+    created: bool  # False - такое содержимое уже было, новая копия не записана
+
+
+class BlobWriter:
+    """Приём одного файла: байты пишутся во временный файл и сразу хешируются.
+
+    Запись и хеш идут в потоке: sha256 отпускает GIL, цикл событий не блокируется диском.
+    """
+
+    def __init__(self, storage: "LocalStorage", file):
+        self.storage = storage
+        self.file = file
+        self.size = 0
+        self._hash = hashlib.sha256()
+
+    def _write(self, data: bytes):
+        self._hash.update(data)
+        self.file.write(data)
+
+    async def write(self, data: bytes):
+        if data:
+            await asyncio.to_thread(self._write, data)
+            self.size += len(data)
+
+    async def commit(self) -> StoredBlob:
+        digest = self._hash.hexdigest()
+        created = await asyncio.to_thread(self.storage._commit, self.file, digest)
+        return StoredBlob(digest, self.size, created)
+
+    async def abort(self):
+        await asyncio.to_thread(self.storage._discard, self.file)
+
+
+class LocalStorage:
+    """Содержимое вложений в каталоге по хешу: <root>/ab/cd/abcd....
+
+    Одинаковые файлы хранятся один раз. Временные файлы лежат в <root>/tmp, на той же
+    файловой системе, поэтому готовый файл переносится атомарным rename.
+    """
+
+    def __init__(self, root: str = ATTACHMENT_STORAGE_DIR):
+        self.root = Path(root)
+        self.tmp = self.root / "tmp"
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def derivative_path(self, digest: str, variant: str) -> Path:
+        """Производная (миниатюра, превью) рядом с оригиналом: общая для всех вложений с этим содержимым."""
+        return self.root / digest[:2] / digest[2:4] / f"{digest}.{variant}"
+
+    def local_path(self, digest: str) -> Optional[str]:
+        """Путь для отдачи файла через sendfile; у удалённых хранилищ - None."""
+        return str(self.path(digest))
+
+    async def writer(self) -> BlobWriter:
+        def create():
+            self.tmp.mkdir(parents=True, exist_ok=True)
+            return tempfile.NamedTemporaryFile(dir=self.tmp, prefix="upload-", delete=False)
+        return BlobWriter(self, await asyncio.to_thread(create))
+
+    def _commit(self, file, digest: str) -> bool:
+        file.flush()
+        os.fsync(file.fileno())
+        file.close()
+        target = self.path(digest)
+        if self._reuse(target):
+            os.unlink(file.name)
+            return False
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Параллельная загрузка того же содержимого тоже сделает replace - файлы одинаковые
+        os.replace(file.name, target)
+        return True
+
+    @staticmethod
+    def _reuse(target: Path) -> bool:
+        # Свежий mtime у переиспользованного содержимого: collect_orphans не удалит его, пока создаётся запись
+        try:
+            os.utime(target)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _adopt(self, source: str, digest: str) -> bool:
+        target = self.path(digest)
+        if self._reuse(target):
+            return False
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(source, target)
+        except FileExistsError:
+            return False
+        except OSError:
+            # Другая файловая система: копия во временный файл рядом и атомарный replace
+            self.tmp.mkdir(parents=True, exist_ok=True)
+            with open(source, "rb") as src, tempfile.NamedTemporaryFile(dir=self.tmp, prefix="adopt-", delete=False) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(dst.name, target)
+        return True
+
+    async def adopt(self, source: str, digest: str) -> bool:
+        """Готовый файл с известным хешем -> хранилище. source не удаляется: он может ещё понадобиться вызывающему."""
+        return await asyncio.to_thread(self._adopt, source, digest)
+
+    def _cleanup_tmp(self, before: float) -> int:
+        if not self.tmp.exists():
+            return 0
+        removed = 0
+        for path in self.tmp.iterdir():
+            try:
+                if path.stat().st_mtime < before:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    async def cleanup_tmp(self, before: float) -> int:
+        """Временные файлы загрузок, прерванных падением процесса, старше before (unix time)."""
+        return await asyncio.to_thread(self._cleanup_tmp, before)
+
+    def _discard(self, file):
+        file.close()
+        try:
+            os.unlink(file.name)
+        except FileNotFoundError:
+            pass
+
+    async def exists(self, digest: str) -> bool:
+        return await asyncio.to_thread(self.path(digest).exists)
+
+    def _stale(self, before: float) -> List[str]:
+        stale = []
+        for path in self.root.glob("[0-9a-f][0-9a-f]/[0-9a-f][0-9a-f]/*"):
+            try:
+                if is_digest(path.name) and path.stat().st_mtime < before:
+                    stale.append(path.name)
+            except FileNotFoundError:
+                pass
+        return stale
+
+    async def stale_digests(self, before: float) -> List[str]:
+        """Содержимое, не записанное и не переиспользованное с before (unix time): кандидаты в сироты."""
+        return await asyncio.to_thread(self._stale, before)
+
+    def _delete_stale(self, digest: str, before: float) -> bool:
+        target = self.path(digest)
+        try:
+            # Между проверкой ссылок в БД и удалением содержимое могли загрузить снова
+            if target.stat().st_mtime >= before:
+                return False
+            target.unlink()
+        except FileNotFoundError:
+            return False
+        for derivative in target.parent.glob(f"{digest}.*"):
+            derivative.unlink(missing_ok=True)
+        return True
+
+    async def delete_stale(self, digest: str, before: float) -> bool:
+        """Удаляет содержимое с производными, если его не трогали с before."""
+        return await asyncio.to_thread(self._delete_stale, digest, before)
+
+
+STORAGE_BACKENDS = {"local": LocalStorage}
+
+
+def make_storage():
+    return STORAGE_BACKENDS[ATTACHMENT_STORAGE_BACKEND]()
+
+
+attachment_storage = make_storage()
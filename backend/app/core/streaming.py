@@ -0,0 +1,42 @@
+from typing import AsyncIterator
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from app.core.config import STREAM_CHUNK_BYTES
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+async def _chunked(parts: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # Склеиваем мелкие куски, чтобы не отправлять каждую строку отдельным фреймом
+    buffer = bytearray()
+    async for part in parts:
+        buffer += part
+        if len(buffer) >= STREAM_CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def json_array_parts(items: AsyncIterator[BaseModel]) -> AsyncIterator[bytes]:
+    yield b"["
+    separator = b""
+    async for item in items:
+        yield separator + item.model_dump_json().encode()
+        separator = b","
+    yield b"]"
+
+
+async def ndjson_parts(items: AsyncIterator[BaseModel]) -> AsyncIterator[bytes]:
+    async for item in items:
+        yield item.model_dump_json().encode() + b"\n"
+
+
+def stream_response(request: Request, items: AsyncIterator[BaseModel]) -> StreamingResponse:
+    """JSON массив или NDJSON (Accept: application/x-ndjson), строки пишутся по мере чтения из БД."""
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return StreamingResponse(_chunked(ndjson_parts(items)), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(_chunked(json_array_parts(items)), media_type="application/json")
@@ -0,0 +1,151 @@
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException, Request
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+from app.core.config import ATTACHMENT_MAX_BYTES, ATTACHMENT_FIELD_MAX_BYTES
+from app.core.storage import BlobWriter, StoredBlob
+
+_unsafe_name = re.compile(r'[\x00-\x1f\x7f"\\/]')
+
+
+def clean_file_name(name: Optional[str]) -> Optional[str]:
+    """Имя файла от клиента без каталогов и управляющих символов; используется только для Content-Disposition."""
+    if not name:
+        return None
+    name = _unsafe_name.sub("_", os.path.basename(name.replace("\\", "/"))).strip()
+    return name[:255] or None
+
+
+@dataclass
+class UploadedFile:
+    field_name: str
+    file_name: Optional[str]
+    content_type: str
+    blob: StoredBlob
+
+
+@dataclass
+class UploadForm:
+    fields: Dict[str, str] = field(default_factory=dict)
+    files: List[UploadedFile] = field(default_factory=list)
+
+
+@dataclass
+class _Part:
+    name: str = ""
+    file_name: Optional[str] = None
+    content_type: str = "application/octet-stream"
+    writer: Optional[BlobWriter] = None
+    value: bytearray = field(default_factory=bytearray)
+
+
+async def receive_multipart(request: Request, storage,
+                            before_file: Optional[Callable[[UploadForm, str], Awaitable[None]]] = None) -> UploadForm:
+    """Потоковый разбор multipart/form-data.
+
+    Файлы уходят в storage по мере прихода блоков и хешируются на лету, в памяти держится
+    только текущий блок тела запроса. Обычные поля ограничены ATTACHMENT_FIELD_MAX_BYTES,
+    файлы - ATTACHMENT_MAX_BYTES (413).
+
+    before_file(форма, имя поля) вызывается перед каждым файлом: поля, пришедшие раньше,
+    можно проверить до записи. Уже записанное содержимое при ошибке не удаляется: его может
+    разделять параллельная загрузка, ничьи файлы убирает задача collect-orphan-blobs.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=415, detail="Expected multipart/form-data")
+
+    form = UploadForm()
+    events: list = []
+    header = {"field": b"", "value": b"", "headers": {}}
+
+    def on_part_begin():
+        header["headers"] = {}
+
+    def on_header_field(data: bytes, start: int, end: int):
+        header["field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        header["headers"][header["field"].lower()] = header["value"]
+        header["field"], header["value"] = b"", b""
+
+    def on_headers_finished():
+        events.append(("begin", dict(header["headers"])))
+
+    def on_part_data(data: bytes, start: int, end: int):
+        events.append(("data", data[start:end]))
+
+    def on_part_end():
+        events.append(("end", None))
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin, "on_header_field": on_header_field, "on_header_value": on_header_value,
+        "on_header_end": on_header_end, "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data, "on_part_end": on_part_end,
+    })
+
+    part: Optional[_Part] = None
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            # Колбэки синхронные, поэтому запись на диск - здесь, после разбора блока
+            for kind, payload in events:
+                if kind == "begin":
+                    part = await _begin_part(payload, storage, form, before_file)
+                elif kind == "data":
+                    await _part_data(part, payload)
+                else:
+                    await _end_part(part, form)
+                    part = None
+            events.clear()
+        parser.finalize()
+        if part is not None:
+            raise HTTPException(status_code=400, detail="Incomplete multipart body")
+    except MultipartParseError as e:
+        if part is not None and part.writer is not None:
+            await part.writer.abort()
+        raise HTTPException(status_code=400, detail=f"Invalid multipart body: {e}")
+    except BaseException:
+        if part is not None and part.writer is not None:
+            await part.writer.abort()
+        raise
+    return form
+
+
+async def _begin_part(headers: dict, storage, form: UploadForm, before_file) -> _Part:
+    _, options = parse_options_header(headers.get(b"content-disposition", b""))
+    part = _Part(name=options.get(b"name", b"").decode("utf-8", "replace"))
+    if b"filename" in options:
+        if before_file is not None:
+            await before_file(form, part.name)
+        part.file_name = clean_file_name(options[b"filename"].decode("utf-8", "replace"))
+        part.content_type = headers.get(b"content-type", b"application/octet-stream").decode("latin-1").strip() or "application/octet-stream"
+        part.writer = await storage.writer()
+    return part
+
+
+async def _part_data(part: _Part, data: bytes):
+    if part.writer is not None:
+        if part.writer.size + len(data) > ATTACHMENT_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"File is larger than {ATTACHMENT_MAX_BYTES} bytes")
+        await part.writer.write(data)
+        return
+    if len(part.value) + len(data) > ATTACHMENT_FIELD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Form field '{part.name}' is too large")
+    part.value += data
+
+
+async def _end_part(part: _Part, form: UploadForm):
+    if part.writer is None:
+        form.fields[part.name] = part.value.decode("utf-8", "replace")
+        return
+    blob = await part.writer.commit()
+    form.files.append(UploadedFile(part.name, part.file_name, part.content_type, blob))
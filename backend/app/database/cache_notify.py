@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from typing import Iterable
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+
+from app.core.config import ENTITY_CACHE_CHANNEL, ENTITY_CACHE_LISTEN_CHECK_SECONDS
+from app.core.entity_cache import EntityCache, ENTITY_CACHES
+
+logger = logging.getLogger("app.cache")
+
+# session.info: {кеш: id} для сброса после commit
+PENDING_KEY = "entity_cache_invalidations"
+
+
+async def invalidate(session: AsyncSession, cache: EntityCache, ids: Iterable[int]):
+    """Сбрасывает объекты в своём кеше и в остальных воркерах после commit.
+
+    До commit сбрасывать нельзя: параллельный запрос прочитает ещё старую строку и
+    положит её обратно. pg_notify транзакционный: уведомление уходит только при commit,
+    его получает и слушатель этого же процесса. Если транзакция откатилась, сбрасывать нечего.
+    """
+    ids = list(ids)
+    session.info.setdefault(PENDING_KEY, {}).setdefault(cache, set()).update(ids)
+    if session.bind.dialect.name == "postgresql":
+        for object_id in ids:
+            await session.execute(select(func.pg_notify(ENTITY_CACHE_CHANNEL, f"{cache.name}:{object_id}")))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session):
+    pending = session.info.pop(PENDING_KEY, None)
+    for cache, ids in (pending or {}).items():
+        try:
+            # Хук синхронный, но вызывается внутри AsyncSession.commit: await_only ждёт сброс до возврата из commit
+            await_only(cache.invalidate(ids))
+        except Exception:
+            logger.exception("Failed to invalidate %s cache after commit", cache.name)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session):
+    session.info.pop(PENDING_KEY, None)
+
+
+async def apply_notification(payload: str):
+    name, _, object_id = payload.partition(":")
+    cache = ENTITY_CACHES.get(name)
+    if cache is None or not object_id.isdigit():
+        logger.warning("Unexpected cache invalidation payload %r", payload)
+        return
+    await cache.invalidate([int(object_id)])
+
+
+async def clear_all():
+    for cache in ENTITY_CACHES.values():
+        await cache.clear()
+
+
+class InvalidationListener:
+    """LISTEN на канале сброса кеша через отдельное соединение asyncpg.
+
+    Пока соединения нет, уведомления теряются, поэтому после каждого (пере)подключения
+    кеш очищается целиком. Если слушатель не работает, устаревание ограничено TTL кеша.
+    """
+
+    def __init__(self, engine, channel: str = ENTITY_CACHE_CHANNEL, check_interval: float = ENTITY_CACHE_LISTEN_CHECK_SECONDS):
+        self.engine = engine
+        self.channel = channel
+        self.check_interval = check_interval
+        self._pending = set()
+
+    def _on_notify(self, connection, pid, channel, payload):
+        task = asyncio.get_running_loop().create_task(apply_notification(payload))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def run(self):
+        while True:
+            try:
+                async with self.engine.connect() as connection:
+                    raw_connection = await connection.get_raw_connection()
+                    driver_connection = raw_connection.driver_connection
+                    await driver_connection.add_listener(self.channel, self._on_notify)
+                    await clear_all()
+                    try:
+                        while True:
+                            await asyncio.sleep(self.check_interval)
+                            await driver_connection.execute("SELECT 1")
+                    finally:
+                        if not driver_connection.is_closed():
+                            await driver_connection.remove_listener(self.channel, self._on_notify)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Cache invalidation listener failed, reconnecting")
+                await clear_all()
+                await asyncio.sleep(self.check_interval)
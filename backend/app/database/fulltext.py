@@ -0,0 +1,57 @@
+from sqlalchemy import DDL, column, event, literal_column, table as table_clause
+
+from app.core.config import FULLTEXT_CONFIG
+
+# Вес колонки: в PostgreSQL - метка setweight, в SQLite - множитель для bm25
+WEIGHTS = {"A": 10.0, "B": 4.0, "C": 2.0, "D": 1.0}
+
+FULLTEXT_COLUMNS = {}
+
+
+def register_fulltext(table, columns: dict):
+    """Полнотекстовый индекс по колонкам {имя: вес}.
+
+    PostgreSQL: генерируемая колонка search_vector (tsvector) и GIN индекс по ней.
+    SQLite: внешняя FTS5 таблица <table>_fts, которую поддерживают триггеры.
+    """
+    FULLTEXT_COLUMNS[table.name] = columns
+    name = table.name
+
+    vector = " || ".join(
+        f"setweight(to_tsvector('{FULLTEXT_CONFIG}', coalesce({column}, '')), '{weight}')"
+        for column, weight in columns.items()
+    )
+    for statement in (
+        f"ALTER TABLE {name} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({vector}) STORED",
+        f"CREATE INDEX ix_{name}_search_vector ON {name} USING gin (search_vector)",
+    ):
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+    names = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    delete_old = f"INSERT INTO {name}_fts({name}_fts, rowid, {names}) VALUES ('delete', old.id, {old_values});"
+    insert_new = f"INSERT INTO {name}_fts(rowid, {names}) VALUES (new.id, {new_values});"
+    for statement in (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {name}_fts USING fts5({names}, content='{name}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER {name}_fts_ai AFTER INSERT ON {name} BEGIN {insert_new} END",
+        f"CREATE TRIGGER {name}_fts_ad AFTER DELETE ON {name} BEGIN {delete_old} END",
+        f"CREATE TRIGGER {name}_fts_au AFTER UPDATE OF {names} ON {name} BEGIN {delete_old} {insert_new} END",
+    ):
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+    event.listen(table, "after_drop", DDL(f"DROP TABLE IF EXISTS {name}_fts").execute_if(dialect="sqlite"))
+
+
+def search_vector(table):
+    """Колонка search_vector (только PostgreSQL), в модели она не объявлена."""
+    return literal_column(f"{table.name}.search_vector")
+
+
+def fts_table(table):
+    """FTS5 таблица (только SQLite); rowid совпадает с id строки исходной таблицы."""
+    return table_clause(f"{table.name}_fts", column("rowid"))
+
+
+def bm25_weights(table) -> list:
+    return [WEIGHTS[weight] for weight in FULLTEXT_COLUMNS[table.name].values()]
@@ -0,0 +1,177 @@
+import json
+import logging
+import re
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import event
+
+from app.core.config import SLOW_QUERY_THRESHOLD_MS, N_PLUS_ONE_THRESHOLD, SLOW_QUERY_PARAMS_SAMPLE
+
+logger = logging.getLogger("app.sql")
+slow_query_logger = logging.getLogger("app.sql.slow")
+
+_whitespace = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    return _whitespace.sub(" ", statement).strip()
+
+
+def sample_parameters(parameters, limit: int = SLOW_QUERY_PARAMS_SAMPLE):
+    # Для executemany берём только первые наборы параметров, длинные значения обрезаем
+    if isinstance(parameters, list):
+        return [sample_parameters(item, limit) for item in parameters[:3]]
+    if isinstance(parameters, dict):
+        items = list(parameters.items())[:limit]
+        return {key: repr(value)[:100] for key, value in items}
+    if isinstance(parameters, tuple):
+        return [repr(value)[:100] for value in parameters[:limit]]
+    return repr(parameters)[:100]
+
+
+@dataclass
+class RequestQueryStats:
+    statements: int = 0
+    total_time: float = 0.0
+    slowest_time: float = 0.0
+    slowest_statement: Optional[str] = None
+    shapes: dict = field(default_factory=dict)
+
+    def record(self, statement: str, elapsed: float, executemany: bool = False):
+        self.statements += 1
+        self.total_time += elapsed
+        if elapsed > self.slowest_time:
+            self.slowest_time = elapsed
+            self.slowest_statement = statement
+        # Пачки executemany (массовая вставка) - это не N+1
+        if not executemany:
+            self.shapes[statement] = self.shapes.get(statement, 0) + 1
+
+    def repeated_shapes(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> dict:
+        return {shape: count for shape, count in self.shapes.items() if count >= threshold}
+
+    def summary(self) -> dict:
+        return {
+            "statements": self.statements,
+            "db_time_ms": round(self.total_time * 1000, 2),
+            "slowest_ms": round(self.slowest_time * 1000, 2),
+            "slowest_statement": self.slowest_statement,
+        }
+
+
+@dataclass
+class QueryTotals:
+    requests: int = 0
+    statements: int = 0
+    db_time: float = 0.0
+    slow_queries: int = 0
+    n_plus_one_requests: int = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": self.requests,
+            "statements": self.statements,
+            "db_time_ms": round(self.db_time * 1000, 2),
+            "slow_queries": self.slow_queries,
+            "n_plus_one_requests": self.n_plus_one_requests,
+        }
+
+
+query_totals = QueryTotals()
+_current_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("request_query_stats", default=None)
+
+
+def start_request_stats() -> RequestQueryStats:
+    stats = RequestQueryStats()
+    _current_stats.set(stats)
+    return stats
+
+
+def current_request_stats() -> Optional[RequestQueryStats]:
+    return _current_stats.get()
+
+
+def finish_request_stats(stats: RequestQueryStats, method: str, path: str):
+    query_totals.requests += 1
+    repeated = stats.repeated_shapes()
+    if repeated:
+        query_totals.n_plus_one_requests += 1
+        for shape, count in repeated.items():
+            logger.warning(json.dumps({
+                "event": "possible_n_plus_one",
+                "method": method,
+                "path": path,
+                "count": count,
+                "statement": shape,
+            }))
+    logger.debug(json.dumps({"event": "request_queries", "method": method, "path": path, **stats.summary()}))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    shape = statement_shape(statement)
+    query_totals.statements += 1
+    query_totals.db_time += elapsed
+
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(shape, elapsed, executemany)
+
+    if elapsed * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+        query_totals.slow_queries += 1
+        slow_query_logger.warning(json.dumps({
+            "event": "slow_query",
+            "duration_ms": round(elapsed * 1000, 2),
+            "statement": shape,
+            "parameters": sample_parameters(parameters),
+            "executemany": executemany,
+        }, default=str))
+
+
+def _handle_error(exception_context):
+    # Если запрос упал, after_cursor_execute не вызывается - убираем отметку времени
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start_time"):
+        conn.info["query_start_time"].pop()
+
+
+def instrument_engine(engine):
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+class QueryStatsMiddleware:
+    """ASGI middleware: собирает статистику SQL запросов на каждый HTTP запрос."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = start_request_stats()
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(stats.statements).encode()))
+                headers.append((b"server-timing", f"db;dur={stats.total_time * 1000:.2f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            finish_request_stats(stats, scope["method"], scope["path"])
+            _current_stats.set(None)
@@ -6,6 +6,9 @@ from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, Asyn
 import os
 from dotenv import load_dotenv
 
+from app.core.config import SQL_ECHO
+from app.database.instrumentation import instrument_engine
+
 # Загружаем переменные окружения
 load_dotenv()
 
@@ -16,16 +19,20 @@ DB_NAME = os.getenv("DB_NAME", "project_spo")
 DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "password")
 
-# Формируем URL для подключения к PostgreSQL
-DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Формируем URL для подключения к PostgreSQL (DATABASE_URL позволяет указать, например, sqlite+aiosqlite для локальной разработки)
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
 
 # Создаем асинхронный движок для PostgreSQL
 engine = create_async_engine(
     DATABASE_URL,
-    echo=True,  # Логирование SQL запросов
+    echo=SQL_ECHO,  # Логирование SQL запросов (по умолчанию выключено, см. instrumentation)
     pool_size=10,  # Размер пула соединений
     max_overflow=20,  # Максимальное количество соединений сверх pool_size
 )
+instrument_engine(engine)
 
 # Создаем фабрику сессий
 make_session = async_sessionmaker(
@@ -35,6 +42,8 @@ make_session = async_sessionmaker(
 )
 
 async def get_session():
+    # Репозитории только выполняют запросы (flush), транзакцию фиксируют сервисы.
+    # Здесь commit фиксирует то, что осталось открытым (например, чтение), и ничего не стоит, если транзакции нет.
     async with make_session() as session:
         try:
             yield session
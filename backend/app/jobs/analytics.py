@@ -0,0 +1,76 @@
+"""Фоновые задачи аналитики.
+
+    python -m app.jobs.analytics reconcile
+    python -m app.jobs.analytics backfill-status-durations
+    python -m app.jobs.analytics backfill-burndown
+    python -m app.jobs.analytics rebuild-resolution-sketches
+"""
+import argparse
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from app.database.settings import make_session, engine
+from app.services.analytics_services import AnalyticsService
+
+logger = logging.getLogger("app.jobs")
+
+
+async def reconcile_defect_counts() -> int:
+    async with make_session() as session:
+        repaired = await AnalyticsService.reconcile(session)
+    if repaired:
+        logger.warning("defect_counts: repaired %s rows", repaired)
+    return repaired
+
+
+async def run_periodically(job: Callable[[], Awaitable], interval: float):
+    """Запускает job каждые interval секунд, пока задачу не отменят."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await job()
+        except Exception:
+            logger.exception("Periodic job %s failed", job.__name__)
+
+
+async def backfill_status_durations() -> int:
+    async with make_session() as session:
+        return await AnalyticsService.backfill_status_durations(session)
+
+
+async def backfill_burndown() -> int:
+    async with make_session() as session:
+        return await AnalyticsService.backfill_burndown(session)
+
+
+async def rebuild_resolution_sketches() -> int:
+    async with make_session() as session:
+        return await AnalyticsService.rebuild_resolution_sketches(session)
+
+
+JOBS = {
+    "reconcile": reconcile_defect_counts,
+    "backfill-status-durations": backfill_status_durations,
+    "backfill-burndown": backfill_burndown,
+    "rebuild-resolution-sketches": rebuild_resolution_sketches,
+}
+
+
+async def _run(name: str):
+    try:
+        result = await JOBS[name]()
+        print(f"{name}: {result}")
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задачи аналитики")
+    parser.add_argument("job", choices=sorted(JOBS))
+    args = parser.parse_args()
+    asyncio.run(_run(args.job))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Фоновые задачи вложений.
+
+    python -m app.jobs.attachments cleanup-uploads
+    python -m app.jobs.attachments collect-orphan-blobs
+"""
+import argparse
+import asyncio
+import logging
+
+from app.core.resumable import resumable_uploads
+from app.database.settings import make_session
+from app.services.attachment_services import DefectAttachmentService
+
+logger = logging.getLogger("app.jobs")
+
+
+async def cleanup_uploads() -> int:
+    removed = await resumable_uploads.cleanup()
+    if removed:
+        logger.info("uploads: removed %s abandoned files", removed)
+    return removed
+
+
+async def collect_orphan_blobs() -> int:
+    async with make_session() as session:
+        removed = await DefectAttachmentService.collect_orphan_blobs(session)
+    if removed:
+        logger.info("attachments: removed %s unreferenced blobs", removed)
+    return removed
+
+
+JOBS = {
+    "cleanup-uploads": cleanup_uploads,
+    "collect-orphan-blobs": collect_orphan_blobs,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задачи вложений")
+    parser.add_argument("job", choices=sorted(JOBS))
+    args = parser.parse_args()
+    print(f"{args.job}: {asyncio.run(JOBS[args.job]())}")
+
+
+if __name__ == "__main__":
+    main()
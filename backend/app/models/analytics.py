@@ -0,0 +1,52 @@
+from sqlalchemy import Column, Integer, Date, Enum, LargeBinary, Index
+
+from app.database.settings import Base
+from app.models.defects import DefectStatus, DefectPriority
+
+UNASSIGNED = 0  # assigned_to_id для дефектов без исполнителя: NULL не может входить в первичный ключ
+
+class DefectCount(Base):
+    """Число дефектов в разрезе проект/статус/приоритет/исполнитель.
+
+    Обновляется вместе с записью в defects (DefectRepos), расхождения исправляет задача reconcile.
+    Внешних ключей нет, чтобы нулевые строки не мешали удалять проекты и пользователей.
+    """
+    __tablename__ = "defect_counts"
+
+    project_id = Column(Integer, primary_key=True)
+    status = Column(Enum(DefectStatus), primary_key=True)
+    priority = Column(Enum(DefectPriority), primary_key=True)
+    assigned_to_id = Column(Integer, primary_key=True, default=UNASSIGNED)
+    count = Column(Integer, nullable=False, default=0)
+
+class DefectDailyCount(Base):
+    """Дневные корзины проекта для burndown: сколько дефектов открыто, закрыто и переоткрыто за день (UTC).
+
+    Закрытыми считаются статусы closed и cancelled. Число открытых на день - накопленная сумма opened - closed + reopened.
+    """
+    __tablename__ = "defect_daily_counts"
+
+    project_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    opened = Column(Integer, nullable=False, default=0)
+    closed = Column(Integer, nullable=False, default=0)
+    reopened = Column(Integer, nullable=False, default=0)
+
+class ResolutionSketch(Base):
+    """t-digest времени от создания до закрытия дефекта (секунды) за день закрытия (UTC).
+
+    Строка на проект/приоритет/исполнитель/день: запрос за период сливает скетчи нужных строк.
+    Значения группы - на момент закрытия. Скетч не умеет вычитать, поэтому удаление дефекта
+    его не меняет; точные значения по журналу восстанавливает задача rebuild-resolution-sketches.
+    """
+    __tablename__ = "resolution_sketches"
+    __table_args__ = (
+        Index("ix_resolution_sketches_day", "day"),
+    )
+
+    project_id = Column(Integer, primary_key=True)
+    priority = Column(Enum(DefectPriority), primary_key=True)
+    assigned_to_id = Column(Integer, primary_key=True, default=UNASSIGNED)
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    sketch = Column(LargeBinary, nullable=False)
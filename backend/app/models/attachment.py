@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -7,9 +7,17 @@ from app.database.settings import Base
 
 class DefectAttachment(Base):
     __tablename__ = "defect_attachments"
+    __table_args__ = (
+        Index("ix_defect_attachments_defect_id_id", "defect_id", "id"),
+        # Сколько вложений ссылается на одно содержимое
+        Index("ix_defect_attachments_file_path", "file_path"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    file_path = Column(String, nullable=False) # Путь к файлу на сервере
+    file_path = Column(String, nullable=False) # SHA-256 содержимого в хранилище (у старых записей - путь от клиента)
+    file_name = Column(String)  # Исходное имя файла
+    content_type = Column(String)
+    size = Column(BigInteger)  # NULL - содержимое не загружалось
     upload_date = Column(DateTime, default=datetime.utcnow)
 
     defect_id = Column(Integer, ForeignKey("defects.id"), nullable=False)
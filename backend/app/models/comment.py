@@ -1,11 +1,16 @@
-from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from app.database.settings import Base
+from app.database.fulltext import register_fulltext
 
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        Index("ix_comments_defect_id_id", "defect_id", "id"),
+        Index("ix_comments_author_id_id", "author_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     text = Column(Text, nullable=False)
@@ -16,4 +21,6 @@ class Comment(Base):
 
     defect = relationship("Defect", back_populates="comments")
     author = relationship("User", back_populates="comments")
-    attachments = relationship("DefectAttachment", back_populates="comment", cascade="all, delete-orphan")
\ No newline at end of file
+    attachments = relationship("DefectAttachment", back_populates="comment", cascade="all, delete-orphan")
+
+register_fulltext(Comment.__table__, {"text": "C"})
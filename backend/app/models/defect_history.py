@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, Float, DateTime, Enum, ForeignKey, Index
+
+from app.database.settings import Base
+from app.models.defects import DefectStatus, DefectPriority
+
+class DefectStatusEvent(Base):
+    """Журнал смены статусов. Строки только добавляются, вместе с UPDATE дефекта в одной транзакции."""
+    __tablename__ = "defect_status_events"
+    __table_args__ = (
+        Index("ix_defect_status_events_defect_id_id", "defect_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    defect_id = Column(Integer, ForeignKey("defects.id", ondelete="CASCADE"), nullable=False)
+    from_status = Column(Enum(DefectStatus), nullable=False)
+    to_status = Column(Enum(DefectStatus), nullable=False)
+    changed_at = Column(DateTime(timezone=True), nullable=False)
+    changed_by_id = Column(Integer, ForeignKey("users.id"))
+    # Сколько дефект пробыл в from_status: по журналу можно пересобрать накопители без повторного проигрывания
+    from_seconds = Column(Float, nullable=False)
+    # Проект, приоритет и исполнитель на момент события: по ним rebuild группирует скетчи времени решения.
+    # В строках, записанных до появления колонок, - NULL, там берутся текущие значения дефекта
+    project_id = Column(Integer)
+    priority = Column(Enum(DefectPriority))
+    assigned_to_id = Column(Integer)
+
+class DefectStatusDuration(Base):
+    """Накопитель: суммарное время дефекта в статусе по завершённым интервалам."""
+    __tablename__ = "defect_status_durations"
+
+    defect_id = Column(Integer, ForeignKey("defects.id", ondelete="CASCADE"), primary_key=True)
+    status = Column(Enum(DefectStatus), primary_key=True)
+    seconds = Column(Float, nullable=False, default=0)
+    entries = Column(Integer, nullable=False, default=0)  # Сколько раз дефект выходил из статуса
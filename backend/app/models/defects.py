@@ -1,9 +1,10 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, Enum, ForeignKey, Index, DDL, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
 
 from app.database.settings import Base
+from app.database.fulltext import register_fulltext
 
 class DefectStatus(str, enum.Enum):
     NEW = "new"
@@ -20,6 +21,19 @@ class DefectPriority(str, enum.Enum):
 
 class Defect(Base):
     __tablename__ = "defects"
+    __table_args__ = (
+        # Выборки по проекту/исполнителю с сортировкой и курсором по id
+        Index("ix_defects_project_id_id", "project_id", "id"),
+        Index("ix_defects_assigned_to_id_id", "assigned_to_id", "id"),
+        # Фильтры списка /defects: равенство по ведущим колонкам, id - для порядка и курсора
+        Index("ix_defects_project_id_status_id", "project_id", "status", "id"),
+        Index("ix_defects_project_id_priority_id", "project_id", "priority", "id"),
+        Index("ix_defects_assigned_to_id_status_id", "assigned_to_id", "status", "id"),
+        Index("ix_defects_created_by_id_id", "created_by_id", "id"),
+        Index("ix_defects_status_id", "status", "id"),
+        # Поиск по подстроке в названии (ILIKE '%...%'); в PostgreSQL - триграммный GIN, в остальных БД - обычный индекс
+        Index("ix_defects_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
@@ -30,9 +44,21 @@ class Defect(Base):
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
     created_by_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     assigned_to_id = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    status_changed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)  # Начало текущего статуса
 
     project = relationship("Project", back_populates="defects")
     creator = relationship("User", back_populates="created_defects", foreign_keys=[created_by_id])
     assignee = relationship("User", back_populates="assigned_defects", foreign_keys=[assigned_to_id])
     comments = relationship("Comment", back_populates="defect")
-    attachments = relationship("DefectAttachment", back_populates="defect")
\ No newline at end of file
+    attachments = relationship("DefectAttachment", back_populates="defect")
+
+# gin_trgm_ops требует расширения pg_trgm
+event.listen(
+    Defect.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+# Полнотекстовый поиск /search: название важнее описания
+register_fulltext(Defect.__table__, {"title": "A", "description": "B"})
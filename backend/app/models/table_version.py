@@ -0,0 +1,13 @@
+from sqlalchemy import Column, String, BigInteger
+
+from app.database.settings import Base
+
+class TableVersion(Base):
+    """Счётчик изменений таблицы: репозитории увеличивают его в той же транзакции, что и запись.
+
+    По нему строятся ETag списков и отдельных объектов: пока счётчик не изменился, ответ тот же.
+    """
+    __tablename__ = "table_versions"
+
+    name = Column(String(64), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
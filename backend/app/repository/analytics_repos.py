@@ -0,0 +1,86 @@
+from collections import Counter
+from typing import Iterable, List, Optional
+
+from sqlalchemy import delete, func, text
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.analytics import DefectCount, UNASSIGNED
+from app.repository.base_repos import upsert_insert
+from app.models.defects import Defect, DefectStatus, DefectPriority
+
+# Поля дефекта, от которых зависит строка в defect_counts
+COUNT_DIMENSIONS = ("project_id", "status", "priority", "assigned_to_id")
+
+SUMMARY_GROUPS = {
+    "project": DefectCount.project_id,
+    "status": DefectCount.status,
+    "priority": DefectCount.priority,
+    "assignee": DefectCount.assigned_to_id,
+}
+
+
+def count_key(project_id: int, status, priority, assigned_to_id: Optional[int]) -> tuple:
+    # Схемы и модели используют разные enum классы с одинаковыми значениями
+    return project_id, DefectStatus(status), DefectPriority(priority), assigned_to_id or UNASSIGNED
+
+
+class AnalyticsRepos:
+
+    @classmethod
+    async def apply_deltas(cls, deltas: Counter, session: AsyncSession):
+        """Прибавляет изменения к счётчикам одним INSERT ... ON CONFLICT DO UPDATE."""
+        # Одинаковый порядок строк во всех транзакциях, чтобы они не блокировали друг друга крест-накрест
+        rows = [
+            {"project_id": key[0], "status": key[1], "priority": key[2], "assigned_to_id": key[3], "count": delta}
+            for key, delta in sorted(deltas.items(), key=lambda item: (item[0][0], item[0][1].name, item[0][2].name, item[0][3]))
+            if delta
+        ]
+        if not rows:
+            return
+        query = upsert_insert(session)(DefectCount)
+        query = query.on_conflict_do_update(
+            index_elements=list(COUNT_DIMENSIONS),
+            set_={"count": DefectCount.count + query.excluded["count"]},
+        )
+        await session.execute(query, rows)
+
+    @classmethod
+    async def summary(cls, group_by: Iterable[str], session: AsyncSession, project_id: Optional[int] = None, assigned_to_id: Optional[int] = None) -> List[dict]:
+        columns = [SUMMARY_GROUPS[name].label(name) for name in group_by]
+        query = select(*columns, func.sum(DefectCount.count).label("count")).where(DefectCount.count > 0)
+        if project_id is not None:
+            query = query.where(DefectCount.project_id == project_id)
+        if assigned_to_id is not None:
+            query = query.where(DefectCount.assigned_to_id == assigned_to_id)
+        if columns:
+            query = query.group_by(*columns).order_by(*columns)
+        result = await session.execute(query)
+        return [dict(row._mapping) for row in result if row.count]
+
+    @classmethod
+    async def reconcile(cls, session: AsyncSession) -> int:
+        """Пересчитывает defect_counts по defects и исправляет расхождения. Возвращает число исправленных строк."""
+        if session.bind.dialect.name == "postgresql":
+            # Ждём транзакции, уже изменившие счётчики, и не даём начаться новым до конца пересчёта.
+            # Чтение dashboard при этом не блокируется
+            await session.execute(text("LOCK TABLE defect_counts IN EXCLUSIVE MODE"))
+
+        assignee = func.coalesce(Defect.assigned_to_id, UNASSIGNED)
+        actual = await session.execute(
+            select(Defect.project_id, Defect.status, Defect.priority, assignee, func.count())
+            .group_by(Defect.project_id, Defect.status, Defect.priority, assignee)
+        )
+        stored = await session.execute(
+            select(DefectCount.project_id, DefectCount.status, DefectCount.priority, DefectCount.assigned_to_id, DefectCount.count)
+        )
+        deltas = Counter()
+        for *key, count in actual:
+            deltas[count_key(*key)] += count
+        for *key, count in stored:
+            deltas[count_key(*key)] -= count
+
+        drift = {key: delta for key, delta in deltas.items() if delta}
+        await cls.apply_deltas(Counter(drift), session)
+        await session.execute(delete(DefectCount).where(DefectCount.count == 0))
+        return len(drift)
@@ -1,20 +1,24 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Set
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
 
+from app.core.pagination import NullsAs, paginate
 from app.database.settings import get_session
+from app.repository.base_repos import insert_returning, update_returning, delete_returning, schema_columns, select_as_schemas, stream_as_schema
 from app.models.attachment import DefectAttachment
 from app.schemas.attachment import DefectAttachmentCreate, DefectAttachmentUpdate, DefectAttachmentGetting
 
+# upload_date заполняется только на стороне Python, у строк из других источников он может быть NULL
+ATTACHMENT_SORTS = {"id": DefectAttachment.id, "upload_date": NullsAs(DefectAttachment.upload_date, datetime(1970, 1, 1))}
+
 class DefectAttachmentRepos:
 
     @classmethod
-    async def get_all_attachments(cls, limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session)) -> List[DefectAttachmentGetting]:
-        query = select(DefectAttachment).offset(offset).limit(limit)
-        result = await session.execute(query)
-        attachments = result.scalars().all()
-        return [DefectAttachmentGetting.model_validate(attachment) for attachment in attachments]
+    async def get_all_attachments(cls, limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session), cursor: Optional[str] = None, sort: str = "id") -> List[DefectAttachmentGetting]:
+        query = paginate(select(*schema_columns(DefectAttachment, DefectAttachmentGetting)), DefectAttachment, ATTACHMENT_SORTS, sort, cursor, limit, offset)
+        return await select_as_schemas(session, query, DefectAttachmentGetting)
 
     @classmethod
     async def get_attachment_by_id(cls, attachment_id: int, session: AsyncSession = Depends(get_session)) -> Optional[DefectAttachmentGetting]:
@@ -27,45 +31,37 @@ class DefectAttachmentRepos:
 
     @classmethod
     async def create_attachment(cls, attachment_data: DefectAttachmentCreate, session: AsyncSession = Depends(get_session)) -> DefectAttachmentGetting:
-        new_attachment = DefectAttachment(**attachment_data.model_dump())
-        session.add(new_attachment)
-        await session.commit()
-        await session.refresh(new_attachment)
-        return DefectAttachmentGetting.model_validate(new_attachment)
+        return await insert_returning(session, DefectAttachment, attachment_data.model_dump(), DefectAttachmentGetting)
+
+    @classmethod
+    async def create_uploaded_attachment(cls, values: dict, session: AsyncSession) -> DefectAttachmentGetting:
+        """Вложение с загруженным содержимым: file_path - SHA-256, плюс имя, тип и размер файла."""
+        return await insert_returning(session, DefectAttachment, values, DefectAttachmentGetting)
 
     @classmethod
     async def update_attachment(cls, attachment_id: int, attachment_data: DefectAttachmentUpdate, session: AsyncSession = Depends(get_session)) -> Optional[DefectAttachmentGetting]:
-        query = select(DefectAttachment).filter(DefectAttachment.id == attachment_id)
-        result = await session.execute(query)
-        attachment = result.scalar_one_or_none()
-        
-        if not attachment:
-            return None
-        
         update_data = attachment_data.model_dump(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(attachment, field, value)
-        
-        await session.commit()
-        await session.refresh(attachment)
-        return DefectAttachmentGetting.model_validate(attachment)
+        if "file_path" in update_data:
+            # Ссылка на другое содержимое: сведения о загруженном файле больше не относятся к записи
+            update_data.update(file_name=None, content_type=None, size=None)
+        return await update_returning(session, DefectAttachment, attachment_id, update_data, DefectAttachmentGetting)
+
+    @classmethod
+    async def referenced_digests(cls, digests: List[str], session: AsyncSession) -> Set[str]:
+        """Какие из digests ещё нужны вложениям."""
+        result = await session.execute(select(DefectAttachment.file_path).where(DefectAttachment.file_path.in_(digests)).distinct())
+        return set(result.scalars().all())
 
     @classmethod
     async def delete_attachment(cls, attachment_id: int, session: AsyncSession = Depends(get_session)) -> bool:
-        query = select(DefectAttachment).filter(DefectAttachment.id == attachment_id)
-        result = await session.execute(query)
-        attachment = result.scalar_one_or_none()
-        
-        if not attachment:
-            return False
-        
-        await session.delete(attachment)
-        await session.commit()
-        return True
+        return await delete_returning(session, DefectAttachment, attachment_id)
 
     @classmethod
-    async def get_attachments_by_defect(cls, defect_id: int, session: AsyncSession = Depends(get_session)) -> List[DefectAttachmentGetting]:
-        query = select(DefectAttachment).filter(DefectAttachment.defect_id == defect_id)
-        result = await session.execute(query)
-        attachments = result.scalars().all()
-        return [DefectAttachmentGetting.model_validate(attachment) for attachment in attachments]
\ No newline at end of file
+    async def get_attachments_by_defect(cls, defect_id: int, session: AsyncSession = Depends(get_session), limit: int = 100, offset: int = 0, cursor: Optional[str] = None, sort: str = "id") -> List[DefectAttachmentGetting]:
+        query = paginate(select(*schema_columns(DefectAttachment, DefectAttachmentGetting)).filter(DefectAttachment.defect_id == defect_id), DefectAttachment, ATTACHMENT_SORTS, sort, cursor, limit, offset)
+        return await select_as_schemas(session, query, DefectAttachmentGetting)
+
+    @classmethod
+    def stream_attachments_by_defect(cls, defect_id: int, session: AsyncSession, sort: str = "id") -> AsyncIterator[DefectAttachmentGetting]:
+        query = select(*schema_columns(DefectAttachment, DefectAttachmentGetting)).filter(DefectAttachment.defect_id == defect_id)
+        return stream_as_schema(session, paginate(query, DefectAttachment, ATTACHMENT_SORTS, sort, limit=None), DefectAttachmentGetting)
\ No newline at end of file
@@ -4,7 +4,7 @@ from fastapi import Depends, HTTPException
 
 from app.database.settings import get_session
 from app.models.user import User
-from app.core.security import hash_password, verify_password, create_jwt_token
+from app.core.security import hash_password_async, verify_password_async, create_jwt_token
 from app.core.config import ACCESS_TOKEN_EXPIRE_MINUTES
 from datetime import timedelta
 from app.models.user import UserRole
@@ -18,7 +18,7 @@ class AuthRepos:
         if existing_user.scalar():
             return None
 
-        hashed_password = hash_password(password)
+        hashed_password = await hash_password_async(password)
 
         new_user = User(
             email=email, 
@@ -27,15 +27,15 @@ class AuthRepos:
             role=role  
         )
         session.add(new_user)
-        await session.commit()
-        await session.refresh(new_user)
+        # flush выполняет INSERT ... RETURNING id, фиксирует транзакцию сервис
+        await session.flush()
         return new_user.id
 
     @staticmethod
     async def authenticate_user(email: str, password: str, session: AsyncSession):
         result = await session.execute(select(User).filter(User.email == email))
         user = result.scalar_one_or_none()
-        if not user or not verify_password(password, user.password_hash):
+        if not user or not await verify_password_async(password, user.password_hash):
             return None
         return user
 
@@ -0,0 +1,177 @@
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Type, TypeVar
+
+from pydantic import BaseModel
+from sqlalchemy import insert, update, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import load_only
+
+from app.core.config import STREAM_BATCH_SIZE
+from app.core.projection import Include, Projection, projected_schema, resolve_projection
+from app.core.serialization import validate_rows
+
+SchemaT = TypeVar("SchemaT", bound=BaseModel)
+
+
+def schema_columns(model, schema: Type[BaseModel]) -> list:
+    return [getattr(model, field) for field in schema.model_fields]
+
+
+async def existing_ids(session: AsyncSession, model, ids: set) -> set:
+    if not ids:
+        return set()
+    result = await session.execute(select(model.id).where(model.id.in_(ids)))
+    return set(result.scalars().all())
+
+
+def _supports(session: AsyncSession, feature: str) -> bool:
+    # SQLite до 3.35 не умеет RETURNING, для него работаем в два запроса
+    return getattr(session.bind.dialect, feature, False)
+
+
+def upsert_insert(session: AsyncSession):
+    """insert() диалекта с on_conflict_do_update (PostgreSQL и SQLite 3.24+).
+
+    Другие СУБД приложение не поддерживает: ошибка конфигурации, а не недописанный код.
+    """
+    dialect = session.bind.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise ValueError(f"Upsert requires PostgreSQL or SQLite, got {dialect}")
+
+
+async def select_as_schema(session: AsyncSession, model, object_id: int, schema: Type[SchemaT]) -> Optional[SchemaT]:
+    result = await session.execute(select(*schema_columns(model, schema)).where(model.id == object_id))
+    row = result.first()
+    return schema.model_validate(dict(row._mapping)) if row else None
+
+
+async def insert_returning(session: AsyncSession, model, values: dict, schema: Type[SchemaT]) -> SchemaT:
+    """INSERT ... RETURNING: новая строка сразу в виде схемы, без refresh."""
+    query = insert(model).values(**values)
+    if _supports(session, "insert_returning"):
+        result = await session.execute(query.returning(*schema_columns(model, schema)))
+        return schema.model_validate(dict(result.one()._mapping))
+
+    result = await session.execute(query)
+    return await select_as_schema(session, model, result.inserted_primary_key[0], schema)
+
+
+async def update_returning(session: AsyncSession, model, object_id: int, values: dict, schema: Type[SchemaT]) -> Optional[SchemaT]:
+    """UPDATE ... RETURNING: один запрос вместо SELECT + UPDATE + refresh."""
+    if not values:
+        return await select_as_schema(session, model, object_id, schema)
+
+    query = (
+        update(model)
+        .where(model.id == object_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if _supports(session, "update_returning"):
+        result = await session.execute(query.returning(*schema_columns(model, schema)))
+        row = result.first()
+        return schema.model_validate(dict(row._mapping)) if row else None
+
+    result = await session.execute(query)
+    if result.rowcount == 0:
+        return None
+    return await select_as_schema(session, model, object_id, schema)
+
+
+async def update_where_returning(session: AsyncSession, model, condition, values: dict, columns: Sequence) -> list:
+    """UPDATE всех строк по условию одним запросом; возвращает колонки columns изменённых строк.
+
+    Без RETURNING колонки читаются SELECT до UPDATE, поэтому в columns - только то, что UPDATE не меняет.
+    """
+    query = update(model).where(condition).values(**values).execution_options(synchronize_session=False)
+    if _supports(session, "update_returning"):
+        result = await session.execute(query.returning(*columns))
+        return result.all()
+
+    result = await session.execute(select(*columns).where(condition))
+    rows = result.all()
+    if rows:
+        await session.execute(query)
+    return rows
+
+
+async def delete_returning(session: AsyncSession, model, object_id: int) -> bool:
+    """DELETE ... RETURNING id: удаление без предварительной загрузки объекта."""
+    query = delete(model).where(model.id == object_id).execution_options(synchronize_session=False)
+    if _supports(session, "delete_returning"):
+        result = await session.execute(query.returning(model.id))
+        return result.scalar_one_or_none() is not None
+
+    result = await session.execute(query)
+    return result.rowcount > 0
+
+
+async def delete_returning_row(session: AsyncSession, model, object_id: int, columns: Sequence):
+    """DELETE ... RETURNING выбранных колонок удалённой строки; None, если строки не было."""
+    query = delete(model).where(model.id == object_id).execution_options(synchronize_session=False)
+    if _supports(session, "delete_returning"):
+        result = await session.execute(query.returning(*columns))
+        return result.first()
+
+    result = await session.execute(select(*columns).where(model.id == object_id))
+    row = result.first()
+    if row is not None:
+        await session.execute(query)
+    return row
+
+
+async def select_as_schemas(session: AsyncSession, query, schema: Type[SchemaT]) -> List[SchemaT]:
+    """Список схем из SELECT по колонкам схемы: без ORM-объектов и identity map, одна валидация на весь список."""
+    result = await session.execute(query)
+    return validate_rows(schema, result.keys(), result.all())
+
+
+async def select_projected(session: AsyncSession, query, model, schema: Type[BaseModel], includes: Dict[str, Include], projection: Projection, sort: str) -> List[BaseModel]:
+    """Список по ?fields/?include: SELECT только нужных колонок (load_only), связи - loader options,
+    счётчики - подзапросы в той же строке, объекты из кеша - пачкой по внешним ключам страницы."""
+    fields, include = resolve_projection(projection, schema, includes, sort)
+    keys = [includes[name].key for name in include if includes[name].key is not None]
+    query = query.options(load_only(*[getattr(model, name) for name in dict.fromkeys((*fields, *keys))]))
+    for name in include:
+        if includes[name].option is not None:
+            query = query.options(includes[name].option())
+        if includes[name].column is not None:
+            query = query.add_columns(includes[name].column().label(name))
+
+    result_schema = projected_schema(schema, fields, tuple((name, includes[name].annotation) for name in include))
+    result = await session.execute(query)
+    rows = result.all()
+    looked_up = {}
+    for name in include:
+        if includes[name].lookup is not None:
+            ids = {getattr(row[0], includes[name].key) for row in rows} - {None}
+            looked_up[name] = await includes[name].lookup(ids, session) if ids else {}
+    items = []
+    for row in rows:
+        obj, values = row[0], row._mapping
+        data = {name: getattr(obj, name) for name in fields}
+        for name in include:
+            if name in looked_up:
+                data[name] = looked_up[name].get(getattr(obj, includes[name].key))
+            else:
+                data[name] = values[name] if includes[name].column is not None else getattr(obj, name)
+        items.append(result_schema.model_validate(data))
+    return items
+
+
+async def stream_as_schema(session: AsyncSession, query, schema: Type[SchemaT]) -> AsyncIterator[SchemaT]:
+    """Читает результат через серверный курсор пачками по STREAM_BATCH_SIZE строк."""
+    result = await session.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+    async for row in result:
+        yield schema.model_validate(dict(row._mapping))
+
+
+async def stream_batches(session: AsyncSession, query) -> AsyncIterator[list]:
+    """Строки результата пачками по STREAM_BATCH_SIZE через серверный курсор, без схем."""
+    result = await session.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+    async for rows in result.partitions():
+        yield rows
@@ -0,0 +1,131 @@
+from collections import Counter, defaultdict
+from datetime import date, datetime, timezone
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, text
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.analytics import DefectDailyCount
+from app.models.defects import Defect, DefectStatus
+from app.models.defect_history import DefectStatusEvent
+from app.repository.base_repos import upsert_insert, stream_batches
+
+CLOSED_STATUSES = {DefectStatus.CLOSED, DefectStatus.CANCELLED}
+BUCKET_FIELDS = ("opened", "closed", "reopened")
+
+# (from_status, to_status, changed_at) в порядке записи в журнал
+StatusEvent = Tuple[DefectStatus, DefectStatus, datetime]
+
+
+def utc_day(value: datetime) -> date:
+    # SQLite возвращает время без часового пояса, оно в UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+def is_closed(status) -> bool:
+    return DefectStatus(status) in CLOSED_STATUSES
+
+
+def defect_contributions(project_id: int, created_at: datetime, status, events: Sequence[StatusEvent]) -> Counter:
+    """Вклад одного дефекта в корзины: {(project_id, день, поле): число}."""
+    deltas = Counter()
+    created = utc_day(created_at)
+    deltas[(project_id, created, "opened")] += 1
+    initial = events[0][0] if events else status
+    if is_closed(initial):
+        deltas[(project_id, created, "closed")] += 1
+    for from_status, to_status, changed_at in events:
+        if not is_closed(from_status) and is_closed(to_status):
+            deltas[(project_id, utc_day(changed_at), "closed")] += 1
+        elif is_closed(from_status) and not is_closed(to_status):
+            deltas[(project_id, utc_day(changed_at), "reopened")] += 1
+    return deltas
+
+
+def negate(deltas: Counter) -> Counter:
+    return Counter({key: -value for key, value in deltas.items()})
+
+
+class BurndownRepos:
+
+    @classmethod
+    async def apply_deltas(cls, deltas: Counter, session: AsyncSession):
+        buckets = defaultdict(lambda: dict.fromkeys(BUCKET_FIELDS, 0))
+        for (project_id, day, field), value in deltas.items():
+            buckets[(project_id, day)][field] += value
+        rows = [
+            {"project_id": project_id, "day": day, **values}
+            for (project_id, day), values in sorted(buckets.items())
+            if any(values.values())
+        ]
+        if not rows:
+            return
+        query = upsert_insert(session)(DefectDailyCount)
+        query = query.on_conflict_do_update(
+            index_elements=["project_id", "day"],
+            set_={field: getattr(DefectDailyCount, field) + query.excluded[field] for field in BUCKET_FIELDS},
+        )
+        await session.execute(query, rows)
+
+    @classmethod
+    async def get_events(cls, defect_id: int, session: AsyncSession) -> List[StatusEvent]:
+        result = await session.execute(
+            select(DefectStatusEvent.from_status, DefectStatusEvent.to_status, DefectStatusEvent.changed_at)
+            .where(DefectStatusEvent.defect_id == defect_id)
+            .order_by(DefectStatusEvent.id)
+        )
+        return [tuple(row) for row in result]
+
+    @classmethod
+    async def get_buckets(cls, project_id: int, start: date, end: date, session: AsyncSession) -> Tuple[int, list]:
+        """Число открытых дефектов на начало start и корзины за [start, end]."""
+        before = await session.execute(
+            select(func.coalesce(func.sum(DefectDailyCount.opened - DefectDailyCount.closed + DefectDailyCount.reopened), 0))
+            .where(DefectDailyCount.project_id == project_id, DefectDailyCount.day < start)
+        )
+        result = await session.execute(
+            select(DefectDailyCount.day, DefectDailyCount.opened, DefectDailyCount.closed, DefectDailyCount.reopened)
+            .where(DefectDailyCount.project_id == project_id, DefectDailyCount.day.between(start, end))
+            .order_by(DefectDailyCount.day)
+        )
+        return before.scalar(), result.all()
+
+    @classmethod
+    async def first_day(cls, project_id: int, session: AsyncSession) -> Optional[date]:
+        result = await session.execute(select(func.min(DefectDailyCount.day)).where(DefectDailyCount.project_id == project_id))
+        return result.scalar()
+
+    @classmethod
+    async def rebuild(cls, session: AsyncSession) -> int:
+        """Пересобирает все корзины по defects и журналу статусов. Возвращает число корзин."""
+        if session.bind.dialect.name == "postgresql":
+            await session.execute(text("LOCK TABLE defect_daily_counts IN EXCLUSIVE MODE"))
+        await session.execute(delete(DefectDailyCount))
+
+        # Два потока, оба по возрастанию defect_id: дефекты и их события
+        defects = stream_batches(session, select(Defect.id, Defect.project_id, Defect.created_at, Defect.status).order_by(Defect.id))
+        events = _rows(stream_batches(session, select(
+            DefectStatusEvent.defect_id, DefectStatusEvent.from_status, DefectStatusEvent.to_status, DefectStatusEvent.changed_at,
+        ).order_by(DefectStatusEvent.defect_id, DefectStatusEvent.id)))
+
+        deltas = Counter()
+        pending = await anext(events, None)
+        async for rows in defects:
+            for defect_id, project_id, created_at, status in rows:
+                history = []
+                while pending is not None and pending[0] <= defect_id:
+                    if pending[0] == defect_id:
+                        history.append(tuple(pending[1:]))
+                    pending = await anext(events, None)
+                deltas.update(defect_contributions(project_id, created_at, status, history))
+        await cls.apply_deltas(deltas, session)
+        return len({(project_id, day) for project_id, day, _ in deltas})
+
+
+async def _rows(batches: AsyncIterator[list]) -> AsyncIterator:
+    async for rows in batches:
+        for row in rows:
+            yield row
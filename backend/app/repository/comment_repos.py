@@ -1,20 +1,41 @@
-from typing import List, Optional
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional
+from sqlalchemy import delete
 from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
 
+from app.core.pagination import NullsAs, paginate
+from app.core.projection import Include, Projection
 from app.database.settings import get_session
+from app.repository.base_repos import insert_returning, update_returning, delete_returning, schema_columns, select_as_schemas, select_projected, stream_as_schema
+from app.repository.user_repos import UserRepos
 from app.models.comment import Comment
+from app.models.attachment import DefectAttachment
+from app.models.defects import Defect
 from app.schemas.comment import CommentCreate, CommentUpdate, CommentGetting
+from app.schemas.defect import DefectBrief
+from app.schemas.user import UserBrief
+
+# У старых комментариев created_at может быть NULL: в сортировке они идут как самые ранние
+COMMENT_SORTS = {"id": Comment.id, "created_at": NullsAs(Comment.created_at, datetime(1970, 1, 1, tzinfo=timezone.utc))}
+
+# ?include= у списков комментариев
+COMMENT_INCLUDES = {
+    "author": Include(UserBrief, key="author_id", lookup=UserRepos.get_users_by_ids),
+    "defect": Include(DefectBrief, option=lambda: joinedload(Comment.defect).load_only(Defect.id, Defect.title)),
+}
 
 class CommentRepos:
 
     @classmethod
-    async def get_all_comments(cls, limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session)) -> List[CommentGetting]:
-        query = select(Comment).offset(offset).limit(limit)
-        result = await session.execute(query)
-        comments = result.scalars().all()
-        return [CommentGetting.model_validate(comment) for comment in comments]
+    async def get_all_comments(cls, limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session), cursor: Optional[str] = None, sort: str = "id", projection: Optional[Projection] = None) -> List[CommentGetting]:
+        if projection and not projection.is_default:
+            query = paginate(select(Comment), Comment, COMMENT_SORTS, sort, cursor, limit, offset)
+            return await select_projected(session, query, Comment, CommentGetting, COMMENT_INCLUDES, projection, sort)
+        query = paginate(select(*schema_columns(Comment, CommentGetting)), Comment, COMMENT_SORTS, sort, cursor, limit, offset)
+        return await select_as_schemas(session, query, CommentGetting)
 
     @classmethod
     async def get_comment_by_id(cls, comment_id: int, session: AsyncSession = Depends(get_session)) -> Optional[CommentGetting]:
@@ -27,52 +48,41 @@ class CommentRepos:
 
     @classmethod
     async def create_comment(cls, comment_data: CommentCreate, session: AsyncSession = Depends(get_session)) -> CommentGetting:
-        new_comment = Comment(**comment_data.model_dump())
-        session.add(new_comment)
-        await session.commit()
-        await session.refresh(new_comment)
-        return CommentGetting.model_validate(new_comment)
+        return await insert_returning(session, Comment, comment_data.model_dump(), CommentGetting)
 
     @classmethod
     async def update_comment(cls, comment_id: int, comment_data: CommentUpdate, session: AsyncSession = Depends(get_session)) -> Optional[CommentGetting]:
-        query = select(Comment).filter(Comment.id == comment_id)
-        result = await session.execute(query)
-        comment = result.scalar_one_or_none()
-        
-        if not comment:
-            return None
-        
         update_data = comment_data.model_dump(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(comment, field, value)
-        
-        await session.commit()
-        await session.refresh(comment)
-        return CommentGetting.model_validate(comment)
+        return await update_returning(session, Comment, comment_id, update_data, CommentGetting)
 
     @classmethod
     async def delete_comment(cls, comment_id: int, session: AsyncSession = Depends(get_session)) -> bool:
-        query = select(Comment).filter(Comment.id == comment_id)
-        result = await session.execute(query)
-        comment = result.scalar_one_or_none()
-        
-        if not comment:
-            return False
-        
-        await session.delete(comment)
-        await session.commit()
-        return True
+        # delete-orphan каскад на вложениях работает только через ORM, поэтому удаляем их явно
+        await session.execute(delete(DefectAttachment).where(DefectAttachment.comment_id == comment_id))
+        return await delete_returning(session, Comment, comment_id)
 
     @classmethod
-    async def get_comments_by_defect(cls, defect_id: int, session: AsyncSession = Depends(get_session)) -> List[CommentGetting]:
-        query = select(Comment).filter(Comment.defect_id == defect_id)
-        result = await session.execute(query)
-        comments = result.scalars().all()
-        return [CommentGetting.model_validate(comment) for comment in comments]
+    async def get_comments_by_defect(cls, defect_id: int, session: AsyncSession = Depends(get_session), limit: int = 100, offset: int = 0, cursor: Optional[str] = None, sort: str = "id", projection: Optional[Projection] = None) -> List[CommentGetting]:
+        if projection and not projection.is_default:
+            query = paginate(select(Comment).filter(Comment.defect_id == defect_id), Comment, COMMENT_SORTS, sort, cursor, limit, offset)
+            return await select_projected(session, query, Comment, CommentGetting, COMMENT_INCLUDES, projection, sort)
+        query = paginate(select(*schema_columns(Comment, CommentGetting)).filter(Comment.defect_id == defect_id), Comment, COMMENT_SORTS, sort, cursor, limit, offset)
+        return await select_as_schemas(session, query, CommentGetting)
 
     @classmethod
-    async def get_comments_by_author(cls, author_id: int, session: AsyncSession = Depends(get_session)) -> List[CommentGetting]:
-        query = select(Comment).filter(Comment.author_id == author_id)
-        result = await session.execute(query)
-        comments = result.scalars().all()
-        return [CommentGetting.model_validate(comment) for comment in comments]
\ No newline at end of file
+    async def get_comments_by_author(cls, author_id: int, session: AsyncSession = Depends(get_session), limit: int = 100, offset: int = 0, cursor: Optional[str] = None, sort: str = "id", projection: Optional[Projection] = None) -> List[CommentGetting]:
+        if projection and not projection.is_default:
+            query = paginate(select(Comment).filter(Comment.author_id == author_id), Comment, COMMENT_SORTS, sort, cursor, limit, offset)
+            return await select_projected(session, query, Comment, CommentGetting, COMMENT_INCLUDES, projection, sort)
+        query = paginate(select(*schema_columns(Comment, CommentGetting)).filter(Comment.author_id == author_id), Comment, COMMENT_SORTS, sort, cursor, limit, offset)
+        return await select_as_schemas(session, query, CommentGetting)
+
+    @classmethod
+    def stream_comments_by_defect(cls, defect_id: int, session: AsyncSession, sort: str = "id") -> AsyncIterator[CommentGetting]:
+        query = select(*schema_columns(Comment, CommentGetting)).filter(Comment.defect_id == defect_id)
+        return stream_as_schema(session, paginate(query, Comment, COMMENT_SORTS, sort, limit=None), CommentGetting)
+
+    @classmethod
+    def stream_comments_by_author(cls, author_id: int, session: AsyncSession, sort: str = "id") -> AsyncIterator[CommentGetting]:
+        query = select(*schema_columns(Comment, CommentGetting)).filter(Comment.author_id == author_id)
+        return stream_as_schema(session, paginate(query, Comment, COMMENT_SORTS, sort, limit=None), CommentGetting)
\ No newline at end of file
@@ -0,0 +1,110 @@
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import delete, func, insert, update
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.pagination import paginate
+from app.models.defects import Defect
+from app.models.defect_history import DefectStatusEvent, DefectStatusDuration
+from app.repository.base_repos import upsert_insert
+from app.schemas.defect_history import DefectStatusEventGetting
+
+EVENT_SORTS = {"id": DefectStatusEvent.id, "changed_at": DefectStatusEvent.changed_at}
+
+
+def _aware(value: datetime) -> datetime:
+    # SQLite возвращает время без часового пояса, оно в UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class DefectHistoryRepos:
+
+    @classmethod
+    async def record_status_change(cls, defect_id: int, from_status, to_status, since: datetime, changed_at: datetime, changed_by_id: Optional[int], session: AsyncSession,
+                                   project_id: Optional[int] = None, priority=None, assigned_to_id: Optional[int] = None):
+        """Событие в журнал и время в from_status в накопитель; вызывается в транзакции UPDATE дефекта.
+
+        project_id, priority, assigned_to_id - значения дефекта после UPDATE.
+        """
+        seconds = max((changed_at - _aware(since)).total_seconds(), 0.0)
+        await session.execute(insert(DefectStatusEvent).values(
+            defect_id=defect_id,
+            from_status=from_status,
+            to_status=to_status,
+            changed_at=changed_at,
+            changed_by_id=changed_by_id,
+            from_seconds=seconds,
+            project_id=project_id,
+            priority=priority,
+            assigned_to_id=assigned_to_id,
+        ))
+        query = upsert_insert(session)(DefectStatusDuration).values(defect_id=defect_id, status=from_status, seconds=seconds, entries=1)
+        await session.execute(query.on_conflict_do_update(
+            index_elements=["defect_id", "status"],
+            set_={
+                "seconds": DefectStatusDuration.seconds + query.excluded.seconds,
+                "entries": DefectStatusDuration.entries + 1,
+            },
+        ))
+
+    @classmethod
+    async def forget_user(cls, user_id: int, session: AsyncSession):
+        """changed_by_id = NULL в событиях удаляемого пользователя: сам журнал остаётся."""
+        await session.execute(
+            update(DefectStatusEvent).where(DefectStatusEvent.changed_by_id == user_id).values(changed_by_id=None)
+            .execution_options(synchronize_session=False)
+        )
+
+    @classmethod
+    async def get_events(cls, defect_id: int, session: AsyncSession, limit: int = 100, offset: int = 0, cursor: Optional[str] = None, sort: str = "id") -> List[DefectStatusEventGetting]:
+        query = paginate(select(DefectStatusEvent).where(DefectStatusEvent.defect_id == defect_id), DefectStatusEvent, EVENT_SORTS, sort, cursor, limit, offset)
+        result = await session.execute(query)
+        return [DefectStatusEventGetting.model_validate(event) for event in result.scalars().all()]
+
+    @classmethod
+    async def time_in_status(cls, project_id: int, session: AsyncSession) -> List[dict]:
+        """Время в статусах по дефектам проекта: читает только накопители, журнал не трогает."""
+        query = (
+            select(
+                DefectStatusDuration.status,
+                func.count().label("defects"),
+                func.sum(DefectStatusDuration.seconds).label("total_seconds"),
+            )
+            .join(Defect, Defect.id == DefectStatusDuration.defect_id)
+            .where(Defect.project_id == project_id)
+            .group_by(DefectStatusDuration.status)
+            .order_by(DefectStatusDuration.status)
+        )
+        result = await session.execute(query)
+        return [
+            {**row._mapping, "avg_seconds": row.total_seconds / row.defects}
+            for row in result
+        ]
+
+    @classmethod
+    async def max_event_defect_id(cls, session: AsyncSession) -> int:
+        result = await session.execute(select(func.max(DefectStatusEvent.defect_id)))
+        return result.scalar() or 0
+
+    @classmethod
+    async def rebuild_durations(cls, first_defect_id: int, last_defect_id: int, session: AsyncSession) -> int:
+        """Пересобирает накопители дефектов из диапазона id по журналу. Возвращает число строк накопителей."""
+        await session.execute(
+            delete(DefectStatusDuration).where(DefectStatusDuration.defect_id.between(first_defect_id, last_defect_id))
+        )
+        totals = (
+            select(
+                DefectStatusEvent.defect_id,
+                DefectStatusEvent.from_status,
+                func.sum(DefectStatusEvent.from_seconds),
+                func.count(),
+            )
+            .where(DefectStatusEvent.defect_id.between(first_defect_id, last_defect_id))
+            .group_by(DefectStatusEvent.defect_id, DefectStatusEvent.from_status)
+        )
+        result = await session.execute(
+            insert(DefectStatusDuration).from_select(["defect_id", "status", "seconds", "entries"], totals)
+        )
+        return result.rowcount
@@ -1,20 +1,86 @@
-from typing import List, Optional
+from collections import Counter
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional
+from sqlalchemy import func, insert
 from sqlalchemy.future import select
+from sqlalchemy.orm import aliased, joinedload, selectinload, raiseload
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
 
+from app.core.config import BULK_IMPORT_USE_COPY
+from app.core.pagination import paginate
+from app.core.projection import Include, Projection
 from app.database.settings import get_session
-from app.models.defects import Defect
-from app.schemas.defect import DefectCreate, DefectUpdate, DefectGetting
+from app.repository.base_repos import insert_returning, update_returning, update_where_returning, delete_returning_row, schema_columns, select_as_schemas, select_projected, stream_as_schema, stream_batches
+from app.repository.analytics_repos import AnalyticsRepos, COUNT_DIMENSIONS, count_key
+from app.repository.defect_history_repos import DefectHistoryRepos
+from app.repository.burndown_repos import BurndownRepos, defect_contributions, is_closed, negate, utc_day
+from app.repository.resolution_repos import ResolutionRepos, sketch_key, resolution_seconds
+from app.repository.version_repos import VersionRepos
+from app.repository.project_repos import ProjectRepos
+from app.repository.user_repos import UserRepos
+from app.models.defects import Defect, DefectStatus
+from app.models.project import Project
+from app.models.user import User
+from app.models.comment import Comment
+from app.schemas.defect import DefectCreate, DefectUpdate, DefectGetting, DefectFilter, DefectFull
+from app.schemas.projects import ProjectBrief
+from app.schemas.user import UserBrief
+
+BULK_COLUMNS = ("title", "description", "status", "priority", "project_id", "created_by_id", "assigned_to_id")
+
+DEFECT_SORTS = {"id": Defect.id, "title": Defect.title, "status": Defect.status, "priority": Defect.priority}
+
+# ?include= у списков дефектов: пользователи и проекты - из кеша объектов по id страницы, число комментариев - подзапросом
+DEFECT_INCLUDES = {
+    "assignee": Include(Optional[UserBrief], key="assigned_to_id", lookup=UserRepos.get_users_by_ids),
+    "creator": Include(UserBrief, key="created_by_id", lookup=UserRepos.get_users_by_ids),
+    "project": Include(ProjectBrief, key="project_id", lookup=ProjectRepos.get_projects_by_ids),
+    "comment_count": Include(int, column=lambda: select(func.count(Comment.id)).where(Comment.defect_id == Defect.id).correlate(Defect).scalar_subquery()),
+}
+
+def _escape_like(value: str) -> str:
+    # "!" вместо обратной косой черты: её экранирование в литералах зависит от настроек PostgreSQL
+    return value.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+
+class _DefectCreated(DefectGetting):
+    # Только внутри репозитория: день burndown для новой строки
+    created_at: datetime
+
 
 class DefectRepos:
 
     @classmethod
-    async def get_all_defects(cls, limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session)) -> List[DefectGetting]:
-        query = select(Defect).offset(offset).limit(limit)
-        result = await session.execute(query)
-        defects = result.scalars().all()
-        return [DefectGetting.model_validate(defect) for defect in defects]
+    def filter_query(cls, query, filters: Optional[DefectFilter]):
+        """Добавляет условия фильтра к запросу по таблице defects."""
+        if filters is None:
+            return query
+        if filters.status:
+            query = query.where(Defect.status.in_(filters.status))
+        if filters.priority:
+            query = query.where(Defect.priority.in_(filters.priority))
+        if filters.project_id is not None:
+            query = query.where(Defect.project_id == filters.project_id)
+        if filters.assigned_to_id is not None:
+            query = query.where(Defect.assigned_to_id == filters.assigned_to_id)
+        if filters.created_by_id is not None:
+            query = query.where(Defect.created_by_id == filters.created_by_id)
+        if filters.q:
+            query = query.where(Defect.title.ilike(f"%{_escape_like(filters.q)}%", escape="!"))
+        return query
+
+    @classmethod
+    def build_defects_query(cls, filters: Optional[DefectFilter] = None, limit: Optional[int] = 100, offset: int = 0, cursor: Optional[str] = None, sort: str = "id", query=None):
+        """query - начальный SELECT (по умолчанию ORM-объекты Defect), к нему добавляются фильтры и пагинация."""
+        return paginate(cls.filter_query(select(Defect) if query is None else query, filters), Defect, DEFECT_SORTS, sort, cursor, limit, offset)
+
+    @classmethod
+    async def get_all_defects(cls, limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session), cursor: Optional[str] = None, sort: str = "id", filters: Optional[DefectFilter] = None, projection: Optional[Projection] = None) -> List[DefectGetting]:
+        if projection and not projection.is_default:
+            query = cls.build_defects_query(filters, limit, offset, cursor, sort)
+            return await select_projected(session, query, Defect, DefectGetting, DEFECT_INCLUDES, projection, sort)
+        query = cls.build_defects_query(filters, limit, offset, cursor, sort, select(*schema_columns(Defect, DefectGetting)))
+        return await select_as_schemas(session, query, DefectGetting)
 
     @classmethod
     async def get_defect_by_id(cls, defect_id: int, session: AsyncSession = Depends(get_session)) -> Optional[DefectGetting]:
@@ -26,53 +92,202 @@ class DefectRepos:
         return DefectGetting.model_validate(defect)
 
     @classmethod
-    async def create_defect(cls, defect_data: DefectCreate, session: AsyncSession = Depends(get_session)) -> DefectGetting:
-        new_defect = Defect(**defect_data.model_dump())
-        session.add(new_defect)
-        await session.commit()
-        await session.refresh(new_defect)
-        return DefectGetting.model_validate(new_defect)
-
-    @classmethod
-    async def update_defect(cls, defect_id: int, defect_data: DefectUpdate, session: AsyncSession = Depends(get_session)) -> Optional[DefectGetting]:
-        query = select(Defect).filter(Defect.id == defect_id)
+    async def get_defect_full(cls, defect_id: int, session: AsyncSession) -> Optional[DefectFull]:
+        """Три запроса при любом числе комментариев: дефект с проектом и людьми (JOIN), комментарии с авторами, вложения."""
+        query = (
+            select(Defect)
+            .where(Defect.id == defect_id)
+            .options(
+                joinedload(Defect.project),
+                joinedload(Defect.creator),
+                joinedload(Defect.assignee),
+                selectinload(Defect.comments).joinedload(Comment.author),
+                selectinload(Defect.attachments),
+                # Любая другая связь - ошибка, а не незаметный ленивый запрос
+                raiseload("*"),
+            )
+        )
         result = await session.execute(query)
-        defect = result.scalar_one_or_none()
-        
+        defect = result.unique().scalar_one_or_none()
         if not defect:
             return None
-        
+        full = DefectFull.model_validate(defect)
+        full.comments.sort(key=lambda comment: comment.id)
+        full.attachments.sort(key=lambda attachment: attachment.id)
+        return full
+
+    @classmethod
+    async def create_defect(cls, defect_data: DefectCreate, session: AsyncSession = Depends(get_session)) -> DefectGetting:
+        # created_at ставит сервер БД (now()); день burndown берём из RETURNING, как и rebuild
+        created = await insert_returning(session, Defect, defect_data.model_dump(), _DefectCreated)
+        defect = DefectGetting.model_validate(created.model_dump(exclude={"created_at"}))
+        await AnalyticsRepos.apply_deltas(Counter({cls._count_key(defect): 1}), session)
+        await BurndownRepos.apply_deltas(
+            defect_contributions(defect.project_id, created.created_at, defect.status, []), session
+        )
+        await VersionRepos.bump(Defect.__tablename__, session)
+        return defect
+
+    @classmethod
+    async def update_defect(cls, defect_id: int, defect_data: DefectUpdate, session: AsyncSession = Depends(get_session), changed_by_id: Optional[int] = None) -> Optional[DefectGetting]:
         update_data = defect_data.model_dump(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(defect, field, value)
-        
-        await session.commit()
-        await session.refresh(defect)
-        return DefectGetting.model_validate(defect)
+        old = None
+        if update_data.keys() & set(COUNT_DIMENSIONS):
+            # Старые значения нужны для счётчиков и журнала статусов; FOR UPDATE - чтобы их не изменили до нашего UPDATE
+            result = await session.execute(
+                select(*(getattr(Defect, name) for name in COUNT_DIMENSIONS), Defect.created_at, Defect.status_changed_at)
+                .where(Defect.id == defect_id)
+                .with_for_update()
+            )
+            old = result.first()
+        status_changed = old is not None and "status" in update_data and DefectStatus(update_data["status"]) != old.status
+        if status_changed:
+            update_data["status_changed_at"] = datetime.now(timezone.utc)
+
+        defect = await update_returning(session, Defect, defect_id, update_data, DefectGetting)
+        if defect is not None and update_data:
+            await VersionRepos.bump(Defect.__tablename__, session)
+        if defect is not None and old is not None:
+            deltas = Counter()
+            deltas[cls._count_key(old)] -= 1
+            deltas[cls._count_key(defect)] += 1
+            await AnalyticsRepos.apply_deltas(deltas, session)
+            await cls._update_burndown(defect_id, old, defect, update_data.get("status_changed_at"), session)
+        if defect is not None and status_changed:
+            await DefectHistoryRepos.record_status_change(
+                defect_id, old.status, DefectStatus(defect.status), old.status_changed_at,
+                update_data["status_changed_at"], changed_by_id, session,
+                defect.project_id, defect.priority, defect.assigned_to_id,
+            )
+            if DefectStatus(defect.status) == DefectStatus.CLOSED:
+                closed_at = update_data["status_changed_at"]
+                key = sketch_key(defect.project_id, defect.priority, defect.assigned_to_id, closed_at)
+                await ResolutionRepos.add_samples({key: [resolution_seconds(old.created_at, closed_at)]}, session)
+        return defect
+
+    @classmethod
+    async def unassign_user(cls, user_id: int, session: AsyncSession) -> int:
+        """Снимает пользователя со всех назначенных ему дефектов одним UPDATE (как ORM при удалении пользователя)."""
+        dimensions = [getattr(Defect, name) for name in COUNT_DIMENSIONS if name != "assigned_to_id"]
+        rows = await update_where_returning(session, Defect, Defect.assigned_to_id == user_id, {"assigned_to_id": None}, dimensions)
+        if not rows:
+            return 0
+        await VersionRepos.bump(Defect.__tablename__, session)
+        deltas = Counter()
+        for row in rows:
+            values = dict(row._mapping)
+            deltas[cls._count_key({**values, "assigned_to_id": user_id})] -= 1
+            deltas[cls._count_key({**values, "assigned_to_id": None})] += 1
+        await AnalyticsRepos.apply_deltas(deltas, session)
+        return len(rows)
 
     @classmethod
     async def delete_defect(cls, defect_id: int, session: AsyncSession = Depends(get_session)) -> bool:
-        query = select(Defect).filter(Defect.id == defect_id)
-        result = await session.execute(query)
-        defect = result.scalar_one_or_none()
-        
-        if not defect:
+        # Журнал удаляется каскадно, поэтому читаем его до DELETE: по нему убираем дефект из дневных корзин
+        history = await BurndownRepos.get_events(defect_id, session)
+        columns = [*(getattr(Defect, name) for name in COUNT_DIMENSIONS), Defect.created_at]
+        old = await delete_returning_row(session, Defect, defect_id, columns)
+        if old is None:
             return False
-        
-        await session.delete(defect)
-        await session.commit()
+        await VersionRepos.bump(Defect.__tablename__, session)
+        await AnalyticsRepos.apply_deltas(Counter({cls._count_key(old): -1}), session)
+        await BurndownRepos.apply_deltas(
+            negate(defect_contributions(old.project_id, old.created_at, old.status, history)), session
+        )
         return True
 
     @classmethod
-    async def get_defects_by_project(cls, project_id: int, session: AsyncSession = Depends(get_session)) -> List[DefectGetting]:
-        query = select(Defect).filter(Defect.project_id == project_id)
-        result = await session.execute(query)
-        defects = result.scalars().all()
-        return [DefectGetting.model_validate(defect) for defect in defects]
+    async def _update_burndown(cls, defect_id: int, old, defect: DefectGetting, changed_at: Optional[datetime], session: AsyncSession):
+        deltas = Counter()
+        if defect.project_id != old.project_id:
+            # Вся история дефекта переезжает в корзины нового проекта
+            history = await BurndownRepos.get_events(defect_id, session)
+            deltas.subtract(defect_contributions(old.project_id, old.created_at, old.status, history))
+            deltas.update(defect_contributions(defect.project_id, old.created_at, old.status, history))
+        if changed_at is not None and is_closed(old.status) != is_closed(defect.status):
+            deltas[(defect.project_id, utc_day(changed_at), "closed" if is_closed(defect.status) else "reopened")] += 1
+        await BurndownRepos.apply_deltas(deltas, session)
+
+    @staticmethod
+    def _count_key(values) -> tuple:
+        if isinstance(values, dict):
+            return count_key(*(values[name] for name in COUNT_DIMENSIONS))
+        return count_key(*(getattr(values, name) for name in COUNT_DIMENSIONS))
 
     @classmethod
-    async def get_defects_by_assignee(cls, user_id: int, session: AsyncSession = Depends(get_session)) -> List[DefectGetting]:
-        query = select(Defect).filter(Defect.assigned_to_id == user_id)
-        result = await session.execute(query)
-        defects = result.scalars().all()
-        return [DefectGetting.model_validate(defect) for defect in defects]
\ No newline at end of file
+    async def get_defects_by_project(cls, project_id: int, session: AsyncSession = Depends(get_session), limit: int = 100, offset: int = 0, cursor: Optional[str] = None, sort: str = "id", projection: Optional[Projection] = None) -> List[DefectGetting]:
+        if projection and not projection.is_default:
+            query = paginate(select(Defect).filter(Defect.project_id == project_id), Defect, DEFECT_SORTS, sort, cursor, limit, offset)
+            return await select_projected(session, query, Defect, DefectGetting, DEFECT_INCLUDES, projection, sort)
+        query = paginate(select(*schema_columns(Defect, DefectGetting)).filter(Defect.project_id == project_id), Defect, DEFECT_SORTS, sort, cursor, limit, offset)
+        return await select_as_schemas(session, query, DefectGetting)
+
+    @classmethod
+    async def get_defects_by_assignee(cls, user_id: int, session: AsyncSession = Depends(get_session), limit: int = 100, offset: int = 0, cursor: Optional[str] = None, sort: str = "id", projection: Optional[Projection] = None) -> List[DefectGetting]:
+        if projection and not projection.is_default:
+            query = paginate(select(Defect).filter(Defect.assigned_to_id == user_id), Defect, DEFECT_SORTS, sort, cursor, limit, offset)
+            return await select_projected(session, query, Defect, DefectGetting, DEFECT_INCLUDES, projection, sort)
+        query = paginate(select(*schema_columns(Defect, DefectGetting)).filter(Defect.assigned_to_id == user_id), Defect, DEFECT_SORTS, sort, cursor, limit, offset)
+        return await select_as_schemas(session, query, DefectGetting)
+
+    @classmethod
+    async def bulk_insert_defects(cls, rows: List[dict], session: AsyncSession) -> int:
+        if not rows:
+            return 0
+        if BULK_IMPORT_USE_COPY and session.bind.dialect.driver == "asyncpg":
+            # COPY через соединение сессии, чтобы остаться в текущей транзакции.
+            # Enum колонки SQLAlchemy хранит по имени элемента, поэтому передаём .name
+            connection = await session.connection()
+            raw_connection = await connection.get_raw_connection()
+            records = [
+                (row["title"], row["description"], row["status"].name, row["priority"].name,
+                 row["project_id"], row["created_by_id"], row["assigned_to_id"])
+                for row in rows
+            ]
+            await raw_connection.driver_connection.copy_records_to_table(
+                Defect.__tablename__, columns=BULK_COLUMNS, records=records
+            )
+            # created_at = now(), а now() в Postgres - время начала транзакции, одно на все строки
+            created_at = (await session.execute(select(func.now()))).scalar_one()
+            created = [(row["project_id"], row["status"], created_at) for row in rows]
+        elif session.bind.dialect.insert_executemany_returning:
+            # executemany, для SQLite и Postgres SQLAlchemy собирает многострочные INSERT ... RETURNING
+            result = await session.execute(insert(Defect).returning(Defect.project_id, Defect.status, Defect.created_at), rows)
+            created = result.all()
+        else:
+            await session.execute(insert(Defect), rows)
+            created_at = (await session.execute(select(func.now()))).scalar_one()
+            created = [(row["project_id"], row["status"], row.get("created_at") or created_at) for row in rows]
+        await AnalyticsRepos.apply_deltas(Counter(cls._count_key(row) for row in rows), session)
+        burndown = Counter()
+        for project_id, status, created_at in created:
+            burndown.update(defect_contributions(project_id, created_at, status, []))
+        await BurndownRepos.apply_deltas(burndown, session)
+        await VersionRepos.bump(Defect.__tablename__, session)
+        return len(rows)
+
+    @classmethod
+    def stream_defects_by_project(cls, project_id: int, session: AsyncSession, sort: str = "id") -> AsyncIterator[DefectGetting]:
+        query = select(*schema_columns(Defect, DefectGetting)).filter(Defect.project_id == project_id)
+        return stream_as_schema(session, paginate(query, Defect, DEFECT_SORTS, sort, limit=None), DefectGetting)
+
+    @classmethod
+    def stream_defects_by_assignee(cls, user_id: int, session: AsyncSession, sort: str = "id") -> AsyncIterator[DefectGetting]:
+        query = select(*schema_columns(Defect, DefectGetting)).filter(Defect.assigned_to_id == user_id)
+        return stream_as_schema(session, paginate(query, Defect, DEFECT_SORTS, sort, limit=None), DefectGetting)
+
+    @classmethod
+    def stream_export_rows(cls, filters: Optional[DefectFilter], session: AsyncSession) -> AsyncIterator[list]:
+        """Дефекты с названием проекта и именами автора/исполнителя, пачками строк по id."""
+        creator, assignee = aliased(User), aliased(User)
+        query = (
+            select(
+                Defect.id, Defect.title, Defect.description, Defect.status, Defect.priority,
+                Defect.project_id, Project.name, Defect.created_by_id, creator.name,
+                Defect.assigned_to_id, assignee.name,
+            )
+            .join(Project, Project.id == Defect.project_id)
+            .join(creator, creator.id == Defect.created_by_id)
+            .outerjoin(assignee, assignee.id == Defect.assigned_to_id)
+        )
+        return stream_batches(session, cls.filter_query(query, filters).order_by(Defect.id))
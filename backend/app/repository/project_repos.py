@@ -1,23 +1,52 @@
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import func
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
 
+from app.core.pagination import paginate
+from app.core.projection import Include, Projection
 from app.database.settings import get_session
+from app.repository.base_repos import insert_returning, update_returning, delete_returning, schema_columns, select_as_schemas, select_projected
+from app.repository.version_repos import VersionRepos
+from app.repository.user_repos import UserRepos
+from app.core.entity_cache import project_cache
+from app.database.cache_notify import invalidate
 from app.models.project import Project
+from app.models.defects import Defect
 from app.schemas.projects import ProjectCreate, ProjectUpdate, ProjectGetting
+from app.schemas.user import UserBrief
+
+PROJECT_SORTS = {"id": Project.id, "name": Project.name}
+
+# ?include= у списка проектов
+PROJECT_INCLUDES = {
+    "manager": Include(UserBrief, key="manager_id", lookup=UserRepos.get_users_by_ids),
+    "defect_count": Include(int, column=lambda: select(func.count(Defect.id)).where(Defect.project_id == Project.id).correlate(Project).scalar_subquery()),
+}
 
 class ProjectRepos:
 
     @classmethod
-    async def get_all_projects(cls, limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session)) -> List[ProjectGetting]:
-        query = select(Project).offset(offset).limit(limit)
-        result = await session.execute(query)
-        projects = result.scalars().all()
-        return [ProjectGetting.model_validate(project) for project in projects]
+    async def get_all_projects(cls, limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session), cursor: Optional[str] = None, sort: str = "id", projection: Optional[Projection] = None) -> List[ProjectGetting]:
+        if projection and not projection.is_default:
+            query = paginate(select(Project), Project, PROJECT_SORTS, sort, cursor, limit, offset)
+            return await select_projected(session, query, Project, ProjectGetting, PROJECT_INCLUDES, projection, sort)
+        query = paginate(select(*schema_columns(Project, ProjectGetting)), Project, PROJECT_SORTS, sort, cursor, limit, offset)
+        return await select_as_schemas(session, query, ProjectGetting)
+
+    @classmethod
+    async def get_project_by_id(cls, project_id: int, session: AsyncSession = Depends(get_session), version: Optional[int] = None) -> Optional[ProjectGetting]:
+        """version - счётчик projects из ETag ответа: запись кеша старше него перечитывается из БД."""
+        return await project_cache.get(project_id, lambda object_id: cls._load_project(object_id, session), version)
 
     @classmethod
-    async def get_project_by_id(cls, project_id: int, session: AsyncSession = Depends(get_session)) -> Optional[ProjectGetting]:
+    async def get_projects_by_ids(cls, project_ids: Iterable[int], session: AsyncSession) -> Dict[int, ProjectGetting]:
+        """Проекты по id (например, для ?include=project у списка дефектов); из БД читаются только промахи кеша."""
+        return await project_cache.get_many(project_ids, lambda ids: cls._load_projects(ids, session))
+
+    @classmethod
+    async def _load_project(cls, project_id: int, session: AsyncSession) -> Optional[ProjectGetting]:
         query = select(Project).filter(Project.id == project_id)
         result = await session.execute(query)
         project = result.scalar_one_or_none()
@@ -25,40 +54,30 @@ class ProjectRepos:
             return None
         return ProjectGetting.model_validate(project)
 
+    @classmethod
+    async def _load_projects(cls, project_ids: List[int], session: AsyncSession) -> List[ProjectGetting]:
+        result = await session.execute(select(Project).where(Project.id.in_(project_ids)))
+        return [ProjectGetting.model_validate(project) for project in result.scalars().all()]
+
     @classmethod
     async def create_project(cls, project_data: ProjectCreate, session: AsyncSession = Depends(get_session)) -> ProjectGetting:
-        new_project = Project(**project_data.model_dump())
-        session.add(new_project)
-        await session.commit()
-        await session.refresh(new_project)
-        return ProjectGetting.model_validate(new_project)
+        project = await insert_returning(session, Project, project_data.model_dump(), ProjectGetting)
+        await VersionRepos.bump(Project.__tablename__, session)
+        return project
 
     @classmethod
     async def update_project(cls, project_id: int, project_data: ProjectUpdate, session: AsyncSession = Depends(get_session)) -> Optional[ProjectGetting]:
-        query = select(Project).filter(Project.id == project_id)
-        result = await session.execute(query)
-        project = result.scalar_one_or_none()
-        
-        if not project:
-            return None
-        
         update_data = project_data.model_dump(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(project, field, value)
-        
-        await session.commit()
-        await session.refresh(project)
-        return ProjectGetting.model_validate(project)
+        project = await update_returning(session, Project, project_id, update_data, ProjectGetting)
+        if project is not None and update_data:
+            await VersionRepos.bump(Project.__tablename__, session)
+            await invalidate(session, project_cache, [project_id])
+        return project
 
     @classmethod
     async def delete_project(cls, project_id: int, session: AsyncSession = Depends(get_session)) -> bool:
-        query = select(Project).filter(Project.id == project_id)
-        result = await session.execute(query)
-        project = result.scalar_one_or_none()
-        
-        if not project:
-            return False
-        
-        await session.delete(project)
-        await session.commit()
-        return True
\ No newline at end of file
+        deleted = await delete_returning(session, Project, project_id)
+        if deleted:
+            await VersionRepos.bump(Project.__tablename__, session)
+            await invalidate(session, project_cache, [project_id])
+        return deleted
\ No newline at end of file
@@ -0,0 +1,120 @@
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, text, update
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import RESOLUTION_SKETCH_COMPRESSION
+from app.core.sketch import TDigest
+from app.models.analytics import ResolutionSketch, UNASSIGNED
+from app.models.defects import Defect, DefectStatus, DefectPriority
+from app.models.defect_history import DefectStatusEvent
+from app.repository.base_repos import upsert_insert, stream_batches
+from app.repository.burndown_repos import utc_day
+
+SKETCH_GROUPS = {
+    "project": ResolutionSketch.project_id,
+    "priority": ResolutionSketch.priority,
+    "assignee": ResolutionSketch.assigned_to_id,
+}
+
+# (project_id, priority, assigned_to_id, день закрытия)
+SketchKey = Tuple[int, DefectPriority, int, date]
+
+
+def sketch_key(project_id: int, priority, assigned_to_id: Optional[int], closed_at: datetime) -> SketchKey:
+    return project_id, DefectPriority(priority), assigned_to_id or UNASSIGNED, utc_day(closed_at)
+
+
+def resolution_seconds(created_at: datetime, closed_at: datetime) -> float:
+    # SQLite возвращает время без часового пояса, оно в UTC
+    created_at, closed_at = (value if value.tzinfo else value.replace(tzinfo=timezone.utc) for value in (created_at, closed_at))
+    return max((closed_at - created_at).total_seconds(), 0.0)
+
+
+def _key_values(key: SketchKey) -> dict:
+    return {"project_id": key[0], "priority": key[1], "assigned_to_id": key[2], "day": key[3]}
+
+
+def _key_clause(key: SketchKey):
+    return [getattr(ResolutionSketch, name) == value for name, value in _key_values(key).items()]
+
+
+class ResolutionRepos:
+
+    @classmethod
+    async def add_samples(cls, samples: Dict[SketchKey, List[float]], session: AsyncSession):
+        """Добавляет наблюдения в скетчи: строка блокируется, скетч сливается в Python и записывается обратно."""
+        # Порядок ключей одинаковый во всех транзакциях, чтобы блокировки не пересекались крест-накрест
+        for key in sorted(samples, key=lambda item: (item[0], item[1].name, item[2], item[3])):
+            # Пустая строка, если её ещё нет: дальше с ней работает FOR UPDATE и параллельные закрытия не теряются
+            await session.execute(
+                upsert_insert(session)(ResolutionSketch)
+                .values(**_key_values(key), count=0, sketch=TDigest(RESOLUTION_SKETCH_COMPRESSION).to_bytes())
+                .on_conflict_do_nothing()
+            )
+            result = await session.execute(select(ResolutionSketch.sketch).where(*_key_clause(key)).with_for_update())
+            digest = TDigest.from_bytes(result.scalar_one())
+            digest.update(samples[key])
+            await session.execute(
+                update(ResolutionSketch).where(*_key_clause(key))
+                .values(count=int(digest.count), sketch=digest.to_bytes())
+                .execution_options(synchronize_session=False)
+            )
+
+    @classmethod
+    async def merged(cls, group_by: Sequence[str], start: date, end: date, session: AsyncSession,
+                     project_id: Optional[int] = None, priority: Optional[DefectPriority] = None,
+                     assigned_to_id: Optional[int] = None) -> List[Tuple[tuple, TDigest]]:
+        """Скетчи за [start, end], слитые по группам group_by: [(значения группы, t-digest)]."""
+        columns = [SKETCH_GROUPS[name] for name in group_by]
+        query = select(*columns, ResolutionSketch.sketch).where(ResolutionSketch.day.between(start, end))
+        if project_id is not None:
+            query = query.where(ResolutionSketch.project_id == project_id)
+        if priority is not None:
+            query = query.where(ResolutionSketch.priority == DefectPriority(priority))
+        if assigned_to_id is not None:
+            query = query.where(ResolutionSketch.assigned_to_id == assigned_to_id)
+
+        groups = defaultdict(lambda: TDigest(RESOLUTION_SKETCH_COMPRESSION))
+        async for rows in stream_batches(session, query):
+            for row in rows:
+                groups[tuple(row[:-1])].merge(TDigest.from_bytes(row[-1]))
+        return sorted(((key, digest) for key, digest in groups.items() if digest.count), key=lambda item: [getattr(value, "value", value) for value in item[0]])
+
+    @classmethod
+    async def rebuild(cls, session: AsyncSession) -> int:
+        """Пересобирает все скетчи по журналу статусов. Возвращает число скетчей.
+
+        Группа - значения, записанные в событии закрытия, как и при инкрементальном обновлении;
+        текущие поля дефекта - только для старых событий без них.
+        """
+        if session.bind.dialect.name == "postgresql":
+            await session.execute(text("LOCK TABLE resolution_sketches IN EXCLUSIVE MODE"))
+        await session.execute(delete(ResolutionSketch))
+
+        closes = (
+            select(
+                func.coalesce(DefectStatusEvent.project_id, Defect.project_id),
+                func.coalesce(DefectStatusEvent.priority, Defect.priority),
+                func.coalesce(DefectStatusEvent.assigned_to_id, Defect.assigned_to_id),
+                Defect.created_at, DefectStatusEvent.changed_at,
+            )
+            .join(Defect, Defect.id == DefectStatusEvent.defect_id)
+            .where(DefectStatusEvent.to_status == DefectStatus.CLOSED)
+        )
+        digests = defaultdict(lambda: TDigest(RESOLUTION_SKETCH_COMPRESSION))
+        async for rows in stream_batches(session, closes):
+            for project_id, priority, assigned_to_id, created_at, changed_at in rows:
+                key = sketch_key(project_id, priority, assigned_to_id, changed_at)
+                digests[key].add(resolution_seconds(created_at, changed_at))
+
+        rows = [
+            {**_key_values(key), "count": int(digest.count), "sketch": digest.to_bytes()}
+            for key, digest in digests.items()
+        ]
+        for offset in range(0, len(rows), 1000):
+            await session.execute(insert(ResolutionSketch), rows[offset:offset + 1000])
+        return len(rows)
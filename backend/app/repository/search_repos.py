@@ -0,0 +1,136 @@
+import html
+import re
+from typing import List, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import and_, func, literal_column, or_, tuple_
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import FULLTEXT_CONFIG, SEARCH_SNIPPET_WORDS
+from app.core.pagination import encode_cursor, decode_cursor
+from app.database.fulltext import search_vector, fts_table, bm25_weights
+from app.models.defects import Defect
+from app.models.comment import Comment
+from app.schemas.search import SearchHit
+
+SEARCH_KINDS = ("defect", "comment")
+MARK_START, MARK_END = "<mark>", "</mark>"
+# БД выделяет совпадения этими символами: текст дефекта экранируется как HTML, потом они меняются на <mark>
+_SELECT_START, _SELECT_END = "\x02", "\x03"
+
+_word = re.compile(r"\w+")
+
+
+def _tsquery(q: str):
+    # websearch_to_tsquery понимает "фразы", or и -исключение и не падает на произвольном вводе
+    return func.websearch_to_tsquery(literal_column(f"'{FULLTEXT_CONFIG}'::regconfig"), q)
+
+
+def _fts_match(q: str) -> Optional[str]:
+    """Запрос FTS5 из слов пользователя. Стеммера для русского в FTS5 нет, поэтому ищем по префиксу слова."""
+    words = _word.findall(q.lower())
+    return " ".join(f'"{word}"*' for word in words) or None
+
+
+def _postgres_hits(q: str):
+    tsquery = _tsquery(q)
+    defects = search_vector(Defect.__table__)
+    comments = search_vector(Comment.__table__)
+    return select(
+        literal_column("'defect'").label("kind"),
+        Defect.id.label("id"),
+        Defect.id.label("defect_id"),
+        func.ts_rank(defects, tsquery).label("rank"),
+        func.concat_ws(" ", Defect.title, Defect.description).label("document"),
+    ).where(defects.op("@@")(tsquery)).union_all(
+        select(
+            literal_column("'comment'"),
+            Comment.id,
+            Comment.defect_id,
+            func.ts_rank(comments, tsquery),
+            Comment.text,
+        ).where(comments.op("@@")(tsquery))
+    )
+
+
+def _sqlite_source(model, kind: str, defect_id, match: str):
+    fts = fts_table(model.__table__)
+    fts_name = literal_column(fts.name)
+    return (
+        select(
+            literal_column(f"'{kind}'").label("kind"),
+            model.id.label("id"),
+            defect_id.label("defect_id"),
+            # bm25 тем меньше, чем лучше совпадение
+            (-func.bm25(fts_name, *bm25_weights(model.__table__))).label("rank"),
+            func.snippet(fts_name, -1, _SELECT_START, _SELECT_END, "…", min(SEARCH_SNIPPET_WORDS, 64)).label("snippet"),
+        )
+        .select_from(fts.join(model, fts.c.rowid == model.id))
+        .where(fts_name.op("MATCH")(match))
+    )
+
+
+def _sqlite_hits(match: str):
+    return _sqlite_source(Defect, "defect", Defect.id, match).union_all(
+        _sqlite_source(Comment, "comment", Comment.defect_id, match)
+    )
+
+
+def highlight(snippet: str) -> str:
+    """Фрагмент из БД -> безопасный HTML: разметка только <mark>, остальное - экранированный текст."""
+    return html.escape(snippet).replace(_SELECT_START, MARK_START).replace(_SELECT_END, MARK_END)
+
+
+def _decode_search_cursor(cursor: str):
+    position = decode_cursor(cursor, "rank")
+    value = position["v"]
+    if not (isinstance(value, list) and len(value) == 2 and isinstance(value[0], (int, float)) and value[1] in SEARCH_KINDS):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value[0], value[1], position["id"]
+
+
+class SearchRepos:
+
+    @classmethod
+    async def search(cls, q: str, session: AsyncSession, limit: int = 20, cursor: Optional[str] = None) -> List[SearchHit]:
+        """Дефекты и комментарии по убыванию релевантности; курсор - (rank, kind, id) последней строки."""
+        postgres = session.bind.dialect.name == "postgresql"
+        if postgres:
+            hits = _postgres_hits(q).subquery("hits")
+        else:
+            match = _fts_match(q)
+            if match is None:
+                return []
+            hits = _sqlite_hits(match).subquery("hits")
+
+        query = select(hits)
+        if cursor:
+            rank, kind, object_id = _decode_search_cursor(cursor)
+            query = query.where(or_(
+                hits.c.rank < rank,
+                and_(hits.c.rank == rank, tuple_(hits.c.kind, hits.c.id) > tuple_(kind, object_id)),
+            ))
+        query = query.order_by(hits.c.rank.desc(), hits.c.kind, hits.c.id).limit(limit)
+
+        if postgres:
+            # ts_headline дорогой, поэтому считаем его только для строк текущей страницы
+            page = query.subquery("page")
+            options = f"StartSel={_SELECT_START}, StopSel={_SELECT_END}, MaxWords={SEARCH_SNIPPET_WORDS}, MinWords={SEARCH_SNIPPET_WORDS // 2}"
+            query = select(
+                page.c.kind,
+                page.c.id,
+                page.c.defect_id,
+                page.c.rank,
+                func.ts_headline(literal_column(f"'{FULLTEXT_CONFIG}'::regconfig"), page.c.document, _tsquery(q), options).label("snippet"),
+            ).order_by(page.c.rank.desc(), page.c.kind, page.c.id)
+
+        result = await session.execute(query)
+        return [SearchHit.model_validate({**row._mapping, "snippet": highlight(row.snippet)}) for row in result]
+
+    @classmethod
+    def next_cursor(cls, hits: Sequence[SearchHit], limit: int) -> Optional[str]:
+        if not hits or len(hits) < limit:
+            return None
+        last = hits[-1]
+        return encode_cursor("rank", [last.rank, last.kind], last.id)
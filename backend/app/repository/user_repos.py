@@ -1,24 +1,40 @@
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends, HTTPException
 
+from app.core.pagination import paginate
 from app.database.settings import get_session
+from app.repository.base_repos import insert_returning, update_returning, delete_returning, schema_columns, select_as_schemas
 from app.models.user import User
+from app.models.comment import Comment
+from app.models.defects import Defect
+from app.models.project import Project
 from app.schemas.user import UserCreate, UserUpdate, UserGetting
-from app.core.security import hash_password
+from app.core.security import hash_password_async
+from app.core.entity_cache import user_cache
+from app.database.cache_notify import invalidate
+
+USER_SORTS = {"id": User.id, "name": User.name, "email": User.email}
 
 class UserRepos:
 
     @classmethod
-    async def get_all_users(cls, limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session)) -> List[UserGetting]:
-        query = select(User).offset(offset).limit(limit)
-        result = await session.execute(query)
-        users = result.scalars().all()
-        return [UserGetting.model_validate(user) for user in users]
+    async def get_all_users(cls, limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session), cursor: Optional[str] = None, sort: str = "id") -> List[UserGetting]:
+        query = paginate(select(*schema_columns(User, UserGetting)), User, USER_SORTS, sort, cursor, limit, offset)
+        return await select_as_schemas(session, query, UserGetting)
 
     @classmethod
     async def get_user_by_id(cls, user_id: int, session: AsyncSession = Depends(get_session)) -> Optional[UserGetting]:
+        return await user_cache.get(user_id, lambda object_id: cls._load_user(object_id, session))
+
+    @classmethod
+    async def get_users_by_ids(cls, user_ids: Iterable[int], session: AsyncSession) -> Dict[int, UserGetting]:
+        """Пользователи по id (например, автор и исполнитель в списке дефектов); из БД читаются только промахи кеша."""
+        return await user_cache.get_many(user_ids, lambda ids: cls._load_users(ids, session))
+
+    @classmethod
+    async def _load_user(cls, user_id: int, session: AsyncSession) -> Optional[UserGetting]:
         query = select(User).filter(User.id == user_id)
         result = await session.execute(query)
         user = result.scalar_one_or_none()
@@ -26,55 +42,51 @@ class UserRepos:
             return None
         return UserGetting.model_validate(user)
 
+    @classmethod
+    async def _load_users(cls, user_ids: List[int], session: AsyncSession) -> List[UserGetting]:
+        result = await session.execute(select(User).where(User.id.in_(user_ids)))
+        return [UserGetting.model_validate(user) for user in result.scalars().all()]
+
     @classmethod
     async def create_user(cls, user_data: UserCreate, session: AsyncSession = Depends(get_session)) -> UserGetting:
         existing_user = await session.execute(select(User).filter(User.email == user_data.email))
         if existing_user.scalar_one_or_none():
             raise HTTPException(status_code=400, detail="User with this email already exists")
         
-        hashed_password = hash_password(user_data.password)
-        new_user = User(
-            email=user_data.email,
-            password_hash=hashed_password,
-            name=user_data.name,
-            role=user_data.role
-        )
-        
-        session.add(new_user)
-        await session.commit()
-        await session.refresh(new_user)
-        return UserGetting.model_validate(new_user)
+        hashed_password = await hash_password_async(user_data.password)
+        return await insert_returning(session, User, {
+            "email": user_data.email,
+            "password_hash": hashed_password,
+            "name": user_data.name,
+            "role": user_data.role
+        }, UserGetting)
 
     @classmethod
     async def update_user(cls, user_id: int, user_data: UserUpdate, session: AsyncSession = Depends(get_session)) -> Optional[UserGetting]:
-        query = select(User).filter(User.id == user_id)
-        result = await session.execute(query)
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            return None
-        
         update_data = user_data.model_dump(exclude_unset=True)
         
         if 'password' in update_data:
-            update_data['password_hash'] = hash_password(update_data.pop('password'))
-        
-        for field, value in update_data.items():
-            setattr(user, field, value)
+            update_data['password_hash'] = await hash_password_async(update_data.pop('password'))
         
-        await session.commit()
-        await session.refresh(user)
-        return UserGetting.model_validate(user)
+        user = await update_returning(session, User, user_id, update_data, UserGetting)
+        if user and update_data:
+            await invalidate(session, user_cache, [user_id])
+        return user
+
+    @classmethod
+    async def owns_records(cls, user_id: int, session: AsyncSession) -> bool:
+        """Есть ли строки, где пользователь - обязательная ссылка (автор дефекта или комментария, менеджер проекта)."""
+        owned = [
+            select(Defect.id).where(Defect.created_by_id == user_id),
+            select(Comment.id).where(Comment.author_id == user_id),
+            select(Project.id).where(Project.manager_id == user_id),
+        ]
+        result = await session.execute(select(*(query.exists() for query in owned)))
+        return any(result.one())
 
     @classmethod
     async def delete_user(cls, user_id: int, session: AsyncSession = Depends(get_session)) -> bool:
-        query = select(User).filter(User.id == user_id)
-        result = await session.execute(query)
-        user = result.scalar_one_or_none()
-        
-        if not user:
+        if not await delete_returning(session, User, user_id):
             return False
-        
-        await session.delete(user)
-        await session.commit()
+        await invalidate(session, user_cache, [user_id])
         return True
\ No newline at end of file
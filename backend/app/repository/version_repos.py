@@ -0,0 +1,21 @@
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.table_version import TableVersion
+from app.repository.base_repos import upsert_insert
+
+
+class VersionRepos:
+
+    @classmethod
+    async def bump(cls, name: str, session: AsyncSession):
+        """+1 к счётчику таблицы. Строка блокируется до конца транзакции, новое значение видно только после commit."""
+        query = upsert_insert(session)(TableVersion).values(name=name, version=1)
+        await session.execute(query.on_conflict_do_update(
+            index_elements=["name"], set_={"version": TableVersion.version + 1}
+        ))
+
+    @classmethod
+    async def get(cls, name: str, session: AsyncSession) -> int:
+        result = await session.execute(select(TableVersion.version).where(TableVersion.name == name))
+        return result.scalar() or 0
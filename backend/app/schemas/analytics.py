@@ -0,0 +1,53 @@
+from pydantic import BaseModel, field_validator
+from typing import List, Optional
+from datetime import date
+
+from app.schemas.defect import DefectStatus, DefectPriority
+
+class DefectCountGroup(BaseModel):
+    """Одна группа сводки; поля, по которым не группировали, равны None."""
+    project_id: Optional[int] = None
+    status: Optional[DefectStatus] = None
+    priority: Optional[DefectPriority] = None
+    assigned_to_id: Optional[int] = None
+    count: int
+
+    @field_validator("assigned_to_id")
+    @classmethod
+    def unassigned_as_none(cls, value):
+        return value or None
+
+class DefectSummary(BaseModel):
+    total: int
+    groups: List[DefectCountGroup]
+
+class BurndownGetting(BaseModel):
+    """Значения по дням с start по end включительно, i-й элемент - день start + i."""
+    project_id: int
+    start: date
+    end: date
+    opened: List[int]
+    closed: List[int]
+    reopened: List[int]
+    open: List[int]  # Открытых на конец дня
+
+class ResolutionPercentiles(BaseModel):
+    """Время от создания до закрытия в секундах; поля, по которым не группировали, равны None."""
+    project_id: Optional[int] = None
+    priority: Optional[DefectPriority] = None
+    assigned_to_id: Optional[int] = None
+    count: int
+    p50: float
+    p90: float
+    p99: float
+
+    @field_validator("assigned_to_id")
+    @classmethod
+    def unassigned_as_none(cls, value):
+        return value or None
+
+class ResolutionReport(BaseModel):
+    """Приближённые перцентили (t-digest) по дефектам, закрытым с start по end включительно."""
+    start: date
+    end: date
+    groups: List[ResolutionPercentiles]
@@ -1,7 +1,9 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, computed_field
+from typing import Dict, Optional
 from datetime import datetime
 
+from app.core import derivatives
+
 class DefectAttachmentCreate(BaseModel):
     file_path: str = Field(..., min_length=1)
     defect_id: int
@@ -15,8 +17,39 @@ class DefectAttachmentDelete(BaseModel):
 class DefectAttachmentGetting(BaseModel):
     id: int
     file_path: str
-    upload_date: datetime
+    upload_date: Optional[datetime]  # NULL у строк, записанных в обход ORM
+    defect_id: int
+    file_name: Optional[str] = None
+    content_type: Optional[str] = None
+    size: Optional[int] = None
+
+    @computed_field
+    @property
+    def derivatives(self) -> Optional[Dict[str, str]]:
+        """?v= для /attachments/{id}/derivatives/{name}: с ним производная кешируется как immutable. Только у изображений."""
+        pipeline = derivatives.derivative_pipeline
+        if not pipeline.supports(self.content_type):
+            return None
+        return {name: pipeline.tag(self.file_path, name) for name in derivatives.DERIVATIVES}
+
+    class Config:
+        from_attributes = True
+
+class ResumableUploadCreate(BaseModel):
+    defect_id: int
+    size: int = Field(..., ge=0)
+    file_name: Optional[str] = Field(None, max_length=1024)
+    content_type: Optional[str] = Field(None, max_length=255, pattern=r"^[\x21-\x7e][\x20-\x7e]*$")
+
+class ResumableUploadGetting(BaseModel):
+    id: str
     defect_id: int
+    size: int
+    offset: int
+    file_name: Optional[str] = None
+    content_type: str
+    expires_at: datetime
+    attachment_id: Optional[int] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
@@ -2,6 +2,8 @@ from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
 
+from app.schemas.user import UserGetting
+
 class CommentCreate(BaseModel):
     text: str = Field(..., min_length=1)
     defect_id: int
@@ -16,9 +18,12 @@ class CommentDelete(BaseModel):
 class CommentGetting(BaseModel):
     id: int
     text: str
-    created_at: datetime
+    created_at: Optional[datetime]  # NULL у старых строк
     defect_id: int
     author_id: int
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class CommentWithAuthor(CommentGetting):
+    author: UserGetting
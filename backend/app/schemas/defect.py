@@ -1,8 +1,13 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from enum import Enum
 
+from app.schemas.projects import ProjectGetting
+from app.schemas.user import UserGetting
+from app.schemas.comment import CommentWithAuthor
+from app.schemas.attachment import DefectAttachmentGetting
+
 class DefectStatus(str, Enum):
     NEW = "new"
     IN_PROGRESS = "in_progress"
@@ -32,6 +37,15 @@ class DefectUpdate(BaseModel):
     assigned_to_id: Optional[int] = None
     project_id: Optional[int] = None
 
+class DefectFilter(BaseModel):
+    """Фильтры списка дефектов. Несколько статусов/приоритетов объединяются через ИЛИ."""
+    status: Optional[List[DefectStatus]] = None
+    priority: Optional[List[DefectPriority]] = None
+    project_id: Optional[int] = None
+    assigned_to_id: Optional[int] = None
+    created_by_id: Optional[int] = None
+    q: Optional[str] = Field(None, min_length=1, max_length=200)
+
 class DefectDelete(BaseModel):
     id: int
 
@@ -46,4 +60,30 @@ class DefectGetting(BaseModel):
     assigned_to_id: Optional[int]
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class DefectBrief(BaseModel):
+    """Дефект внутри другого объекта (?include=defect у комментариев)."""
+    id: int
+    title: str
+
+    class Config:
+        from_attributes = True
+
+class DefectFull(DefectGetting):
+    """Всё для страницы дефекта одним ответом: проект, автор, исполнитель, комментарии с авторами и вложения."""
+    created_at: datetime
+    project: ProjectGetting
+    creator: UserGetting
+    assignee: Optional[UserGetting]
+    comments: List[CommentWithAuthor]
+    attachments: List[DefectAttachmentGetting]
+
+class DefectImportRowError(BaseModel):
+    row: int
+    errors: List[str]
+
+class DefectImportResult(BaseModel):
+    created: int
+    failed: int
+    errors: List[DefectImportRowError]
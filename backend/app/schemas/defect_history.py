@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+from app.schemas.defect import DefectStatus
+
+class DefectStatusEventGetting(BaseModel):
+    id: int
+    defect_id: int
+    from_status: DefectStatus
+    to_status: DefectStatus
+    changed_at: datetime
+    changed_by_id: Optional[int]
+    from_seconds: float
+
+    class Config:
+        from_attributes = True
+
+class StatusTimeGetting(BaseModel):
+    status: DefectStatus
+    defects: int  # Сколько дефектов проекта побывало в статусе
+    total_seconds: float
+    avg_seconds: float
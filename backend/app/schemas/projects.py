@@ -33,5 +33,13 @@ class ProjectGetting(BaseModel):
     is_active: bool
     manager_id: int
 
+    class Config:
+        from_attributes = True
+
+class ProjectBrief(BaseModel):
+    """Проект внутри другого объекта (?include=project)."""
+    id: int
+    name: str
+
     class Config:
         from_attributes = True
\ No newline at end of file
@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+from typing import Literal
+
+class SearchHit(BaseModel):
+    kind: Literal["defect", "comment"]
+    id: int
+    defect_id: int
+    rank: float
+    snippet: str  # Фрагмент текста как HTML: экранирован, совпадения обёрнуты в <mark></mark>
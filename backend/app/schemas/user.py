@@ -25,13 +25,21 @@ class UserDelete(BaseModel):
 
 class UserGetting(BaseModel):
     id: int
-    email: EmailStr
+    email: str  # Проверен при записи; EmailStr на выходе заново разбирал бы адрес в каждой строке списка
     name: str
     role: UserRole
 
     class Config:
         from_attributes = True
 
+class UserBrief(BaseModel):
+    """Пользователь внутри другого объекта (?include=assignee)."""
+    id: int
+    name: str
+
+    class Config:
+        from_attributes = True
+
 
 class LoginRequest(BaseModel):
     email: EmailStr
@@ -0,0 +1,142 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.repository.analytics_repos import AnalyticsRepos, SUMMARY_GROUPS
+from app.repository.defect_history_repos import DefectHistoryRepos
+from app.repository.burndown_repos import BurndownRepos, utc_day
+from app.repository.resolution_repos import ResolutionRepos, SKETCH_GROUPS
+from app.repository.project_repos import ProjectRepos
+from app.core.config import BURNDOWN_MAX_DAYS, RESOLUTION_DEFAULT_DAYS
+from app.schemas.analytics import DefectCountGroup, DefectSummary, BurndownGetting, ResolutionPercentiles, ResolutionReport
+from app.schemas.defect import DefectPriority
+from app.schemas.defect_history import StatusTimeGetting
+
+# Имя группы в запросе -> поле в ответе
+GROUP_FIELDS = {"project": "project_id", "status": "status", "priority": "priority", "assignee": "assigned_to_id"}
+
+class AnalyticsService:
+
+    @staticmethod
+    async def get_summary(group_by: List[str], session: AsyncSession, project_id: Optional[int] = None, assigned_to_id: Optional[int] = None) -> DefectSummary:
+        unknown = [name for name in group_by if name not in SUMMARY_GROUPS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unsupported group_by '{unknown[0]}', expected one of: {', '.join(SUMMARY_GROUPS)}")
+        group_by = list(dict.fromkeys(group_by))
+        try:
+            rows = await AnalyticsRepos.summary(group_by, session, project_id=project_id, assigned_to_id=assigned_to_id)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to get analytics: {str(e)}")
+        groups = [
+            DefectCountGroup(count=row["count"], **{GROUP_FIELDS[name]: row[name] for name in group_by})
+            for row in rows
+        ]
+        return DefectSummary(total=sum(group.count for group in groups), groups=groups)
+
+    @staticmethod
+    async def reconcile(session: AsyncSession) -> int:
+        repaired = await AnalyticsRepos.reconcile(session)
+        await session.commit()
+        return repaired
+
+    @staticmethod
+    async def get_time_in_status(project_id: int, session: AsyncSession) -> List[StatusTimeGetting]:
+        try:
+            rows = await DefectHistoryRepos.time_in_status(project_id, session)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to get analytics: {str(e)}")
+        return [StatusTimeGetting.model_validate(row) for row in rows]
+
+    @staticmethod
+    async def backfill_status_durations(session: AsyncSession, batch_size: int = 10000) -> int:
+        """Пересобирает накопители времени в статусах из журнала, по транзакции на пачку дефектов."""
+        last_id = await DefectHistoryRepos.max_event_defect_id(session)
+        rows = 0
+        for first_id in range(1, last_id + 1, batch_size):
+            rows += await DefectHistoryRepos.rebuild_durations(first_id, first_id + batch_size - 1, session)
+            await session.commit()
+        return rows
+
+    @staticmethod
+    async def get_burndown(project_id: int, session: AsyncSession, start: Optional[date] = None, end: Optional[date] = None) -> BurndownGetting:
+        """По умолчанию период проекта: start_date .. min(end_date, сегодня).
+
+        400 - только для заданных обеих границ. Период по умолчанию, который ещё не начался
+        (start_date в будущем), даёт пустые ряды, а слишком длинный - последние BURNDOWN_MAX_DAYS дней.
+        """
+        project = await ProjectRepos.get_project_by_id(project_id, session)
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+        explicit, start_given = start is not None and end is not None, start is not None
+        today = datetime.now(timezone.utc).date()
+        if end is None:
+            end = min(utc_day(project.end_date), today) if project.end_date else today
+        if start is None:
+            start = utc_day(project.start_date) if project.start_date else (await BurndownRepos.first_day(project_id, session) or end)
+        if start > end:
+            if explicit:
+                raise HTTPException(status_code=400, detail="start must not be after end")
+            return BurndownGetting(project_id=project_id, start=start, end=end, opened=[], closed=[], reopened=[], open=[])
+        days = (end - start).days + 1
+        if days > BURNDOWN_MAX_DAYS:
+            if explicit:
+                raise HTTPException(status_code=400, detail=f"Period is longer than {BURNDOWN_MAX_DAYS} days")
+            # Сдвигается граница по умолчанию, заданная остаётся
+            if start_given:
+                end = start + timedelta(days=BURNDOWN_MAX_DAYS - 1)
+            else:
+                start = end - timedelta(days=BURNDOWN_MAX_DAYS - 1)
+            days = BURNDOWN_MAX_DAYS
+
+        open_before, buckets = await BurndownRepos.get_buckets(project_id, start, end, session)
+        opened, closed, reopened = [0] * days, [0] * days, [0] * days
+        for day, day_opened, day_closed, day_reopened in buckets:
+            index = (day - start).days
+            opened[index], closed[index], reopened[index] = day_opened, day_closed, day_reopened
+        open_counts, current = [], open_before
+        for index in range(days):
+            current += opened[index] - closed[index] + reopened[index]
+            open_counts.append(current)
+        return BurndownGetting(project_id=project_id, start=start, end=end, opened=opened, closed=closed, reopened=reopened, open=open_counts)
+
+    @staticmethod
+    async def backfill_burndown(session: AsyncSession) -> int:
+        buckets = await BurndownRepos.rebuild(session)
+        await session.commit()
+        return buckets
+
+    @staticmethod
+    async def get_resolution_times(group_by: List[str], session: AsyncSession, start: Optional[date] = None, end: Optional[date] = None,
+                                   project_id: Optional[int] = None, priority: Optional[DefectPriority] = None,
+                                   assigned_to_id: Optional[int] = None) -> ResolutionReport:
+        """p50/p90/p99 времени до закрытия по слитым дневным скетчам; по умолчанию последние RESOLUTION_DEFAULT_DAYS дней."""
+        unknown = [name for name in group_by if name not in SKETCH_GROUPS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unsupported group_by '{unknown[0]}', expected one of: {', '.join(SKETCH_GROUPS)}")
+        group_by = list(dict.fromkeys(group_by))
+        end = end or datetime.now(timezone.utc).date()
+        start = start or end - timedelta(days=RESOLUTION_DEFAULT_DAYS - 1)
+        if start > end:
+            raise HTTPException(status_code=400, detail="start must not be after end")
+        try:
+            merged = await ResolutionRepos.merged(
+                group_by, start, end, session, project_id=project_id, priority=priority, assigned_to_id=assigned_to_id
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to get analytics: {str(e)}")
+        groups = [
+            ResolutionPercentiles(
+                count=int(digest.count),
+                p50=digest.quantile(0.5), p90=digest.quantile(0.9), p99=digest.quantile(0.99),
+                **{GROUP_FIELDS[name]: value for name, value in zip(group_by, key)},
+            )
+            for key, digest in merged
+        ]
+        return ResolutionReport(start=start, end=end, groups=groups)
+
+    @staticmethod
+    async def rebuild_resolution_sketches(session: AsyncSession) -> int:
+        sketches = await ResolutionRepos.rebuild(session)
+        await session.commit()
+        return sketches
@@ -1,17 +1,27 @@
-from typing import List
-from fastapi import HTTPException, Depends
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+from fastapi import HTTPException, Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import ATTACHMENT_MAX_BYTES, ATTACHMENT_ORPHAN_GRACE_SECONDS
+from app.core.derivatives import DERIVATIVES, derivative_pipeline
+from app.core.resumable import resumable_uploads
+from app.core.storage import attachment_storage, is_digest
+from app.core.uploads import UploadForm, clean_file_name, receive_multipart
 from app.database.settings import get_session
+from app.models.defects import Defect
 from app.repository.attachement_repos import DefectAttachmentRepos
-from app.schemas.attachment import DefectAttachmentCreate, DefectAttachmentUpdate, DefectAttachmentGetting
+from app.repository.base_repos import existing_ids
+from app.schemas.attachment import DefectAttachmentCreate, DefectAttachmentUpdate, DefectAttachmentGetting, ResumableUploadCreate, ResumableUploadGetting
 
 class DefectAttachmentService:
 
     @staticmethod
-    async def get_all_attachments(limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session)) -> List[DefectAttachmentGetting]:
+    async def get_all_attachments(limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session), cursor: Optional[str] = None, sort: str = "id") -> List[DefectAttachmentGetting]:
         try:
-            return await DefectAttachmentRepos.get_all_attachments(limit=limit, offset=offset, session=session)
+            return await DefectAttachmentRepos.get_all_attachments(limit=limit, offset=offset, session=session, cursor=cursor, sort=sort)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to get attachments: {str(e)}")
 
@@ -25,15 +35,157 @@ class DefectAttachmentService:
     @staticmethod
     async def create_attachment(attachment_data: DefectAttachmentCreate, session: AsyncSession = Depends(get_session)) -> DefectAttachmentGetting:
         try:
-            return await DefectAttachmentRepos.create_attachment(attachment_data, session)
+            attachment = await DefectAttachmentRepos.create_attachment(attachment_data, session)
+            await session.commit()
+            return attachment
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to create attachment: {str(e)}")
 
+    @staticmethod
+    async def get_attachment_content(attachment_id: int, session: AsyncSession) -> Tuple[DefectAttachmentGetting, str]:
+        """Вложение и путь к его содержимому на диске."""
+        attachment = await DefectAttachmentService.get_attachment_by_id(attachment_id, session)
+        # У старых записей в file_path путь от клиента, самого файла у сервера нет
+        if attachment.size is None or not is_digest(attachment.file_path):
+            raise HTTPException(status_code=404, detail="Attachment has no uploaded content")
+        path = attachment_storage.local_path(attachment.file_path)
+        if path is None:
+            raise HTTPException(status_code=501, detail="Storage backend does not serve files directly")
+        if not await attachment_storage.exists(attachment.file_path):
+            raise HTTPException(status_code=404, detail="Attachment content not found")
+        return attachment, path
+
+    @staticmethod
+    async def get_attachment_derivative(attachment_id: int, name: str, session: AsyncSession) -> Tuple[DefectAttachmentGetting, str, Optional[Tuple[str, int]]]:
+        """Вложение, путь к оригиналу и (путь, размер) производной name - или None, пока она строится."""
+        if name not in DERIVATIVES:
+            raise HTTPException(status_code=404, detail="Unknown derivative")
+        attachment, path = await DefectAttachmentService.get_attachment_content(attachment_id, session)
+        if not derivative_pipeline.supports(attachment.content_type):
+            raise HTTPException(status_code=404, detail="Attachment is not an image")
+        return attachment, path, await derivative_pipeline.get(attachment.file_path, attachment.content_type, name)
+
+    @staticmethod
+    async def upload_attachment(request: Request, session: AsyncSession) -> DefectAttachmentGetting:
+        """Вложение из multipart/form-data: поле defect_id и один файл в поле file.
+
+        defect_id должен идти в форме раньше файла: дефект проверяется до записи файла в хранилище.
+        Одинаковое содержимое хранится один раз, поэтому повторная загрузка не занимает место.
+        """
+        checked = {}
+
+        async def before_file(form: UploadForm, field_name: str):
+            if field_name != "file" or form.files:
+                raise HTTPException(status_code=422, detail="Expected exactly one file in field 'file'")
+            try:
+                checked["defect_id"] = int(form.fields.get("defect_id", ""))
+            except ValueError:
+                raise HTTPException(status_code=422, detail="Field 'defect_id' must be an integer and precede the file")
+            if not await existing_ids(session, Defect, {checked["defect_id"]}):
+                raise HTTPException(status_code=404, detail="Defect not found")
+
+        try:
+            form = await receive_multipart(request, attachment_storage, before_file)
+            if len(form.files) != 1:
+                raise HTTPException(status_code=422, detail="Expected exactly one file in field 'file'")
+            uploaded = form.files[0]
+            attachment = await DefectAttachmentRepos.create_uploaded_attachment({
+                "file_path": uploaded.blob.digest,
+                "file_name": uploaded.file_name,
+                "content_type": uploaded.content_type,
+                "size": uploaded.blob.size,
+                "defect_id": checked["defect_id"],
+            }, session)
+            await session.commit()
+            derivative_pipeline.schedule(attachment.file_path, attachment.content_type)
+            return attachment
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to upload attachment: {str(e)}")
+
+    @staticmethod
+    async def create_upload(upload_data: ResumableUploadCreate, owner_id: int, session: AsyncSession) -> ResumableUploadGetting:
+        if upload_data.size > ATTACHMENT_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"File is larger than {ATTACHMENT_MAX_BYTES} bytes")
+        if not await existing_ids(session, Defect, {upload_data.defect_id}):
+            raise HTTPException(status_code=404, detail="Defect not found")
+        try:
+            upload = await resumable_uploads.create(
+                upload_data.defect_id, upload_data.size, clean_file_name(upload_data.file_name),
+                upload_data.content_type or "application/octet-stream", owner_id,
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to create upload: {str(e)}")
+        return ResumableUploadGetting.model_validate(upload)
+
+    @staticmethod
+    async def get_upload(upload_id: str, owner_id: int) -> ResumableUploadGetting:
+        return ResumableUploadGetting.model_validate(await resumable_uploads.get(upload_id, owner_id))
+
+    @staticmethod
+    async def append_upload(upload_id: str, offset: int, request: Request, owner_id: int, session: AsyncSession) -> ResumableUploadGetting:
+        """PATCH возобновляемой загрузки. Последний кусок создаёт вложение.
+
+        Если ответ на последний PATCH потерялся, повтор с Upload-Offset = size вернёт
+        уже созданное вложение, а не второе.
+        """
+        if not request.headers.get("content-type", "").startswith("application/offset+octet-stream"):
+            raise HTTPException(status_code=415, detail="Expected application/offset+octet-stream")
+        try:
+            async with resumable_uploads.open(upload_id, owner_id) as upload:
+                state = upload.state
+                if state.attachment_id is not None:
+                    if offset != state.size:
+                        raise HTTPException(status_code=409, detail="Upload is already complete", headers={"Upload-Offset": str(state.size)})
+                    return ResumableUploadGetting.model_validate(state)
+                await upload.append(offset, request.stream())
+                if state.offset == state.size:
+                    blob = await upload.commit()
+                    attachment = await DefectAttachmentRepos.create_uploaded_attachment({
+                        "file_path": blob.digest,
+                        "file_name": state.file_name,
+                        "content_type": state.content_type,
+                        "size": blob.size,
+                        "defect_id": state.defect_id,
+                    }, session)
+                    await session.commit()
+                    await upload.finish(attachment.id)
+                    derivative_pipeline.schedule(attachment.file_path, attachment.content_type)
+                return ResumableUploadGetting.model_validate(state)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to append upload: {str(e)}")
+
+    @staticmethod
+    async def collect_orphan_blobs(session: AsyncSession, grace: float = ATTACHMENT_ORPHAN_GRACE_SECONDS) -> int:
+        """Удаляет содержимое, на которое не ссылается ни одно вложение и которое не трогали дольше grace.
+
+        Запрос не удаляет свои файлы при ошибке - одинаковое содержимое может разделять
+        параллельная загрузка. Сироты (отклонённые загрузки, удалённые вложения) убираются здесь.
+        """
+        before = time.time() - grace
+        stale = await attachment_storage.stale_digests(before)
+        removed = 0
+        for offset in range(0, len(stale), 1000):
+            batch = stale[offset:offset + 1000]
+            referenced = await DefectAttachmentRepos.referenced_digests(batch, session)
+            for digest in batch:
+                if digest not in referenced and await attachment_storage.delete_stale(digest, before):
+                    removed += 1
+        return removed
+
+    @staticmethod
+    async def delete_upload(upload_id: str, owner_id: int):
+        await resumable_uploads.delete(upload_id, owner_id)
+
     @staticmethod
     async def update_attachment(attachment_id: int, attachment_data: DefectAttachmentUpdate, session: AsyncSession = Depends(get_session)) -> DefectAttachmentGetting:
         attachment = await DefectAttachmentRepos.update_attachment(attachment_id, attachment_data, session)
         if not attachment:
             raise HTTPException(status_code=404, detail="Attachment not found")
+        await session.commit()
         return attachment
 
     @staticmethod
@@ -41,11 +193,18 @@ class DefectAttachmentService:
         success = await DefectAttachmentRepos.delete_attachment(attachment_id, session)
         if not success:
             raise HTTPException(status_code=404, detail="Attachment not found")
+        await session.commit()
         return {"message": "Attachment deleted successfully"}
 
     @staticmethod
-    async def get_attachments_by_defect(defect_id: int, session: AsyncSession = Depends(get_session)) -> List[DefectAttachmentGetting]:
+    async def get_attachments_by_defect(defect_id: int, session: AsyncSession = Depends(get_session), limit: int = 100, offset: int = 0, cursor: Optional[str] = None, sort: str = "id") -> List[DefectAttachmentGetting]:
         try:
-            return await DefectAttachmentRepos.get_attachments_by_defect(defect_id, session)
+            return await DefectAttachmentRepos.get_attachments_by_defect(defect_id, session, limit=limit, offset=offset, cursor=cursor, sort=sort)
+        except HTTPException:
+            raise
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to get defect attachments: {str(e)}")
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=f"Failed to get defect attachments: {str(e)}")
+
+    @staticmethod
+    def stream_attachments_by_defect(defect_id: int, session: AsyncSession, sort: str = "id") -> AsyncIterator[DefectAttachmentGetting]:
+        return DefectAttachmentRepos.stream_attachments_by_defect(defect_id, session, sort=sort)
\ No newline at end of file
@@ -25,6 +25,8 @@ class AuthService:
         user = await AuthService.get_user_profile(user_id, session)
         if not user:
             raise HTTPException(status_code=404)
+        # Регистрация и чтение профиля выполняются в одной транзакции
+        await session.commit()
         return user.id
 
     @staticmethod
@@ -1,17 +1,20 @@
-from typing import List
+from typing import AsyncIterator, List, Optional
 from fastapi import HTTPException, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database.settings import get_session
+from app.core.projection import Projection
 from app.repository.comment_repos import CommentRepos
 from app.schemas.comment import CommentCreate, CommentUpdate, CommentGetting
 
 class CommentService:
 
     @staticmethod
-    async def get_all_comments(limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session)) -> List[CommentGetting]:
+    async def get_all_comments(limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session), cursor: Optional[str] = None, sort: str = "id", projection: Optional[Projection] = None) -> List[CommentGetting]:
         try:
-            return await CommentRepos.get_all_comments(limit=limit, offset=offset, session=session)
+            return await CommentRepos.get_all_comments(limit=limit, offset=offset, session=session, cursor=cursor, sort=sort, projection=projection)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to get comments: {str(e)}")
 
@@ -25,7 +28,9 @@ class CommentService:
     @staticmethod
     async def create_comment(comment_data: CommentCreate, session: AsyncSession = Depends(get_session)) -> CommentGetting:
         try:
-            return await CommentRepos.create_comment(comment_data, session)
+            comment = await CommentRepos.create_comment(comment_data, session)
+            await session.commit()
+            return comment
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to create comment: {str(e)}")
 
@@ -34,6 +39,7 @@ class CommentService:
         comment = await CommentRepos.update_comment(comment_id, comment_data, session)
         if not comment:
             raise HTTPException(status_code=404, detail="Comment not found")
+        await session.commit()
         return comment
 
     @staticmethod
@@ -41,18 +47,31 @@ class CommentService:
         success = await CommentRepos.delete_comment(comment_id, session)
         if not success:
             raise HTTPException(status_code=404, detail="Comment not found")
+        await session.commit()
         return {"message": "Comment deleted successfully"}
 
     @staticmethod
-    async def get_comments_by_defect(defect_id: int, session: AsyncSession = Depends(get_session)) -> List[CommentGetting]:
+    async def get_comments_by_defect(defect_id: int, session: AsyncSession = Depends(get_session), limit: int = 100, offset: int = 0, cursor: Optional[str] = None, sort: str = "id", projection: Optional[Projection] = None) -> List[CommentGetting]:
         try:
-            return await CommentRepos.get_comments_by_defect(defect_id, session)
+            return await CommentRepos.get_comments_by_defect(defect_id, session, limit=limit, offset=offset, cursor=cursor, sort=sort, projection=projection)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to get defect comments: {str(e)}")
 
     @staticmethod
-    async def get_comments_by_author(author_id: int, session: AsyncSession = Depends(get_session)) -> List[CommentGetting]:
+    def stream_comments_by_defect(defect_id: int, session: AsyncSession, sort: str = "id") -> AsyncIterator[CommentGetting]:
+        return CommentRepos.stream_comments_by_defect(defect_id, session, sort=sort)
+
+    @staticmethod
+    async def get_comments_by_author(author_id: int, session: AsyncSession = Depends(get_session), limit: int = 100, offset: int = 0, cursor: Optional[str] = None, sort: str = "id", projection: Optional[Projection] = None) -> List[CommentGetting]:
         try:
-            return await CommentRepos.get_comments_by_author(author_id, session)
+            return await CommentRepos.get_comments_by_author(author_id, session, limit=limit, offset=offset, cursor=cursor, sort=sort, projection=projection)
+        except HTTPException:
+            raise
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to get user comments: {str(e)}")
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=f"Failed to get user comments: {str(e)}")
+
+    @staticmethod
+    def stream_comments_by_author(author_id: int, session: AsyncSession, sort: str = "id") -> AsyncIterator[CommentGetting]:
+        return CommentRepos.stream_comments_by_author(author_id, session, sort=sort)
\ No newline at end of file
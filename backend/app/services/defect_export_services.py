@@ -0,0 +1,36 @@
+import enum
+from typing import AsyncIterator, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.export import CSV_MEDIA_TYPE, XLSX_MEDIA_TYPE, csv_parts, xlsx_parts
+from app.repository.defect_repos import DefectRepos
+from app.schemas.defect import DefectFilter
+
+# Имена колонок совпадают с полями импорта, поэтому выгрузку можно загрузить обратно через /defects/bulk
+EXPORT_HEADER = (
+    "id", "title", "description", "status", "priority",
+    "project_id", "project", "created_by_id", "created_by", "assigned_to_id", "assigned_to",
+)
+
+EXPORT_FORMATS = {
+    "csv": (CSV_MEDIA_TYPE, csv_parts),
+    "xlsx": (XLSX_MEDIA_TYPE, xlsx_parts),
+}
+
+
+async def _plain_rows(batches: AsyncIterator[list]) -> AsyncIterator[list]:
+    async for rows in batches:
+        yield [[value.value if isinstance(value, enum.Enum) else value for value in row] for row in rows]
+
+
+class DefectExportService:
+
+    @staticmethod
+    def export_defects(export_format: str, filters: Optional[DefectFilter], session: AsyncSession) -> Tuple[str, AsyncIterator[bytes]]:
+        """Возвращает (media type, тело ответа); строки читаются из БД по мере отправки."""
+        media_type, writer = EXPORT_FORMATS[export_format]
+        rows = _plain_rows(DefectRepos.stream_export_rows(filters, session))
+        if export_format == "xlsx":
+            return media_type, writer(EXPORT_HEADER, rows, sheet_name="Defects")
+        return media_type, writer(EXPORT_HEADER, rows)
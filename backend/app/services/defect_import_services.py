@@ -0,0 +1,192 @@
+import codecs
+import csv
+import io
+import json
+from typing import AsyncIterator, Iterator, List, Tuple
+
+from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import BULK_IMPORT_BATCH_SIZE, BULK_IMPORT_MAX_ERRORS
+from app.core.export import unguard_csv_value
+from app.models.project import Project
+from app.models.user import User
+from app.repository.base_repos import existing_ids
+from app.repository.defect_repos import DefectRepos
+from app.schemas.defect import DefectCreate, DefectImportResult, DefectImportRowError
+
+MAX_JSON_ROW_BYTES = 1024 * 1024  # Один объект в JSON массиве не может быть больше
+
+Row = Tuple[int, dict]
+
+
+async def iter_json_array(stream: AsyncIterator[bytes]) -> AsyncIterator[Row]:
+    """Разбирает JSON массив объектов по мере поступления тела запроса."""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = finished = False
+    index = 0
+
+    async for chunk in stream:
+        buffer += text_decoder.decode(chunk)
+        position = 0
+        while not finished:
+            while position < len(buffer) and (buffer[position].isspace() or (started and buffer[position] == ",")):
+                position += 1
+            if position >= len(buffer):
+                break
+            if not started:
+                if buffer[position] != "[":
+                    raise HTTPException(status_code=400, detail="JSON body must be an array of defects")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                finished = True
+                position += 1
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break  # Объект ещё не пришёл целиком
+            index += 1
+            yield index, item
+        buffer = buffer[position:]
+        if len(buffer) > MAX_JSON_ROW_BYTES:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON after row {index}")
+
+    if not finished or buffer.strip():
+        raise HTTPException(status_code=400, detail=f"Invalid JSON after row {index}")
+
+
+def iter_csv_rows(file) -> Iterator[Row]:
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    header = text.readline()
+    # По одной строке заголовка надёжно угадывается только разделитель; кавычки - как в Excel и нашем экспорте
+    try:
+        delimiter = csv.Sniffer().sniff(header, delimiters=",;\t").delimiter
+    except csv.Error:
+        delimiter = ","
+    fieldnames = next(csv.reader([header], delimiter=delimiter))
+    reader = csv.DictReader(text, fieldnames=[name.strip() for name in fieldnames], delimiter=delimiter)
+    try:
+        for index, row in enumerate(reader, start=1):
+            # CSV мог быть получен экспортом, который экранирует формулы апострофом
+            yield index, {key: unguard_csv_value(value) for key, value in row.items()}
+    finally:
+        text.detach()
+
+
+def iter_xlsx_rows(file) -> Iterator[Row]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise HTTPException(status_code=415, detail="XLSX import requires openpyxl")
+
+    # read_only режим читает лист построчно, не загружая его целиком
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(name).strip() if name is not None else "" for name in next(rows, ())]
+        for index, values in enumerate(rows, start=1):
+            if all(value is None for value in values):
+                continue
+            yield index, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+async def _aiter(rows: Iterator[Row]) -> AsyncIterator[Row]:
+    for row in rows:
+        yield row
+
+
+def _clean_row(row):
+    if not isinstance(row, dict):
+        return row
+    cleaned = {}
+    for key, value in row.items():
+        if isinstance(value, str):
+            value = value.strip()
+        if key and value not in ("", None):
+            cleaned[key.strip()] = value
+    return cleaned
+
+
+def _format_errors(error: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}" for item in error.errors()]
+
+
+class DefectImportService:
+
+    @staticmethod
+    def rows_from_upload(upload: UploadFile) -> AsyncIterator[Row]:
+        filename = (upload.filename or "").lower()
+        if filename.endswith(".csv") or upload.content_type == "text/csv":
+            return _aiter(iter_csv_rows(upload.file))
+        if filename.endswith(".xlsx"):
+            return _aiter(iter_xlsx_rows(upload.file))
+        raise HTTPException(status_code=415, detail="Only CSV and XLSX files are supported")
+
+    @staticmethod
+    def rows_from_json(stream: AsyncIterator[bytes]) -> AsyncIterator[Row]:
+        return iter_json_array(stream)
+
+    @staticmethod
+    async def import_defects(rows: AsyncIterator[Row], created_by_id: int, session: AsyncSession) -> DefectImportResult:
+        result = DefectImportResult(created=0, failed=0, errors=[])
+        known_projects, known_users = set(), set()
+        batch = []
+
+        async for row_number, row in rows:
+            try:
+                defect = DefectCreate.model_validate(_clean_row(row))
+            except ValidationError as e:
+                DefectImportService._add_error(result, row_number, _format_errors(e))
+                continue
+            batch.append((row_number, {**defect.model_dump(), "created_by_id": created_by_id}))
+            if len(batch) >= BULK_IMPORT_BATCH_SIZE:
+                await DefectImportService._write_batch(batch, result, known_projects, known_users, session)
+                batch = []
+
+        await DefectImportService._write_batch(batch, result, known_projects, known_users, session)
+        await session.commit()
+        result.errors.sort(key=lambda error: error.row)
+        return result
+
+    @staticmethod
+    async def _write_batch(batch: list, result: DefectImportResult, known_projects: set, known_users: set, session: AsyncSession):
+        if not batch:
+            return
+        # Проверяем ссылки заранее, чтобы вернуть ошибку по строке, а не падение всей пачки
+        known_projects |= await existing_ids(session, Project, {values["project_id"] for _, values in batch} - known_projects)
+        known_users |= await existing_ids(
+            session, User, {values["assigned_to_id"] for _, values in batch if values["assigned_to_id"]} - known_users
+        )
+
+        valid = []
+        for row_number, values in batch:
+            errors = []
+            if values["project_id"] not in known_projects:
+                errors.append(f"project_id: project {values['project_id']} not found")
+            if values["assigned_to_id"] and values["assigned_to_id"] not in known_users:
+                errors.append(f"assigned_to_id: user {values['assigned_to_id']} not found")
+            if errors:
+                DefectImportService._add_error(result, row_number, errors)
+            else:
+                valid.append((row_number, values))
+
+        try:
+            async with session.begin_nested():
+                result.created += await DefectRepos.bulk_insert_defects([values for _, values in valid], session)
+        except Exception as e:
+            for row_number, _ in valid:
+                DefectImportService._add_error(result, row_number, [f"Failed to insert batch: {str(e)}"])
+
+    @staticmethod
+    def _add_error(result: DefectImportResult, row_number: int, errors: List[str]):
+        result.failed += 1
+        if len(result.errors) < BULK_IMPORT_MAX_ERRORS:
+            result.errors.append(DefectImportRowError(row=row_number, errors=errors))
@@ -1,17 +1,24 @@
-from typing import List
+from typing import AsyncIterator, List, Optional
 from fastapi import HTTPException, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database.settings import get_session
+from app.core.projection import Projection
+from app.models.defects import Defect
+from app.repository.base_repos import existing_ids
 from app.repository.defect_repos import DefectRepos
-from app.schemas.defect import DefectCreate, DefectUpdate, DefectGetting
+from app.repository.defect_history_repos import DefectHistoryRepos
+from app.schemas.defect import DefectCreate, DefectUpdate, DefectGetting, DefectFilter, DefectFull
+from app.schemas.defect_history import DefectStatusEventGetting
 
 class DefectService:
 
     @staticmethod
-    async def get_all_defects(limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session)) -> List[DefectGetting]:
+    async def get_all_defects(limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session), cursor: Optional[str] = None, sort: str = "id", filters: Optional[DefectFilter] = None, projection: Optional[Projection] = None) -> List[DefectGetting]:
         try:
-            return await DefectRepos.get_all_defects(limit=limit, offset=offset, session=session)
+            return await DefectRepos.get_all_defects(limit=limit, offset=offset, session=session, cursor=cursor, sort=sort, filters=filters, projection=projection)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to get defects: {str(e)}")
 
@@ -22,18 +29,44 @@ class DefectService:
             raise HTTPException(status_code=404, detail="Defect not found")
         return defect
 
+    @staticmethod
+    async def get_defect_full(defect_id: int, session: AsyncSession) -> DefectFull:
+        try:
+            defect = await DefectRepos.get_defect_full(defect_id, session)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to get defect: {str(e)}")
+        if not defect:
+            raise HTTPException(status_code=404, detail="Defect not found")
+        return defect
+
+    @staticmethod
+    async def get_defect_history(defect_id: int, session: AsyncSession, limit: int = 100, offset: int = 0, cursor: Optional[str] = None, sort: str = "id") -> List[DefectStatusEventGetting]:
+        try:
+            events = await DefectHistoryRepos.get_events(defect_id, session, limit=limit, offset=offset, cursor=cursor, sort=sort)
+            # Пустая страница - либо история кончилась, либо дефекта нет; проверяем только в этом случае
+            if not events and not await existing_ids(session, Defect, {defect_id}):
+                raise HTTPException(status_code=404, detail="Defect not found")
+            return events
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to get defect history: {str(e)}")
+
     @staticmethod
     async def create_defect(defect_data: DefectCreate, session: AsyncSession = Depends(get_session)) -> DefectGetting:
         try:
-            return await DefectRepos.create_defect(defect_data, session)
+            defect = await DefectRepos.create_defect(defect_data, session)
+            await session.commit()
+            return defect
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to create defect: {str(e)}")
 
     @staticmethod
-    async def update_defect(defect_id: int, defect_data: DefectUpdate, session: AsyncSession = Depends(get_session)) -> DefectGetting:
-        defect = await DefectRepos.update_defect(defect_id, defect_data, session)
+    async def update_defect(defect_id: int, defect_data: DefectUpdate, session: AsyncSession = Depends(get_session), changed_by_id: Optional[int] = None) -> DefectGetting:
+        defect = await DefectRepos.update_defect(defect_id, defect_data, session, changed_by_id=changed_by_id)
         if not defect:
             raise HTTPException(status_code=404, detail="Defect not found")
+        await session.commit()
         return defect
 
     @staticmethod
@@ -41,18 +74,31 @@ class DefectService:
         success = await DefectRepos.delete_defect(defect_id, session)
         if not success:
             raise HTTPException(status_code=404, detail="Defect not found")
+        await session.commit()
         return {"message": "Defect deleted successfully"}
 
     @staticmethod
-    async def get_defects_by_project(project_id: int, session: AsyncSession = Depends(get_session)) -> List[DefectGetting]:
+    async def get_defects_by_project(project_id: int, session: AsyncSession = Depends(get_session), limit: int = 100, offset: int = 0, cursor: Optional[str] = None, sort: str = "id", projection: Optional[Projection] = None) -> List[DefectGetting]:
         try:
-            return await DefectRepos.get_defects_by_project(project_id, session)
+            return await DefectRepos.get_defects_by_project(project_id, session, limit=limit, offset=offset, cursor=cursor, sort=sort, projection=projection)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to get project defects: {str(e)}")
 
     @staticmethod
-    async def get_defects_by_assignee(user_id: int, session: AsyncSession = Depends(get_session)) -> List[DefectGetting]:
+    def stream_defects_by_project(project_id: int, session: AsyncSession, sort: str = "id") -> AsyncIterator[DefectGetting]:
+        return DefectRepos.stream_defects_by_project(project_id, session, sort=sort)
+
+    @staticmethod
+    async def get_defects_by_assignee(user_id: int, session: AsyncSession = Depends(get_session), limit: int = 100, offset: int = 0, cursor: Optional[str] = None, sort: str = "id", projection: Optional[Projection] = None) -> List[DefectGetting]:
         try:
-            return await DefectRepos.get_defects_by_assignee(user_id, session)
+            return await DefectRepos.get_defects_by_assignee(user_id, session, limit=limit, offset=offset, cursor=cursor, sort=sort, projection=projection)
+        except HTTPException:
+            raise
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to get user defects: {str(e)}")
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=f"Failed to get user defects: {str(e)}")
+
+    @staticmethod
+    def stream_defects_by_assignee(user_id: int, session: AsyncSession, sort: str = "id") -> AsyncIterator[DefectGetting]:
+        return DefectRepos.stream_defects_by_assignee(user_id, session, sort=sort)
\ No newline at end of file
@@ -1,23 +1,26 @@
-from typing import List
+from typing import List, Optional
 from fastapi import HTTPException, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database.settings import get_session
+from app.core.projection import Projection
 from app.repository.project_repos import ProjectRepos
 from app.schemas.projects import ProjectCreate, ProjectUpdate, ProjectGetting
 
 class ProjectService:
 
     @staticmethod
-    async def get_all_projects(limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session)) -> List[ProjectGetting]:
+    async def get_all_projects(limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session), cursor: Optional[str] = None, sort: str = "id", projection: Optional[Projection] = None) -> List[ProjectGetting]:
         try:
-            return await ProjectRepos.get_all_projects(limit=limit, offset=offset, session=session)
+            return await ProjectRepos.get_all_projects(limit=limit, offset=offset, session=session, cursor=cursor, sort=sort, projection=projection)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to get projects: {str(e)}")
 
     @staticmethod
-    async def get_project_by_id(project_id: int, session: AsyncSession = Depends(get_session)) -> ProjectGetting:
-        project = await ProjectRepos.get_project_by_id(project_id, session)
+    async def get_project_by_id(project_id: int, session: AsyncSession = Depends(get_session), version: Optional[int] = None) -> ProjectGetting:
+        project = await ProjectRepos.get_project_by_id(project_id, session, version)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
         return project
@@ -25,7 +28,9 @@ class ProjectService:
     @staticmethod
     async def create_project(project_data: ProjectCreate, session: AsyncSession = Depends(get_session)) -> ProjectGetting:
         try:
-            return await ProjectRepos.create_project(project_data, session)
+            project = await ProjectRepos.create_project(project_data, session)
+            await session.commit()
+            return project
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to create project: {str(e)}")
 
@@ -34,6 +39,7 @@ class ProjectService:
         project = await ProjectRepos.update_project(project_id, project_data, session)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
+        await session.commit()
         return project
 
     @staticmethod
@@ -41,4 +47,5 @@ class ProjectService:
         success = await ProjectRepos.delete_project(project_id, session)
         if not success:
             raise HTTPException(status_code=404, detail="Project not found")
+        await session.commit()
         return {"message": "Project deleted successfully"}
\ No newline at end of file
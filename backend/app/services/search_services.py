@@ -0,0 +1,21 @@
+from typing import List, Optional
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.repository.search_repos import SearchRepos
+from app.schemas.search import SearchHit
+
+class SearchService:
+
+    @staticmethod
+    async def search(q: str, session: AsyncSession, limit: int = 20, cursor: Optional[str] = None) -> List[SearchHit]:
+        try:
+            return await SearchRepos.search(q, session, limit=limit, cursor=cursor)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to search: {str(e)}")
+
+    @staticmethod
+    def next_cursor(hits: List[SearchHit], limit: int) -> Optional[str]:
+        return SearchRepos.next_cursor(hits, limit)
@@ -4,14 +4,18 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database.settings import get_session
 from app.repository.user_repos import UserRepos
+from app.repository.defect_repos import DefectRepos
+from app.repository.defect_history_repos import DefectHistoryRepos
 from app.schemas.user import UserCreate, UserUpdate, UserGetting
 
 class UserService:
 
     @staticmethod
-    async def get_all_users(limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session)) -> List[UserGetting]:
+    async def get_all_users(limit: int = 100, offset: int = 0, session: AsyncSession = Depends(get_session), cursor: Optional[str] = None, sort: str = "id") -> List[UserGetting]:
         try:
-            return await UserRepos.get_all_users(limit=limit, offset=offset, session=session)
+            return await UserRepos.get_all_users(limit=limit, offset=offset, session=session, cursor=cursor, sort=sort)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to get users: {str(e)}")
 
@@ -25,7 +29,9 @@ class UserService:
     @staticmethod
     async def create_user(user_data: UserCreate, session: AsyncSession = Depends(get_session)) -> UserGetting:
         try:
-            return await UserRepos.create_user(user_data, session)
+            user = await UserRepos.create_user(user_data, session)
+            await session.commit()
+            return user
         except HTTPException:
             raise
         except Exception as e:
@@ -36,11 +42,19 @@ class UserService:
         user = await UserRepos.update_user(user_id, user_data, session)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
+        await session.commit()
         return user
 
     @staticmethod
     async def delete_user(user_id: int, session: AsyncSession = Depends(get_session)) -> dict:
+        # DELETE без ORM не обновляет ссылки на пользователя: делаем это в той же транзакции.
+        # Обязательные ссылки (автор, менеджер) обнулить нельзя - такого пользователя не удаляем
+        if await UserRepos.owns_records(user_id, session):
+            raise HTTPException(status_code=409, detail="User owns defects, comments or projects")
+        await DefectRepos.unassign_user(user_id, session)
+        await DefectHistoryRepos.forget_user(user_id, session)
         success = await UserRepos.delete_user(user_id, session)
         if not success:
             raise HTTPException(status_code=404, detail="User not found")
+        await session.commit()
         return {"message": "User deleted successfully"}
\ No newline at end of file
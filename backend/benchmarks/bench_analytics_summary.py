@@ -0,0 +1,85 @@
+"""Сводка для dashboard: defect_counts против GROUP BY по defects при росте таблицы.
+
+50 одновременных запросов /analytics/summary?group_by=project&group_by=status&group_by=priority
+и тот же отчёт прямым GROUP BY по defects.
+
+    python -m benchmarks.bench_analytics_summary --sizes 10000 200000 --concurrency 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import func, insert, select
+
+from benchmarks.common import sqlite_app, create_bench_user
+from app.models.defects import Defect, DefectStatus, DefectPriority
+from app.models.project import Project
+from app.repository.analytics_repos import AnalyticsRepos
+
+SUMMARY_URL = "/analytics/summary?group_by=project&group_by=status&group_by=priority"
+
+
+async def timed(call) -> float:
+    started = time.perf_counter()
+    await call()
+    return time.perf_counter() - started
+
+
+def report(name: str, latencies: list):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"  {name:<10} p50 {statistics.median(latencies) * 1000:7.1f} ms   p99 {p99 * 1000:7.1f} ms")
+
+
+async def run(sizes: list, concurrency: int):
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, headers = await create_bench_user(make_session)
+        async with make_session() as session:
+            projects = [Project(name=f"Объект {i}", manager_id=user_id) for i in range(20)]
+            session.add_all(projects)
+            await session.commit()
+            project_ids = [project.id for project in projects]
+
+        statuses, priorities = list(DefectStatus), list(DefectPriority)
+        filled = 0
+        for size in sizes:
+            async with make_session() as session:
+                for start in range(filled, size, 10000):
+                    await session.execute(insert(Defect), [
+                        {"title": f"Defect {i}", "project_id": project_ids[i % 20], "created_by_id": user_id,
+                         "status": statuses[i % 5], "priority": priorities[i % 4]}
+                        for i in range(start, min(size, start + 10000))
+                    ])
+                # Строки вставлены мимо репозитория, счётчики досчитывает сверка
+                await AnalyticsRepos.reconcile(session)
+                await session.commit()
+            filled = size
+
+            async def rollup():
+                response = await client.get(SUMMARY_URL, headers=headers)
+                assert response.json()["total"] == size
+
+            async def group_by():
+                async with make_session() as session:
+                    await session.execute(
+                        select(Defect.project_id, Defect.status, Defect.priority, func.count())
+                        .group_by(Defect.project_id, Defect.status, Defect.priority)
+                    )
+
+            print(f"defects={size}, {concurrency} concurrent requests")
+            for name, call in (("rollup", rollup), ("group by", group_by)):
+                latencies = await asyncio.gather(*(timed(call) for _ in range(concurrency)))
+                report(name, latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 200000])
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(sorted(args.sizes), args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Массовый импорт дефектов через POST /defects/bulk: строк в секунду и пиковый RSS.
+
+На SQLite работает многострочный INSERT; с DATABASE_URL на Postgres импорт идёт через COPY.
+
+    python -m benchmarks.bench_bulk_import --rows 50000
+"""
+import argparse
+import asyncio
+import json
+import resource
+import tempfile
+import time
+
+from benchmarks.common import sqlite_app, create_bench_user
+from app.models.project import Project
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def json_body(rows: int, project_id: int):
+    yield b"["
+    for i in range(rows):
+        row = {"title": f"Defect {i}", "description": "Трещина в стене", "priority": "high", "project_id": project_id}
+        yield (b"," if i else b"") + json.dumps(row).encode()
+    yield b"]"
+
+
+async def run(rows: int):
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, headers = await create_bench_user(make_session)
+        async with make_session() as session:
+            project = Project(name="Bench", manager_id=user_id)
+            session.add(project)
+            await session.commit()
+            project_id = project.id
+
+        started = time.perf_counter()
+        response = await client.post(
+            "/defects/bulk", content=json_body(rows, project_id),
+            headers={**headers, "content-type": "application/json"}, timeout=None
+        )
+        assert response.json()["created"] == rows, response.text
+        print(f"json: {rows / (time.perf_counter() - started):,.0f} rows/s, peak RSS {peak_rss_mb():.0f} MB")
+
+        with tempfile.TemporaryFile() as file:
+            file.write(b"title,description,priority,project_id\n")
+            for i in range(rows):
+                file.write(f"Defect {i},Трещина в стене,low,{project_id}\n".encode())
+            file.seek(0)
+            started = time.perf_counter()
+            response = await client.post(
+                "/defects/bulk", files={"file": ("defects.csv", file, "text/csv")}, headers=headers, timeout=None
+            )
+        assert response.json()["created"] == rows, response.text
+        print(f"csv:  {rows / (time.perf_counter() - started):,.0f} rows/s, peak RSS {peak_rss_mb():.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50000)
+    args = parser.parse_args()
+    print(f"baseline peak RSS {peak_rss_mb():.0f} MB")
+    asyncio.run(run(args.rows))
+
+
+if __name__ == "__main__":
+    main()
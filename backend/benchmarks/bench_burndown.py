@@ -0,0 +1,105 @@
+"""Burndown проекта: дневные корзины против подсчёта по defects и журналу статусов.
+
+Заполняет defects (created_at за год) и defect_status_events с закрытиями и
+переоткрытиями, замеряет пересборку корзин (backfill), ответ /burndown из корзин
+и тот же ряд, посчитанный GROUP BY по сырым таблицам на каждый запрос.
+
+    python -m benchmarks.bench_burndown --defects 200000
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, text
+
+from benchmarks.common import sqlite_app, create_bench_user
+from app.models.defects import Defect, DefectStatus
+from app.models.defect_history import DefectStatusEvent
+from app.models.project import Project
+from app.services.analytics_services import AnalyticsService
+
+PROJECTS = 20
+DAYS = 365
+
+# Открытые на каждый день: созданные до дня минус закрытые плюс переоткрытые до дня
+NAIVE_QUERY = text("""
+    SELECT day,
+        (SELECT count(*) FROM defects d WHERE d.project_id = :project_id AND date(d.created_at) = day),
+        (SELECT count(*) FROM defect_status_events e JOIN defects d ON d.id = e.defect_id
+         WHERE d.project_id = :project_id AND date(e.changed_at) = day
+           AND e.to_status IN ('CLOSED', 'CANCELLED') AND e.from_status NOT IN ('CLOSED', 'CANCELLED')),
+        (SELECT count(*) FROM defect_status_events e JOIN defects d ON d.id = e.defect_id
+         WHERE d.project_id = :project_id AND date(e.changed_at) = day
+           AND e.from_status IN ('CLOSED', 'CANCELLED') AND e.to_status NOT IN ('CLOSED', 'CANCELLED'))
+    FROM (SELECT DISTINCT date(created_at) AS day FROM defects WHERE project_id = :project_id)
+    ORDER BY day
+""")
+
+
+async def timed(name: str, call, repeat: int = 1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = await call()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"  {name:<36} {elapsed * 1000:10.1f} ms")
+    return result
+
+
+async def run(defects: int):
+    random.seed(1)
+    started_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, headers = await create_bench_user(make_session)
+        async with make_session() as session:
+            projects = [
+                Project(name=f"Объект {i}", manager_id=user_id, start_date=started_at, end_date=started_at + timedelta(days=DAYS - 1))
+                for i in range(PROJECTS)
+            ]
+            session.add_all(projects)
+            await session.flush()
+            project_ids = [project.id for project in projects]
+            events_total = 0
+            for start in range(0, defects, 10000):
+                rows, events = [], []
+                for defect_id in range(start + 1, min(defects, start + 10000) + 1):
+                    created_at = started_at + timedelta(seconds=random.uniform(0, DAYS * 86400))
+                    status, changed_at = DefectStatus.NEW, created_at
+                    # Закрытие и иногда переоткрытие с повторным закрытием
+                    for to_status in (DefectStatus.CLOSED, DefectStatus.IN_PROGRESS, DefectStatus.CLOSED)[:random.choice([0, 1, 1, 3])]:
+                        seconds = random.expovariate(1 / (7 * 86400))
+                        changed_at += timedelta(seconds=seconds)
+                        events.append({"defect_id": defect_id, "from_status": status, "to_status": to_status,
+                                       "changed_at": changed_at, "from_seconds": seconds})
+                        status = to_status
+                    rows.append({"title": f"Defect {defect_id}", "project_id": project_ids[defect_id % PROJECTS],
+                                 "created_by_id": user_id, "created_at": created_at, "status": status})
+                await session.execute(insert(Defect), rows)
+                if events:
+                    await session.execute(insert(DefectStatusEvent), events)
+                events_total += len(events)
+            await session.commit()
+        print(f"defects={defects}, events={events_total}, days={DAYS}")
+
+        async with make_session() as session:
+            buckets = await timed("backfill buckets", lambda: AnalyticsService.backfill_burndown(session))
+            print(f"  buckets={buckets}")
+            project_id = project_ids[0]
+            await timed("burndown (daily buckets)", lambda: AnalyticsService.get_burndown(project_id, session), repeat=5)
+            await timed("burndown (GROUP BY raw tables)", lambda: session.execute(NAIVE_QUERY, {"project_id": project_id}), repeat=1)
+
+        response = await client.get(f"/analytics/projects/{project_ids[0]}/burndown", headers=headers)
+        print(f"  GET /burndown -> {response.status_code}, {len(response.json()['open'])} points")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--defects", type=int, default=200000)
+    args = parser.parse_args()
+    asyncio.run(run(args.defects))
+
+
+if __name__ == "__main__":
+    main()
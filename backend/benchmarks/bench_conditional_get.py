@@ -0,0 +1,61 @@
+"""Повторный GET списка дефектов: полный ответ против 304 по If-None-Match.
+
+    python -m benchmarks.bench_conditional_get --rows 100000 --limit 1000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import insert
+
+from benchmarks.common import sqlite_app, create_bench_user
+from app.models.defects import Defect
+from app.models.project import Project
+
+
+async def measure(client, path: str, headers: dict, counter, repeats: int):
+    samples, statements = [], []
+    for _ in range(repeats):
+        counter.reset()
+        started = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        samples.append(time.perf_counter() - started)
+        statements.append(counter.count)
+    return response, statistics.median(samples) * 1000, statistics.median(statements)
+
+
+async def run(rows: int, limit: int, repeats: int):
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, headers = await create_bench_user(make_session)
+        async with make_session() as session:
+            project = Project(name="Bench", manager_id=user_id)
+            session.add(project)
+            await session.flush()
+            for start in range(0, rows, 10000):
+                await session.execute(insert(Defect), [
+                    {"title": f"Defect {i}", "description": "Описание дефекта " * 5, "project_id": project.id, "created_by_id": user_id}
+                    for i in range(start, min(rows, start + 10000))
+                ])
+            await session.commit()
+
+        path = f"/defects/project/{project.id}?limit={limit}"
+        full, full_ms, full_statements = await measure(client, path, headers, counter, repeats)
+        etag = full.headers["etag"]
+        cached, cached_ms, cached_statements = await measure(client, path, {**headers, "If-None-Match": etag}, counter, repeats)
+        print(f"rows={rows}, limit={limit}")
+        print(f"  200 full list      {full_ms:8.2f} ms  {full_statements} statements  {len(full.content)} bytes")
+        print(f"  304 If-None-Match  {cached_ms:8.2f} ms  {cached_statements} statements  {len(cached.content)} bytes (status {cached.status_code})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.limit, args.repeats))
+
+
+if __name__ == "__main__":
+    main()
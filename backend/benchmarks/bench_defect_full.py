@@ -0,0 +1,88 @@
+"""Открытие страницы дефекта: GET /defects/{id}/full против отдельных запросов к API.
+
+Раньше страница запрашивала дефект, комментарии, вложения, проект и каждого автора
+отдельно; каждый вызов - своя проверка токена и свои запросы к БД.
+
+    python -m benchmarks.bench_defect_full --comments 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.common import sqlite_app, create_bench_user
+from app.core.entity_cache import ENTITY_CACHES
+from app.models.attachment import DefectAttachment
+from app.models.comment import Comment
+from app.models.defects import Defect
+from app.models.project import Project
+from app.models.user import User, UserRole
+
+AUTHORS = 10
+
+
+async def separate_calls(client, headers: dict, defect_id: int) -> int:
+    calls = 0
+
+    async def get(path: str):
+        nonlocal calls
+        calls += 1
+        response = await client.get(path, headers=headers)
+        return response.json()
+
+    defect, comments, _ = await asyncio.gather(
+        get(f"/defects/{defect_id}"), get(f"/comments/defect/{defect_id}"), get(f"/attachments/defect/{defect_id}"),
+    )
+    people = {defect["created_by_id"], defect["assigned_to_id"], *(comment["author_id"] for comment in comments)}
+    await asyncio.gather(get(f"/projects/{defect['project_id']}"), *(get(f"/users/{user_id}") for user_id in people))
+    return calls
+
+
+async def run(comments: int, repeats: int):
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, headers = await create_bench_user(make_session)
+        async with make_session() as session:
+            authors = [User(email=f"author{i}@example.com", name=f"Author {i}", password_hash="x", role=UserRole.ENGINEER) for i in range(AUTHORS)]
+            project = Project(name="Bench", manager_id=user_id)
+            session.add_all([*authors, project])
+            await session.flush()
+            defect = Defect(title="Трещина", project_id=project.id, created_by_id=user_id, assigned_to_id=authors[0].id)
+            session.add(defect)
+            await session.flush()
+            session.add_all([Comment(text=f"Комментарий {i}", defect_id=defect.id, author_id=authors[i % AUTHORS].id) for i in range(comments)])
+            session.add_all([DefectAttachment(file_path=f"/files/{i}.jpg", defect_id=defect.id) for i in range(5)])
+            await session.commit()
+            defect_id = defect.id
+
+        print(f"comments={comments}, authors={AUTHORS}")
+        for cached in (False, True):
+            for cache in ENTITY_CACHES.values():
+                cache.enabled = cached
+            samples, statements = {"full": [], "separate": []}, {}
+            for _ in range(repeats):
+                for name in samples:
+                    counter.reset()
+                    started = time.perf_counter()
+                    if name == "full":
+                        await client.get(f"/defects/{defect_id}/full", headers=headers)
+                        calls = 1
+                    else:
+                        calls = await separate_calls(client, headers, defect_id)
+                    samples[name].append(time.perf_counter() - started)
+                    statements[name] = (calls, counter.count)
+            label = "entity cache on " if cached else "entity cache off"
+            for name, values in samples.items():
+                calls, count = statements[name]
+                print(f"  {label} {name:<9} {statistics.median(values) * 1000:8.2f} ms  {calls:3} HTTP calls  {count:3} statements")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--comments", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=30)
+    args = parser.parse_args()
+    asyncio.run(run(args.comments, args.repeats))
+
+
+if __name__ == "__main__":
+    main()
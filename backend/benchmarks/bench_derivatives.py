@@ -0,0 +1,85 @@
+"""Пропускная способность построения миниатюр и превью в зависимости от числа процессов.
+
+Синтетические фото --width x --height (шум, чтобы JPEG весил как настоящий снимок)
+кладутся в хранилище, затем DerivativePipeline строит для всех превью и две миниатюры.
+Для каждого числа процессов в --workers печатаются изображения в секунду и размеры
+файлов, которые получит планшет.
+
+    python -m benchmarks.bench_derivatives --images 48 --workers 1,2,4,8
+"""
+import argparse
+import asyncio
+import io
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+from benchmarks.common import sqlite_app  # noqa: F401 - путь к app
+from app.core.derivatives import DERIVATIVES, DerivativePipeline
+from app.core.storage import LocalStorage
+
+
+def photo(width: int, height: int, seed: int) -> bytes:
+    noise = Image.effect_noise((width, height), 40 + seed % 20)
+    image = Image.merge("RGB", (noise, noise.rotate(90, expand=False), noise.transpose(Image.FLIP_LEFT_RIGHT)))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+async def store(storage: LocalStorage, content: bytes) -> str:
+    writer = await storage.writer()
+    await writer.write(content)
+    return (await writer.commit()).digest
+
+
+async def run(images: int, width: int, height: int, workers_list, image_format: str):
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = LocalStorage(os.path.join(tmp, "attachments"))
+        # Несколько разных снимков по кругу, у каждого изображения свой хеш
+        samples = [photo(width, height, seed) for seed in range(4)]
+        digests = [await store(storage, samples[i % len(samples)] + i.to_bytes(4, "big")) for i in range(images)]
+        original_size = sum(len(sample) for sample in samples) / len(samples)
+
+        print(f"images={images}, {width}x{height}, cpu={os.cpu_count()}, format={image_format}")
+        print(f"  {'workers':>7} {'seconds':>8} {'images/s':>9} {'speedup':>8}")
+        baseline = None
+        for workers in workers_list:
+            for digest in digests:
+                for path in storage.path(digest).parent.glob(f"{digest}.*"):
+                    path.unlink()
+            pipeline = DerivativePipeline(storage, kind="process", workers=workers, image_format=image_format)
+            pipeline._get_executor().submit(int).result()  # процессы стартуют до замера
+            started = time.perf_counter()
+            for digest in digests:
+                pipeline.schedule(digest, "image/jpeg")
+            for digest in digests:
+                await pipeline.wait(digest)
+            elapsed = time.perf_counter() - started
+            pipeline.shutdown()
+            assert not pipeline._failed
+            rate = images / elapsed
+            baseline = baseline or rate
+            print(f"  {workers:7} {elapsed:8.2f} {rate:9.1f} {rate / baseline:7.1f}x")
+
+        print(f"  original  {original_size / 1024:8.1f} KB")
+        for name in DERIVATIVES:
+            sizes = [os.path.getsize(pipeline.path(digest, name)) for digest in digests]
+            print(f"  {name:<9} {sum(sizes) / len(sizes) / 1024:8.1f} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=48)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--workers", default=",".join(str(n) for n in sorted({1, 2, 4, os.cpu_count() or 1})))
+    parser.add_argument("--format", default="webp", choices=["webp", "jpeg"])
+    args = parser.parse_args()
+    asyncio.run(run(args.images, args.width, args.height, [int(n) for n in args.workers.split(",")], args.format))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Скачивание вложений под 50 одновременными пользователями.
+
+Сравниваются чтение файла в память (Response(file.read())), FileResponse из Starlette
+(без Range) и GET /attachments/{id}/content. Запросы идут прямо в ASGI-приложение через
+stream_get, тело ответа клиент не копит, поэтому пик tracemalloc - память сервера.
+Второй сценарий - перемотка видео: каждый пользователь просит 1 МБ из середины файла.
+
+    python -m benchmarks.bench_download --users 50 --size-mb 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import anyio
+from fastapi import APIRouter, Depends, Response
+from fastapi.responses import FileResponse
+
+from benchmarks.common import sqlite_app, create_bench_user, stream_get
+from main import app
+from app.core.security import get_current_user
+from app.core.storage import LocalStorage
+from app.models.attachment import DefectAttachment
+from app.models.defects import Defect
+from app.models.project import Project
+
+
+def legacy_router(path: str) -> APIRouter:
+    router = APIRouter(prefix="/legacy")
+
+    @router.get("/read")
+    async def read_whole(current_user=Depends(get_current_user)):
+        def read():
+            with open(path, "rb") as file:
+                return file.read()
+        return Response(await anyio.to_thread.run_sync(read), media_type="video/mp4")
+
+    @router.get("/file-response")
+    async def file_response(current_user=Depends(get_current_user)):
+        return FileResponse(path, media_type="video/mp4")
+
+    return router
+
+
+async def crowd(path: str, headers: dict, users: int, size: int, ranged: bool) -> dict:
+    async def one():
+        request_headers = dict(headers)
+        if ranged:
+            start = random.randrange(0, size - 1024 * 1024)
+            request_headers["Range"] = f"bytes={start}-{start + 1024 * 1024 - 1}"
+        stats = await stream_get(path, request_headers)
+        assert stats["status"] in (200, 206), stats
+        return stats
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(users)))
+    wall = time.perf_counter() - started
+    latencies = sorted(stats["total"] for stats in results)
+    return {
+        "wall": wall,
+        "bytes": sum(stats["bytes"] for stats in results),
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "first_byte": statistics.median(stats["first_byte"] for stats in results),
+    }
+
+
+async def run(users: int, size_mb: int):
+    size = size_mb * 1024 * 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = LocalStorage(os.path.join(tmp, "attachments"))
+        writer = await storage.writer()
+        block = os.urandom(1024 * 1024)
+        for _ in range(size_mb):
+            await writer.write(block)
+        blob = await writer.commit()
+        app.include_router(legacy_router(storage.local_path(blob.digest)))
+
+        with patch("app.services.attachment_services.attachment_storage", storage):
+            async with sqlite_app() as (client, make_session, counter):
+                user_id, headers = await create_bench_user(make_session)
+                async with make_session() as session:
+                    project = Project(name="Bench", manager_id=user_id)
+                    session.add(project)
+                    await session.flush()
+                    defect = Defect(title="Bench", project_id=project.id, created_by_id=user_id)
+                    session.add(defect)
+                    await session.flush()
+                    attachment = DefectAttachment(file_path=blob.digest, file_name="walkthrough.mp4", content_type="video/mp4",
+                                                  size=blob.size, defect_id=defect.id)
+                    session.add(attachment)
+                    await session.commit()
+
+                variants = (("read into memory", "/legacy/read"), ("FileResponse", "/legacy/file-response"),
+                            ("content endpoint", f"/attachments/{attachment.id}/content"))
+                print(f"users={users}, file={size_mb} MB")
+                for scenario, ranged in (("full download", False), ("1 MB range", True)):
+                    print(f"  {scenario}:")
+                    print(f"    {'variant':<18} {'wall':>8} {'MB/s':>8} {'sent MB':>8} {'p50':>8} {'p95':>8} {'TTFB':>8} {'peak mem':>9}")
+                    for name, path in variants:
+                        await crowd(path, headers, 2, size, ranged)  # прогрев
+                        result = await crowd(path, headers, users, size, ranged)
+                        # Память отдельным прогоном: tracemalloc замедляет выделения
+                        tracemalloc.start()
+                        await crowd(path, headers, users, size, ranged)
+                        _, peak = tracemalloc.get_traced_memory()
+                        tracemalloc.stop()
+                        sent = result["bytes"] / 1024 / 1024
+                        print(f"    {name:<18} {result['wall'] * 1000:6.0f}ms {sent / result['wall']:8.0f} {sent:8.0f} "
+                              f"{result['p50'] * 1000:6.0f}ms {result['p95'] * 1000:6.0f}ms {result['first_byte'] * 1000:6.0f}ms "
+                              f"{peak / 1024 / 1024:6.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--size-mb", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.size_mb))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Чтение проектов и пользователей по id: read-through кеш против запроса в БД на каждый вызов.
+
+    python -m benchmarks.bench_entity_cache --lookups 20000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.common import sqlite_app, create_bench_user
+from app.core.entity_cache import ENTITY_CACHES
+from app.models.project import Project
+from app.repository.project_repos import ProjectRepos
+from app.repository.user_repos import UserRepos
+
+PROJECTS = 200
+
+
+async def run(lookups: int):
+    random.seed(1)
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, headers = await create_bench_user(make_session)
+        async with make_session() as session:
+            session.add_all([Project(name=f"Объект {i}", manager_id=user_id) for i in range(PROJECTS)])
+            await session.commit()
+
+        ids = [random.randint(1, PROJECTS) for _ in range(lookups)]
+        for enabled in (False, True):
+            for cache in ENTITY_CACHES.values():
+                cache.enabled = enabled
+                await cache.clear()
+            async with make_session() as session:
+                counter.reset()
+                started = time.perf_counter()
+                for project_id in ids:
+                    await ProjectRepos.get_project_by_id(project_id, session)
+                    await UserRepos.get_user_by_id(user_id, session)
+                elapsed = time.perf_counter() - started
+            label = "cache" if enabled else "no cache"
+            print(f"  {label:<9} {lookups * 2} lookups  {elapsed * 1000:9.1f} ms  {elapsed / (lookups * 2) * 1e6:7.1f} us/lookup  {counter.count} statements")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.lookups))
+
+
+if __name__ == "__main__":
+    main()
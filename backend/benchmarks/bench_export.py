@@ -0,0 +1,57 @@
+"""Выгрузка дефектов в CSV/XLSX: строк в секунду и пиковый RSS.
+
+Тело ответа не накапливается (см. stream_get), поэтому RSS показывает память самой выгрузки.
+
+    python -m benchmarks.bench_export --rows 1000000
+"""
+import argparse
+import asyncio
+import resource
+
+from sqlalchemy import insert
+
+from benchmarks.common import sqlite_app, create_bench_user, stream_get
+from app.models.defects import Defect
+from app.models.project import Project
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(rows: int, formats: list):
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, headers = await create_bench_user(make_session)
+        async with make_session() as session:
+            projects = [Project(name=f"Объект {i}", manager_id=user_id) for i in range(10)]
+            session.add_all(projects)
+            await session.flush()
+            for start in range(0, rows, 10000):
+                await session.execute(insert(Defect), [
+                    {"title": f"Трещина {i}", "description": "Трещина в несущей стене, требуется осмотр",
+                     "project_id": projects[i % 10].id, "created_by_id": user_id,
+                     "assigned_to_id": user_id if i % 2 else None}
+                    for i in range(start, min(rows, start + 10000))
+                ])
+            await session.commit()
+
+        baseline = peak_rss_mb()
+        print(f"rows={rows}, RSS before export {baseline:.0f} MB")
+        for export_format in formats:
+            stats = await stream_get(f"/defects/export?format={export_format}", headers)
+            assert stats["status"] == 200, stats
+            print(f"{export_format:>5}: {rows / stats['total']:,.0f} rows/s, {stats['bytes'] / 1e6:.1f} MB, "
+                  f"first byte {stats['first_byte'] * 1000:.0f} ms, total {stats['total']:.1f}s, "
+                  f"peak RSS +{peak_rss_mb() - baseline:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--formats", nargs="+", default=["csv", "xlsx"])
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.formats))
+
+
+if __name__ == "__main__":
+    main()
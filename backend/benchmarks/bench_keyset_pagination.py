@@ -0,0 +1,76 @@
+"""Offset против keyset пагинации для списка дефектов на первой и глубокой странице.
+
+    python -m benchmarks.bench_keyset_pagination --rows 1000000 --page 10000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.future import select
+
+from benchmarks.common import sqlite_app, create_bench_user
+from app.core.pagination import encode_cursor
+from app.models.defects import Defect
+from app.models.project import Project
+from app.repository.defect_repos import DefectRepos
+
+
+async def fill(make_session, user_id: int, rows: int):
+    async with make_session() as session:
+        project = Project(name="Bench", manager_id=user_id)
+        session.add(project)
+        await session.flush()
+        batch = 10000
+        for start in range(0, rows, batch):
+            await session.execute(insert(Defect), [
+                {"title": f"Defect {i}", "project_id": project.id, "created_by_id": user_id}
+                for i in range(start, min(rows, start + batch))
+            ])
+        await session.commit()
+
+
+async def timed(make_session, repeats: int, **kwargs) -> float:
+    samples = []
+    for _ in range(repeats):
+        async with make_session() as session:
+            started = time.perf_counter()
+            await DefectRepos.get_all_defects(session=session, **kwargs)
+            samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+async def run(rows: int, page: int, limit: int, repeats: int):
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, _ = await create_bench_user(make_session)
+        started = time.perf_counter()
+        await fill(make_session, user_id, rows)
+        print(f"filled {rows:,} defects in {time.perf_counter() - started:.1f}s")
+
+        for page_number in (1, page):
+            offset = (page_number - 1) * limit
+            cursor = None
+            if offset:
+                async with make_session() as session:
+                    last_id = (await session.execute(
+                        select(Defect.id).order_by(Defect.id).offset(offset - 1).limit(1)
+                    )).scalar_one()
+                cursor = encode_cursor("id", last_id, last_id)
+            offset_ms = await timed(make_session, repeats, limit=limit, offset=offset)
+            keyset_ms = await timed(make_session, repeats, limit=limit, cursor=cursor)
+            print(f"page {page_number:>6}: offset {offset_ms:8.2f} ms | keyset {keyset_ms:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--page", type=int, default=10000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.page, args.limit, args.repeats))
+
+
+if __name__ == "__main__":
+    main()
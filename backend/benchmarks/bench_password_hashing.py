@@ -0,0 +1,88 @@
+"""Задержка обычных запросов во время волны логинов.
+
+Сравнивает синхронный bcrypt в event loop и пул PasswordHasher:
+пока идут проверки паролей, "лёгкий" обработчик (имитация не-auth эндпоинта)
+замеряет своё время ответа, в конце печатаются p50/p99.
+
+    python -m benchmarks.bench_password_hashing --logins 40 --executor thread
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.hashing import PasswordHasher, hash_password, verify_password
+
+
+def percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def light_requests(stop: asyncio.Event, latencies: list, interval: float = 0.005):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+
+
+async def run(mode: str, logins: int, hashed: str, executor: str, workers: int, concurrency: int):
+    hasher = PasswordHasher(kind=executor, workers=workers, max_concurrency=concurrency)
+    latencies = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(light_requests(stop, latencies))
+    await asyncio.sleep(0.05)
+
+    async def inline_login():
+        verify_password("password123", hashed)
+
+    async def pooled_login():
+        await hasher.verify("password123", hashed)
+
+    login = inline_login if mode == "inline" else pooled_login
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await ticker
+    hasher.shutdown()
+    return elapsed, latencies, hasher.metrics.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    hashed = hash_password("password123")
+    for mode in ("inline", "pool"):
+        elapsed, latencies, metrics = asyncio.run(
+            run(mode, args.logins, hashed, args.executor, args.workers, args.concurrency)
+        )
+        print(
+            f"{mode:>6}: {args.logins} logins in {elapsed:.2f}s | "
+            f"light requests: n={len(latencies)} "
+            f"p50={statistics.median(latencies) * 1000:.2f}ms "
+            f"p99={percentile(latencies, 99) * 1000:.2f}ms "
+            f"max={max(latencies) * 1000:.2f}ms"
+        )
+        if mode == "pool":
+            print(
+                f"        queue wait avg={metrics['queue_wait_avg'] * 1000:.1f}ms "
+                f"max={metrics['queue_wait_max'] * 1000:.1f}ms | "
+                f"hash time avg={metrics['hash_time_avg'] * 1000:.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Количество SQL запросов на аутентифицированный запрос с кешем пользователей и без него.
+
+    python -m benchmarks.bench_principal_cache --requests 500
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import sqlite_app, create_bench_user
+from app.core.principal_cache import principal_cache
+
+
+async def run(requests: int, enabled: bool):
+    principal_cache.enabled = enabled
+    principal_cache.clear()
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, headers = await create_bench_user(make_session)
+        counter.reset()
+        started = time.perf_counter()
+        for _ in range(requests):
+            response = await client.get(f"/users/{user_id}", headers=headers)
+            assert response.status_code == 200, response.text
+        elapsed = time.perf_counter() - started
+        return counter.count, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    for enabled in (False, True):
+        queries, elapsed = asyncio.run(run(args.requests, enabled))
+        print(
+            f"cache {'on ' if enabled else 'off'}: {args.requests} requests, "
+            f"{queries / args.requests:.2f} queries/request, "
+            f"{args.requests / elapsed:.0f} req/s"
+        )
+    print(principal_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Дефекты большого проекта: потоковая выдача против загрузки всего списка.
+
+Сначала замеряется stream=true, затем выдача всех строк одним списком.
+ru_maxrss только растёт, поэтому порядок важен. ASGITransport httpx буферизует
+тело ответа целиком, поэтому время до первого байта здесь не показательно.
+
+    python -m benchmarks.bench_relation_streaming --rows 200000
+"""
+import argparse
+import asyncio
+import resource
+import time
+
+from sqlalchemy import insert
+
+from benchmarks.common import sqlite_app, create_bench_user
+from app.models.defects import Defect
+from app.models.project import Project
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(rows: int):
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, headers = await create_bench_user(make_session)
+        async with make_session() as session:
+            project = Project(name="Bench", manager_id=user_id)
+            session.add(project)
+            await session.flush()
+            for start in range(0, rows, 10000):
+                await session.execute(insert(Defect), [
+                    {"title": f"Defect {i}", "description": "Трещина в стене " * 5,
+                     "project_id": project.id, "created_by_id": user_id}
+                    for i in range(start, min(rows, start + 10000))
+                ])
+            await session.commit()
+            project_id = project.id
+
+        baseline = peak_rss_mb()
+        for accept in ("application/json", "application/x-ndjson"):
+            started = time.perf_counter()
+            size = 0
+            async with client.stream(
+                "GET", f"/defects/project/{project_id}?stream=true", headers={**headers, "accept": accept}
+            ) as response:
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+            elapsed = time.perf_counter() - started
+            print(f"stream {accept:>20}: total {elapsed:.2f}s, "
+                  f"{size / 1e6:.0f} MB, peak RSS +{peak_rss_mb() - baseline:.0f} MB")
+
+        started = time.perf_counter()
+        response = await client.get(f"/defects/project/{project_id}?limit={rows}", headers=headers)
+        elapsed = time.perf_counter() - started
+        print(f"list {'limit=' + str(rows):>22}: total {elapsed:.2f}s, "
+              f"{len(response.content) / 1e6:.0f} MB, peak RSS +{peak_rss_mb() - baseline:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows))
+
+
+if __name__ == "__main__":
+    main()
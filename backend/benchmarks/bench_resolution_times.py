@@ -0,0 +1,96 @@
+"""Перцентили времени закрытия: слияние дневных t-digest скетчей против точного расчёта.
+
+Заполняет defects и события закрытия за год, пересобирает скетчи и сравнивает
+время и точность p50/p90/p99 за 30 и 365 дней: из скетчей и точно (все длительности
+из БД и сортировка - SQLite не умеет percentile_cont).
+
+    python -m benchmarks.bench_resolution_times --defects 200000
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, select
+
+from benchmarks.common import sqlite_app, create_bench_user
+from app.models.defects import Defect, DefectStatus, DefectPriority
+from app.models.defect_history import DefectStatusEvent
+from app.models.project import Project
+from app.repository.resolution_repos import resolution_seconds
+from app.services.analytics_services import AnalyticsService
+
+PROJECTS = 20
+ASSIGNEES = 50
+DAYS = 365
+
+
+async def timed(name: str, call):
+    started = time.perf_counter()
+    result = await call()
+    print(f"  {name:<40} {(time.perf_counter() - started) * 1000:10.1f} ms")
+    return result
+
+
+async def exact(session, start, end):
+    result = await session.execute(
+        select(Defect.created_at, DefectStatusEvent.changed_at)
+        .join(Defect, Defect.id == DefectStatusEvent.defect_id)
+        .where(DefectStatusEvent.to_status == DefectStatus.CLOSED, DefectStatusEvent.changed_at.between(start, end + timedelta(days=1)))
+    )
+    values = sorted(resolution_seconds(created_at, changed_at) for created_at, changed_at in result)
+    return {q: values[int(q * (len(values) - 1))] for q in (0.5, 0.9, 0.99)}
+
+
+async def run(defects: int):
+    random.seed(1)
+    started_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    priorities = list(DefectPriority)
+
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, headers = await create_bench_user(make_session)
+        async with make_session() as session:
+            projects = [Project(name=f"Объект {i}", manager_id=user_id) for i in range(PROJECTS)]
+            session.add_all(projects)
+            await session.flush()
+            project_ids = [project.id for project in projects]
+            for start in range(0, defects, 10000):
+                rows, events = [], []
+                for defect_id in range(start + 1, min(defects, start + 10000) + 1):
+                    created_at = started_at + timedelta(seconds=random.uniform(0, DAYS * 86400))
+                    seconds = random.lognormvariate(11, 1.2)
+                    rows.append({"title": f"Defect {defect_id}", "project_id": project_ids[defect_id % PROJECTS],
+                                 "priority": random.choice(priorities), "created_by_id": user_id,
+                                 "assigned_to_id": None, "created_at": created_at, "status": DefectStatus.CLOSED})
+                    events.append({"defect_id": defect_id, "from_status": DefectStatus.NEW, "to_status": DefectStatus.CLOSED,
+                                   "changed_at": created_at + timedelta(seconds=seconds), "from_seconds": seconds})
+                await session.execute(insert(Defect), rows)
+                await session.execute(insert(DefectStatusEvent), events)
+            await session.commit()
+        print(f"defects={defects}, closes={defects}")
+
+        async with make_session() as session:
+            sketches = await timed("rebuild sketches", lambda: AnalyticsService.rebuild_resolution_sketches(session))
+            print(f"  sketches={sketches}")
+            end = (started_at + timedelta(days=DAYS - 1)).date()
+            for days in (30, 365):
+                start = end - timedelta(days=days - 1)
+                print(f" {days} days:")
+                report = await timed("sketches, overall", lambda: AnalyticsService.get_resolution_times([], session, start=start, end=end))
+                await timed("sketches, by project and priority", lambda: AnalyticsService.get_resolution_times(["project", "priority"], session, start=start, end=end))
+                exact_values = await timed("exact, overall", lambda: exact(session, datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time())))
+                overall = report.groups[0]
+                for q, value in ((0.5, overall.p50), (0.9, overall.p90), (0.99, overall.p99)):
+                    print(f"    p{int(q * 100):<3} sketch {value / 3600:9.2f} h   exact {exact_values[q] / 3600:9.2f} h   error {abs(value / exact_values[q] - 1) * 100:5.2f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--defects", type=int, default=200000)
+    args = parser.parse_args()
+    asyncio.run(run(args.defects))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Возобновляемая загрузка против одного multipart-запроса.
+
+Файл --size-mb отправляется: одним multipart-запросом (POST /attachments/upload), одним
+PATCH, PATCH-ами по --chunk-mb и через канал, который рвётся каждые --drop-mb: клиент
+спрашивает HEAD и продолжает с принятого смещения. Для multipart при таком канале
+загрузка начинается заново и при drop < size не завершается никогда.
+
+    python -m benchmarks.bench_resumable_upload --size-mb 200
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from benchmarks.common import sqlite_app, create_bench_user
+from app.core.resumable import ResumableUploads
+from app.core.storage import LocalStorage
+from app.models.defects import Defect
+from app.models.project import Project
+
+MB = 1024 * 1024
+BOUNDARY = "bench-boundary-3kq0XJ"
+
+
+def payload(size: int, seed: int) -> bytes:
+    # Разное содержимое у каждой загрузки, чтобы дедупликация не подменяла запись
+    return seed.to_bytes(8, "big") + b"\x5a" * (size - 8)
+
+
+async def body(data: memoryview, block: int = MB):
+    for start in range(0, len(data), block):
+        yield bytes(data[start:start + block])
+
+
+async def multipart(client, headers: dict, defect_id: int, data: bytes) -> int:
+    async def stream():
+        yield (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="defect_id"\r\n\r\n{defect_id}\r\n'
+               f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="video.mp4"\r\n'
+               f'Content-Type: video/mp4\r\n\r\n').encode()
+        async for chunk in body(memoryview(data)):
+            yield chunk
+        yield f"\r\n--{BOUNDARY}--\r\n".encode()
+    response = await client.post("/attachments/upload", content=stream(), timeout=None,
+                                 headers={**headers, "Content-Type": f"multipart/form-data; boundary={BOUNDARY}"})
+    assert response.status_code == 201, response.text
+    return len(data)
+
+
+async def resumable(client, headers: dict, defect_id: int, data: bytes, chunk: int, drop: int) -> int:
+    """Отправляет data PATCH-ами по chunk байт; соединение рвётся после каждых drop байт."""
+    created = await client.post("/attachments/uploads", json={"defect_id": defect_id, "size": len(data), "content_type": "video/mp4"}, headers=headers)
+    url = f"/attachments/uploads/{created.json()['id']}"
+    view, offset, sent, on_link = memoryview(data), 0, 0, 0
+    while True:
+        end = min(offset + chunk, len(data), offset + drop - on_link)
+        response = await client.patch(url, content=body(view[offset:end]), timeout=None,
+                                      headers={**headers, "Content-Type": "application/offset+octet-stream", "Upload-Offset": str(offset)})
+        assert response.status_code == 204, response.text
+        sent += end - offset
+        on_link += end - offset
+        if "location" in response.headers:
+            return sent
+        if on_link >= drop:
+            on_link = 0
+            offset = int((await client.head(url, headers=headers)).headers["upload-offset"])
+        else:
+            offset = int(response.headers["upload-offset"])
+
+
+async def run(size_mb: int, chunk_mb: int, drop_mb: int):
+    size = size_mb * MB
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = LocalStorage(os.path.join(tmp, "attachments"))
+        uploads = ResumableUploads(storage, os.path.join(tmp, "attachments", "uploads"))
+        with patch("app.services.attachment_services.attachment_storage", storage), \
+                patch("app.services.attachment_services.resumable_uploads", uploads):
+            async with sqlite_app() as (client, make_session, counter):
+                user_id, headers = await create_bench_user(make_session)
+                async with make_session() as session:
+                    project = Project(name="Bench", manager_id=user_id)
+                    session.add(project)
+                    await session.flush()
+                    defect = Defect(title="Bench", project_id=project.id, created_by_id=user_id)
+                    session.add(defect)
+                    await session.commit()
+
+                variants = (
+                    ("multipart, one request", lambda data: multipart(client, headers, defect.id, data)),
+                    ("resumable, one PATCH", lambda data: resumable(client, headers, defect.id, data, size, size)),
+                    (f"resumable, {chunk_mb} MB PATCHes", lambda data: resumable(client, headers, defect.id, data, chunk_mb * MB, size)),
+                    (f"resumable, drop every {drop_mb} MB", lambda data: resumable(client, headers, defect.id, data, size, drop_mb * MB)),
+                )
+                print(f"size={size_mb} MB")
+                print(f"  {'variant':<30} {'time':>8} {'MB/s':>8} {'sent MB':>8}")
+                for seed, (name, send) in enumerate(variants, start=1):
+                    data = payload(size, seed)
+                    started = time.perf_counter()
+                    sent = await send(data)
+                    elapsed = time.perf_counter() - started
+                    print(f"  {name:<30} {elapsed * 1000:6.0f}ms {size_mb / elapsed:8.1f} {sent / MB:8.0f}")
+                if drop_mb < size_mb:
+                    print(f"  multipart with drop every {drop_mb} MB never completes: each retry starts from byte 0")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--chunk-mb", type=int, default=8)
+    parser.add_argument("--drop-mb", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.size_mb, args.chunk_mb, args.drop_mb))
+
+
+if __name__ == "__main__":
+    main()
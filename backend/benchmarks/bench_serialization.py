@@ -0,0 +1,134 @@
+"""Сериализация списков: прежний путь против строк -> TypeAdapter -> orjson.
+
+Прежний путь: ORM-объекты, model_validate на каждую строку в репозитории, повторная
+проверка по response_model в FastAPI и json из стандартной библиотеки. Для сравнения
+он воспроизведён отдельными маршрутами /legacy/*.
+
+    python -m benchmarks.bench_serialization --rows 1000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+from pydantic import EmailStr
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from benchmarks.common import sqlite_app, create_bench_user
+from main import app
+from app.core.pagination import paginate
+from app.core.security import get_current_user
+from app.core.serialization import dump_models, dumps, validate_rows
+from app.database.settings import get_session
+from app.models.comment import Comment
+from app.models.defects import Defect
+from app.models.project import Project
+from app.models.user import User, UserRole
+from app.repository.base_repos import schema_columns
+from app.schemas.comment import CommentGetting
+from app.schemas.defect import DefectGetting
+from app.schemas.user import UserGetting
+
+class LegacyUserGetting(UserGetting):
+    """Схема пользователя до перехода: email проверялся и при выдаче."""
+    email: EmailStr
+
+
+RESOURCES = {
+    "defects": (Defect, DefectGetting),
+    "comments": (Comment, CommentGetting),
+    "users": (User, UserGetting),
+}
+LEGACY_SCHEMAS = {**{name: schema for name, (_, schema) in RESOURCES.items()}, "users": LegacyUserGetting}
+
+
+def legacy_endpoint(model, schema):
+    async def endpoint(limit: int = 100, session: AsyncSession = Depends(get_session), current_user=Depends(get_current_user)):
+        result = await session.execute(paginate(select(model), model, {"id": model.id}, "id", None, limit, 0))
+        return [schema.model_validate(item) for item in result.scalars().all()]
+    return endpoint
+
+
+def legacy_router() -> APIRouter:
+    router = APIRouter(prefix="/legacy")
+    for name, (model, schema) in RESOURCES.items():
+        schema = LEGACY_SCHEMAS[name]
+        router.add_api_route(f"/{name}", legacy_endpoint(model, schema), response_model=List[schema], response_class=JSONResponse)
+    return router
+
+
+async def seed(make_session, user_id: int, rows: int):
+    async with make_session() as session:
+        session.add_all([User(email=f"user{i}@example.com", name=f"Пользователь {i}", password_hash="x", role=UserRole.ENGINEER) for i in range(rows)])
+        project = Project(name="Bench", manager_id=user_id)
+        session.add(project)
+        await session.flush()
+        defects = [
+            Defect(title=f"Дефект {i}", description="Трещина в несущей стене, требуется осмотр", project_id=project.id, created_by_id=user_id)
+            for i in range(rows)
+        ]
+        session.add_all(defects)
+        await session.flush()
+        session.add_all([Comment(text=f"Комментарий {i}", defect_id=defects[0].id, author_id=user_id) for i in range(rows)])
+        await session.commit()
+
+
+def timed(samples: list, func):
+    started = time.perf_counter()
+    result = func()
+    samples.append(time.perf_counter() - started)
+    return result
+
+
+async def run(rows: int, repeats: int):
+    app.include_router(legacy_router())
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, headers = await create_bench_user(make_session)
+        await seed(make_session, user_id, rows)
+
+        print(f"rows={rows}")
+        print("  HTTP, median:")
+        for name in RESOURCES:
+            samples = {"legacy": [], "new": []}
+            for _ in range(repeats):
+                for variant, path in (("legacy", f"/legacy/{name}"), ("new", f"/{name}/")):
+                    started = time.perf_counter()
+                    response = await client.get(path, params={"limit": rows}, headers=headers)
+                    samples[variant].append(time.perf_counter() - started)
+                    assert len(response.json()) == rows
+            legacy, new = (statistics.median(samples[variant]) * 1000 for variant in ("legacy", "new"))
+            print(f"    {name:<9} legacy {legacy:8.2f} ms   new {new:8.2f} ms   x{legacy / new:.1f}")
+
+        # Только построение схем и JSON из уже прочитанных строк, без БД и HTTP
+        print("  validate + encode only, median:")
+        async with make_session() as session:
+            for name, (model, schema) in RESOURCES.items():
+                objects = (await session.execute(select(model).limit(rows))).scalars().all()
+                result = await session.execute(select(*schema_columns(model, schema)).limit(rows))
+                keys, tuples = result.keys(), result.all()
+                samples = {"legacy": [], "new": []}
+                for _ in range(repeats):
+                    legacy_schema = LEGACY_SCHEMAS[name]
+                    timed(samples["legacy"], lambda: JSONResponse([
+                        item.model_dump(mode="json") for item in
+                        (legacy_schema.model_validate(item) for item in [legacy_schema.model_validate(obj) for obj in objects])
+                    ]).body)
+                    timed(samples["new"], lambda: dumps(dump_models(validate_rows(schema, keys, tuples))))
+                legacy, new = (statistics.median(samples[variant]) * 1000 for variant in ("legacy", "new"))
+                print(f"    {name:<9} legacy {legacy:8.2f} ms   new {new:8.2f} ms   x{legacy / new:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.repeats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Список дефектов с ?fields= и ?include= против полного ответа и догрузки связей отдельными вызовами.
+
+Таблице списка нужны id, название, статус, исполнитель и число комментариев. Без параметров
+клиент получает описания целиком, а исполнителей и комментарии запрашивает по одному.
+
+    python -m benchmarks.bench_sparse_fields --defects 2000 --description-bytes 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.common import sqlite_app, create_bench_user
+from app.core.entity_cache import ENTITY_CACHES
+from app.models.comment import Comment
+from app.models.defects import Defect
+from app.models.project import Project
+from app.models.user import User, UserRole
+
+ASSIGNEES = 20
+LIMIT = 100
+
+
+async def separate_calls(client, headers: dict) -> tuple:
+    calls, size = 1, 0
+    response = await client.get("/defects/", params={"limit": LIMIT}, headers=headers)
+    defects = response.json()
+    size += len(response.content)
+    people = {defect["assigned_to_id"] for defect in defects if defect["assigned_to_id"]}
+    responses = await asyncio.gather(
+        *(client.get(f"/users/{user_id}", headers=headers) for user_id in people),
+        *(client.get(f"/comments/defect/{defect['id']}", headers=headers) for defect in defects),
+    )
+    calls += len(responses)
+    size += sum(len(item.content) for item in responses)
+    return calls, size
+
+
+async def run(defects: int, description_bytes: int, repeats: int):
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, headers = await create_bench_user(make_session)
+        async with make_session() as session:
+            assignees = [User(email=f"engineer{i}@example.com", name=f"Engineer {i}", password_hash="x", role=UserRole.ENGINEER) for i in range(ASSIGNEES)]
+            project = Project(name="Bench", manager_id=user_id)
+            session.add_all([*assignees, project])
+            await session.flush()
+            description = "Описание " * (description_bytes // 18)
+            rows = [
+                Defect(title=f"Дефект {i}", description=description, project_id=project.id,
+                       created_by_id=user_id, assigned_to_id=assignees[i % ASSIGNEES].id)
+                for i in range(defects)
+            ]
+            session.add_all(rows)
+            await session.flush()
+            session.add_all([Comment(text="Комментарий", defect_id=row.id, author_id=user_id) for row in rows[:LIMIT] for _ in range(3)])
+            await session.commit()
+        # Кеш пользователей скрыл бы стоимость отдельных вызовов
+        for cache in ENTITY_CACHES.values():
+            cache.enabled = False
+
+        variants = {
+            "full list": {"limit": LIMIT},
+            "fields=id,title,status": {"limit": LIMIT, "fields": "id,title,status"},
+            "+include": {"limit": LIMIT, "fields": "id,title,status", "include": "assignee,comment_count"},
+        }
+        print(f"defects={defects}, description={description_bytes} B, page={LIMIT}")
+        for name, params in variants.items():
+            samples = []
+            for _ in range(repeats):
+                counter.reset()
+                started = time.perf_counter()
+                response = await client.get("/defects/", params=params, headers=headers)
+                samples.append(time.perf_counter() - started)
+            print(f"  {name:<24} {statistics.median(samples) * 1000:8.2f} ms  {len(response.content):8} B  {counter.count:3} statements")
+
+        samples = []
+        for _ in range(max(repeats // 5, 1)):
+            counter.reset()
+            started = time.perf_counter()
+            calls, size = await separate_calls(client, headers)
+            samples.append(time.perf_counter() - started)
+        print(f"  {'list + separate calls':<24} {statistics.median(samples) * 1000:8.2f} ms  {size:8} B  {counter.count:3} statements  {calls} HTTP calls")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--defects", type=int, default=2000)
+    parser.add_argument("--description-bytes", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=30)
+    args = parser.parse_args()
+    asyncio.run(run(args.defects, args.description_bytes, args.repeats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Время в статусах: накопители против проигрывания журнала на миллионах событий.
+
+Заполняет defects и defect_status_events, замеряет пересборку накопителей (backfill),
+отчёт по проекту из накопителей и тот же отчёт через оконную функцию по журналу,
+а также цену записи события при смене статуса.
+
+    python -m benchmarks.bench_status_history --defects 200000 --events-per-defect 10
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, text
+
+from benchmarks.common import sqlite_app, create_bench_user
+from app.models.defects import Defect, DefectStatus
+from app.models.defect_history import DefectStatusEvent
+from app.models.project import Project
+from app.repository.defect_repos import DefectRepos
+from app.repository.defect_history_repos import DefectHistoryRepos
+from app.schemas.defect import DefectUpdate, DefectStatus as SchemaStatus
+from app.services.analytics_services import AnalyticsService
+
+PROJECTS = 20
+
+REPLAY_QUERY = text("""
+    SELECT status, count(DISTINCT defect_id), sum(seconds) FROM (
+        SELECT e.defect_id, e.to_status AS status,
+               (julianday(lead(e.changed_at) OVER (PARTITION BY e.defect_id ORDER BY e.id)) - julianday(e.changed_at)) * 86400 AS seconds
+        FROM defect_status_events e JOIN defects d ON d.id = e.defect_id
+        WHERE d.project_id = :project_id
+    ) WHERE seconds IS NOT NULL GROUP BY status
+""")
+
+
+async def timed(name: str, call, repeat: int = 1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = await call()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"  {name:<36} {elapsed * 1000:10.1f} ms")
+    return result
+
+
+async def run(defects: int, per_defect: int):
+    random.seed(1)
+    statuses = list(DefectStatus)
+    started_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, headers = await create_bench_user(make_session)
+        async with make_session() as session:
+            projects = [Project(name=f"Объект {i}", manager_id=user_id) for i in range(PROJECTS)]
+            session.add_all(projects)
+            await session.flush()
+            project_ids = [project.id for project in projects]
+            for start in range(0, defects, 10000):
+                await session.execute(insert(Defect), [
+                    {"title": f"Defect {i}", "project_id": project_ids[i % PROJECTS], "created_by_id": user_id}
+                    for i in range(start, min(defects, start + 10000))
+                ])
+                events = []
+                for defect_id in range(start + 1, min(defects, start + 10000) + 1):
+                    changed_at, status = started_at, DefectStatus.NEW
+                    for _ in range(per_defect):
+                        seconds = random.expovariate(1 / 86400)
+                        changed_at += timedelta(seconds=seconds)
+                        to_status = random.choice([item for item in statuses if item != status])
+                        events.append({"defect_id": defect_id, "from_status": status, "to_status": to_status,
+                                       "changed_at": changed_at, "from_seconds": seconds})
+                        status = to_status
+                await session.execute(insert(DefectStatusEvent), events)
+            await session.commit()
+        print(f"defects={defects}, events={defects * per_defect}")
+
+        async with make_session() as session:
+            await timed("backfill accumulators", lambda: AnalyticsService.backfill_status_durations(session))
+            project_id = project_ids[0]
+            await timed("time in status (accumulators)", lambda: DefectHistoryRepos.time_in_status(project_id, session), repeat=5)
+            await timed("time in status (replay log)", lambda: session.execute(REPLAY_QUERY, {"project_id": project_id}), repeat=5)
+
+            async def toggle(field: str):
+                for i in range(500):
+                    values = {"status": SchemaStatus.IN_PROGRESS if i % 2 else SchemaStatus.CLOSED} if field == "status" else {"title": f"T{i}"}
+                    await DefectRepos.update_defect(i + 1, DefectUpdate(**values), session, changed_by_id=user_id)
+                await session.commit()
+
+            print("  500 updates:")
+            await timed("title only", lambda: toggle("title"))
+            await timed("status change (+event, +accumulator)", lambda: toggle("status"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--defects", type=int, default=200000)
+    parser.add_argument("--events-per-defect", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.defects, args.events_per_defect))
+
+
+if __name__ == "__main__":
+    main()
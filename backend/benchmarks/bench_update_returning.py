@@ -0,0 +1,62 @@
+"""Обновление статуса дефекта: SELECT + setattr + commit + refresh против UPDATE ... RETURNING.
+
+    python -m benchmarks.bench_update_returning --updates 500
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy.future import select
+
+from benchmarks.common import sqlite_app, create_bench_user
+from app.models.defects import Defect
+from app.models.project import Project
+from app.services.defects_services import DefectService
+from app.schemas.defect import DefectUpdate, DefectStatus, DefectGetting
+
+
+async def legacy_update_defect(defect_id: int, defect_data: DefectUpdate, session):
+    result = await session.execute(select(Defect).filter(Defect.id == defect_id))
+    defect = result.scalar_one_or_none()
+    for field, value in defect_data.model_dump(exclude_unset=True).items():
+        setattr(defect, field, value)
+    await session.commit()
+    await session.refresh(defect)
+    return DefectGetting.model_validate(defect)
+
+
+async def run(updates: int):
+    statuses = [DefectStatus.IN_PROGRESS, DefectStatus.UNDER_REVIEW]
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, _ = await create_bench_user(make_session)
+        async with make_session() as session:
+            project = Project(name="Bench", manager_id=user_id)
+            session.add(project)
+            await session.flush()
+            defect = Defect(title="Bench defect", project_id=project.id, created_by_id=user_id)
+            session.add(defect)
+            await session.commit()
+            defect_id = defect.id
+
+        results = {}
+        for name, update in (("select+refresh", legacy_update_defect), ("returning", DefectService.update_defect)):
+            counter.reset()
+            started = time.perf_counter()
+            for i in range(updates):
+                async with make_session() as session:
+                    await update(defect_id, DefectUpdate(status=statuses[i % 2]), session)
+            results[name] = (counter.count / updates, time.perf_counter() - started)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=500)
+    args = parser.parse_args()
+
+    for name, (queries, elapsed) in asyncio.run(run(args.updates)).items():
+        print(f"{name:>15}: {queries:.2f} statements/update (+1 COMMIT), {elapsed / args.updates * 1000:.3f} ms/update")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Загрузка вложений: потоковый разбор multipart против UploadFile и request.body().
+
+Прежний способ для сравнения воспроизведён маршрутами /legacy/*: UploadFile
+(Starlette копирует файл во временный SpooledTemporaryFile, затем file.read() целиком)
+и чтение всего тела в память. Тело запроса отправляется генератором блоками по 1 МБ,
+память - пик tracemalloc за время одной загрузки.
+
+    python -m benchmarks.bench_upload --size-mb 100
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from fastapi import APIRouter, Depends, File, Form, Request, UploadFile
+
+from benchmarks.common import sqlite_app, create_bench_user
+from main import app
+from app.core.security import get_current_user
+from app.core.storage import LocalStorage
+from app.models.defects import Defect
+from app.models.project import Project
+
+BOUNDARY = "bench-boundary-7MA4YWxkTrZu0gW"
+CHUNK = 1024 * 1024
+
+
+def save_blob(root: str, content: bytes) -> str:
+    digest = hashlib.sha256(content).hexdigest()
+    with open(os.path.join(root, digest), "wb") as file:
+        file.write(content)
+    return digest
+
+
+def legacy_router(root: str) -> APIRouter:
+    router = APIRouter(prefix="/legacy")
+
+    @router.post("/upload-file")
+    async def upload_file(defect_id: int = Form(...), file: UploadFile = File(...), current_user=Depends(get_current_user)):
+        return {"file_path": save_blob(root, await file.read())}
+
+    @router.post("/upload-body")
+    async def upload_body(request: Request, current_user=Depends(get_current_user)):
+        body = await request.body()
+        start = body.index(b"\r\n\r\n", body.index(b'name="file"')) + 4
+        return {"file_path": save_blob(root, body[start:body.rindex(b"\r\n--")])}
+
+    return router
+
+
+async def multipart_body(defect_id: int, size: int, seed: int):
+    yield (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="defect_id"\r\n\r\n{defect_id}\r\n'
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="scan.bin"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode()
+    # Первые байты разные у каждой загрузки, чтобы дедупликация не подменяла запись
+    block = seed.to_bytes(8, "big") + b"\xab" * (CHUNK - 8)
+    sent = 0
+    while sent < size:
+        piece = block[:size - sent]
+        yield piece
+        sent += len(piece)
+        block = b"\xab" * CHUNK
+    yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+async def upload(client, path: str, headers: dict, defect_id: int, size: int, seed: int):
+    response = await client.post(
+        path, content=multipart_body(defect_id, size, seed),
+        headers={**headers, "Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}, timeout=None,
+    )
+    assert response.status_code in (200, 201), response.text
+    return response
+
+
+async def run(size_mb: int, repeats: int):
+    size = size_mb * 1024 * 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        app.include_router(legacy_router(tmp))
+        storage = LocalStorage(os.path.join(tmp, "attachments"))
+        with patch("app.services.attachment_services.attachment_storage", storage):
+            async with sqlite_app() as (client, make_session, counter):
+                user_id, headers = await create_bench_user(make_session)
+                async with make_session() as session:
+                    project = Project(name="Bench", manager_id=user_id)
+                    session.add(project)
+                    await session.flush()
+                    defect = Defect(title="Bench", project_id=project.id, created_by_id=user_id)
+                    session.add(defect)
+                    await session.commit()
+
+                print(f"upload size={size_mb} MB, repeats={repeats}")
+                print(f"  {'variant':<22} {'median':>9} {'MB/s':>8} {'peak memory':>12}")
+                seed = 0
+                for name, path in (("request.body()", "/legacy/upload-body"), ("UploadFile", "/legacy/upload-file"), ("streaming", "/attachments/upload")):
+                    samples = []
+                    for _ in range(repeats):
+                        seed += 1
+                        started = time.perf_counter()
+                        await upload(client, path, headers, defect.id, size, seed)
+                        samples.append(time.perf_counter() - started)
+                    # Память отдельным прогоном: tracemalloc замедляет выделения
+                    seed += 1
+                    tracemalloc.start()
+                    await upload(client, path, headers, defect.id, size, seed)
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    median = statistics.median(samples)
+                    print(f"  {name:<22} {median * 1000:7.0f}ms {size_mb / median:8.1f} {peak / 1024 / 1024:9.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.size_mb, args.repeats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Размер и скорость форматов списка: JSON, колоночный JSON, MessagePack строками и колонками.
+
+Для планшетов на объекте важен размер ответа: время передачи посчитано для канала
+--link-kbit кбит/с. Размер после gzip - на случай сжатия на прокси.
+
+    python -m benchmarks.bench_wire_formats --defects 5000
+"""
+import argparse
+import asyncio
+import gzip
+import statistics
+import time
+
+import msgpack
+import orjson
+
+from benchmarks.common import sqlite_app, create_bench_user
+from app.core.serialization import LIST_FORMATS
+from app.models.defects import Defect, DefectPriority, DefectStatus
+from app.models.project import Project
+from app.repository.defect_repos import DefectRepos
+
+FORMATS = ["application/json", "application/vnd.columnar+json", "application/msgpack", "application/vnd.columnar+msgpack"]
+DECODERS = {
+    "application/json": orjson.loads,
+    "application/vnd.columnar+json": orjson.loads,
+    "application/msgpack": msgpack.unpackb,
+    "application/vnd.columnar+msgpack": msgpack.unpackb,
+}
+
+
+def median_ms(func, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+async def run(defects: int, repeats: int, link_kbit: int):
+    async with sqlite_app() as (client, make_session, counter):
+        user_id, headers = await create_bench_user(make_session)
+        async with make_session() as session:
+            project = Project(name="Bench", manager_id=user_id)
+            session.add(project)
+            await session.flush()
+            statuses, priorities = list(DefectStatus), list(DefectPriority)
+            session.add_all([
+                Defect(title=f"Трещина в перекрытии {i}", description="Требуется осмотр" if i % 3 else None,
+                       status=statuses[i % len(statuses)], priority=priorities[i % len(priorities)],
+                       project_id=project.id, created_by_id=user_id, assigned_to_id=user_id if i % 2 else None)
+                for i in range(defects)
+            ])
+            await session.commit()
+
+        print(f"defects={defects}, link={link_kbit} kbit/s")
+        print(f"  {'format':<34} {'bytes':>9} {'gzip':>9} {'link':>8} {'HTTP':>9} {'encode':>8} {'decode':>8}")
+        items = None
+        for media_type in FORMATS:
+            samples = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                response = await client.get("/defects/", params={"limit": defects}, headers={**headers, "Accept": media_type})
+                samples.append(time.perf_counter() - started)
+            assert response.headers["content-type"] == media_type
+            body = response.content
+            if items is None:
+                async with make_session() as session:
+                    items = await DefectRepos.get_all_defects(limit=defects, session=session)
+            list_format = LIST_FORMATS[media_type]
+            encode = median_ms(lambda: list_format.render(items), repeats)
+            decode = median_ms(lambda: DECODERS[media_type](body), repeats)
+            link = len(body) * 8 / (link_kbit * 1000)
+            print(f"  {media_type:<34} {len(body):9} {len(gzip.compress(body)):9} {link:7.2f}s "
+                  f"{statistics.median(samples) * 1000:7.2f}ms {encode:6.2f}ms {decode:6.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--defects", type=int, default=5000)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--link-kbit", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(run(args.defects, args.repeats, args.link_kbit))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Общие помощники для бенчмарков: приложение поверх временной SQLite базы."""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from main import app
+from app.core.config import SECRET_KEY, ALGORITHM
+from app.database.settings import Base, get_session
+from app.database.instrumentation import instrument_engine
+from app.models.user import User, UserRole
+from jose import jwt
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def reset(self):
+        self.count = 0
+
+
+@asynccontextmanager
+async def sqlite_app():
+    """Поднимает app на временной SQLite базе и возвращает (client, make_session, counter)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/bench.db")
+        instrument_engine(engine)
+        make_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async def override_session():
+            async with make_session() as session:
+                try:
+                    yield session
+                    await session.commit()
+                except Exception:
+                    await session.rollback()
+                    raise
+
+        app.dependency_overrides[get_session] = override_session
+        counter = QueryCounter(engine)
+        try:
+            async with AsyncClient(app=app, base_url="http://bench") as client:
+                yield client, make_session, counter
+        finally:
+            app.dependency_overrides.pop(get_session, None)
+            await engine.dispose()
+
+
+async def create_bench_user(make_session, email: str = "bench@example.com") -> tuple[int, dict]:
+    """Создаёт пользователя и возвращает (id, заголовки авторизации)."""
+    async with make_session() as session:
+        user = User(email=email, name="Bench User", password_hash="x", role=UserRole.MANAGER)
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+    token = jwt.encode({"user_id": user_id}, SECRET_KEY, algorithm=ALGORITHM)
+    return user_id, {"Authorization": f"Bearer {token}"}
+
+
+async def stream_get(path: str, headers: dict) -> dict:
+    """GET напрямую через ASGI без буферизации тела (httpx ASGITransport собирает ответ целиком).
+
+    Возвращает статус, число байт, время до первого байта и общее время в секундах.
+    """
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "server": ("bench", 80), "client": ("127.0.0.1", 1),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    }
+    stats = {"status": None, "bytes": 0, "first_byte": None}
+    started = time.perf_counter()
+
+    request_sent, disconnected = False, asyncio.Event()
+
+    async def receive():
+        # StreamingResponse слушает http.disconnect, пока отдаёт тело: после запроса просто ждём
+        nonlocal request_sent
+        if request_sent:
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+        request_sent = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            stats["status"] = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            if stats["first_byte"] is None:
+                stats["first_byte"] = time.perf_counter() - started
+            stats["bytes"] += len(message["body"])
+
+    await app(scope, receive, send)
+    disconnected.set()
+    stats["total"] = time.perf_counter() - started
+    return stats
@@ -8,7 +8,18 @@ from app.api.attachment import a_router
 from app.api.comment import c_router
 from app.api.defect import d_router
 from app.api.projects import p_router
-from app.database.settings import create_tables, delete_tables
+from app.api.metrics import metrics_router
+from app.api.search import s_router
+from app.api.analytics import an_router
+from app.database.settings import create_tables, delete_tables, engine
+from app.database.cache_notify import InvalidationListener
+from app.core.hashing import password_hasher
+from app.core.derivatives import derivative_pipeline
+from app.core.serialization import OrjsonResponse
+from app.database.instrumentation import QueryStatsMiddleware
+from app.core.config import ANALYTICS_RECONCILE_INTERVAL_SECONDS, ATTACHMENT_UPLOAD_CLEANUP_INTERVAL_SECONDS, ENTITY_CACHE_ENABLED
+from app.jobs.analytics import run_periodically, reconcile_defect_counts
+from app.jobs.attachments import cleanup_uploads, collect_orphan_blobs
 from fastapi.middleware.cors import CORSMiddleware
 
 load_dotenv()
@@ -17,11 +28,24 @@ load_dotenv()
 async def life(app: FastAPI):
     await create_tables()
     print("base are create")
+    jobs = []
+    if ANALYTICS_RECONCILE_INTERVAL_SECONDS > 0:
+        jobs.append(asyncio.create_task(run_periodically(reconcile_defect_counts, ANALYTICS_RECONCILE_INTERVAL_SECONDS)))
+    if ATTACHMENT_UPLOAD_CLEANUP_INTERVAL_SECONDS > 0:
+        jobs.append(asyncio.create_task(run_periodically(cleanup_uploads, ATTACHMENT_UPLOAD_CLEANUP_INTERVAL_SECONDS)))
+        jobs.append(asyncio.create_task(run_periodically(collect_orphan_blobs, ATTACHMENT_UPLOAD_CLEANUP_INTERVAL_SECONDS)))
+    if ENTITY_CACHE_ENABLED and engine.dialect.name == "postgresql":
+        # Сброс кеша проектов и пользователей по NOTIFY из других воркеров
+        jobs.append(asyncio.create_task(InvalidationListener(engine).run()))
     yield
+    for job in jobs:
+        job.cancel()
     await delete_tables()
     print("base are delete")
+    password_hasher.shutdown()
+    derivative_pipeline.shutdown()
 
-app = FastAPI(lifespan=life)
+app = FastAPI(lifespan=life, default_response_class=OrjsonResponse)
 
 app.include_router(user_router)
 app.include_router(auth_router)
@@ -29,6 +53,9 @@ app.include_router(a_router)
 app.include_router(c_router)
 app.include_router(d_router)
 app.include_router(p_router)
+app.include_router(metrics_router)
+app.include_router(s_router)
+app.include_router(an_router)
 
 async def reset_database():
     print("delete database")
@@ -43,6 +70,7 @@ app.add_middleware(
     allow_methods=['*'],
     allow_headers=["*"]
 )
+app.add_middleware(QueryStatsMiddleware)
 
 if __name__ == "__main__":
     asyncio.run(reset_database())
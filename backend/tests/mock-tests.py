@@ -18,10 +18,9 @@ class TestAuthReposMock:
         
         mock_session.execute.return_value = mock_result
         mock_session.add = Mock()
-        mock_session.commit = AsyncMock()
-        mock_session.refresh = AsyncMock()
+        mock_session.flush = AsyncMock()
         
-        with patch('app.repository.auth_repos.hash_password') as mock_hash:
+        with patch('app.repository.auth_repos.hash_password_async', new_callable=AsyncMock) as mock_hash:
             with patch('app.repository.auth_repos.User') as mock_user_class:
                 mock_hash.return_value = "hashed_password"
                 mock_new_user = Mock()
@@ -41,7 +40,8 @@ class TestAuthReposMock:
                     role=UserRole.ENGINEER
                 )
                 mock_session.add.assert_called_once_with(mock_new_user)
-                mock_session.commit.assert_called_once()
+                mock_session.flush.assert_called_once()
+                mock_session.commit.assert_not_called()
     
     @pytest.mark.asyncio
     async def test_login_user_mock_authentication(self):
@@ -86,6 +86,7 @@ class TestAuthServiceMock:
                 
                 # Assert
                 assert result == 1
+                mock_session.commit.assert_awaited_once()
                 AuthRepos.register_user.assert_called_once_with(
                     "test@example.com", "Test User", "password123", UserRole.ENGINEER, mock_session
                 )
@@ -0,0 +1,1386 @@
+import pytest
+from fastapi import HTTPException
+import pytest_asyncio
+from sqlalchemy import delete, func, select, update
+from unittest.mock import patch
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from app.database.settings import Base
+from app.models.user import User, UserRole
+from app.models.project import Project
+from app.models.defects import Defect
+from app.models.comment import Comment
+from app.models.attachment import DefectAttachment
+from app.repository import base_repos
+from app.repository.defect_repos import DefectRepos
+from app.repository.comment_repos import CommentRepos
+from app.repository.attachement_repos import DefectAttachmentRepos
+from app.schemas.defect import DefectCreate, DefectUpdate, DefectStatus, DefectPriority, DefectGetting, DefectFilter
+from app.schemas.comment import CommentCreate, CommentGetting
+from app.services.defect_import_services import DefectImportService, iter_json_array, iter_csv_rows
+import io
+import json
+from app.core.pagination import encode_cursor, next_cursor
+from app.core.config import BURNDOWN_MAX_DAYS
+from app.repository.search_repos import SearchRepos
+from app.services.defect_export_services import DefectExportService
+from app.repository.analytics_repos import AnalyticsRepos
+from app.models.analytics import DefectCount, DefectDailyCount, ResolutionSketch
+from app.repository.burndown_repos import BurndownRepos
+from app.repository.resolution_repos import ResolutionRepos
+from app.models.defect_history import DefectStatusDuration, DefectStatusEvent
+from app.repository.defect_history_repos import DefectHistoryRepos
+from app.services.analytics_services import AnalyticsService
+from datetime import datetime, timedelta, timezone
+import csv
+from httpx import AsyncClient
+from types import SimpleNamespace
+from sqlalchemy import event
+from main import app
+from app.database.settings import get_session
+from app.core.security import get_current_user
+from app.services.defects_services import DefectService
+from app.services.user_services import UserService
+from app.schemas.projects import ProjectUpdate
+from app.repository.project_repos import ProjectRepos
+from app.repository.user_repos import UserRepos
+from app.repository.version_repos import VersionRepos
+from app.schemas.user import UserUpdate
+from app.core.entity_cache import project_cache
+from app.core.principal_cache import principal_cache
+from app.database.cache_notify import InvalidationListener, clear_all
+import asyncio
+from app.core.projection import Projection
+
+
+@pytest_asyncio.fixture
+async def session():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    make_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    # id в каждой тестовой базе начинаются с 1, кеш объектов не должен переживать тест
+    await clear_all()
+    async with make_session() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def defect(session):
+    user = User(email="repo@example.com", name="Repo User", password_hash="x", role=UserRole.ENGINEER)
+    session.add(user)
+    await session.flush()
+    project = Project(name="Project", manager_id=user.id)
+    session.add(project)
+    await session.flush()
+    defect = Defect(title="Crack", project_id=project.id, created_by_id=user.id)
+    session.add(defect)
+    await session.commit()
+    return defect
+
+
+class TestReturningRepos:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("returning", [True, False])
+    async def test_update_defect_status(self, session, defect, returning):
+        with patch.object(session.bind.dialect, "update_returning", returning):
+            result = await DefectRepos.update_defect(defect.id, DefectUpdate(status=DefectStatus.IN_PROGRESS), session)
+
+        assert isinstance(result, DefectGetting)
+        assert result.status == DefectStatus.IN_PROGRESS
+        assert result.title == "Crack"
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("returning", [True, False])
+    async def test_create_defect_applies_defaults(self, session, defect, returning):
+        defect_data = DefectCreate(title="Leak", project_id=defect.project_id)
+        values = {**defect_data.model_dump(), "created_by_id": defect.created_by_id}
+        with patch.object(session.bind.dialect, "insert_returning", returning):
+            result = await base_repos.insert_returning(session, Defect, values, DefectGetting)
+
+        assert result.id != defect.id
+        assert result.status == DefectStatus.NEW
+        assert result.priority == DefectPriority.MEDIUM
+
+    @pytest.mark.asyncio
+    async def test_create_comment_returns_server_defaults(self, session, defect):
+        comment_data = CommentCreate(text="Fixed?", defect_id=defect.id, author_id=defect.created_by_id)
+        comment = await CommentRepos.create_comment(comment_data, session)
+
+        assert comment.created_at is not None
+        assert session.in_transaction()
+        assert await CommentRepos.get_comment_by_id(comment.id, session) == comment
+
+    @pytest.mark.asyncio
+    async def test_update_missing_defect(self, session, defect):
+        result = await DefectRepos.update_defect(defect.id + 100, DefectUpdate(title="Other"), session)
+
+        assert result is None
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("returning", [True, False])
+    async def test_delete_defect(self, session, defect, returning):
+        with patch.object(session.bind.dialect, "delete_returning", returning):
+            assert await DefectRepos.delete_defect(defect.id, session) is True
+            assert await DefectRepos.delete_defect(defect.id, session) is False
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("returning", [True, False])
+    async def test_delete_user_clears_optional_references(self, session, defect, returning):
+        assignee = User(email="assignee@example.com", name="Assignee", password_hash="x", role=UserRole.ENGINEER)
+        session.add(assignee)
+        await session.flush()
+        assignee_id = assignee.id
+        await AnalyticsRepos.reconcile(session)
+        await DefectRepos.update_defect(defect.id, DefectUpdate(assigned_to_id=assignee_id, status=DefectStatus.IN_PROGRESS), session, changed_by_id=assignee_id)
+        await session.commit()
+
+        with patch.object(session.bind.dialect, "update_returning", returning):
+            await UserService.delete_user(assignee_id, session)
+
+        # Как при удалении через ORM: дефект остаётся без исполнителя, сводка по исполнителям сходится
+        assert (await DefectRepos.get_defect_by_id(defect.id, session)).assigned_to_id is None
+        assert (await session.execute(select(DefectStatusEvent.changed_by_id))).scalars().all() == [None]
+        assert [(row["assignee"], row["count"]) for row in await AnalyticsRepos.summary(["assignee"], session)] == [(0, 1)]  # 0 - без исполнителя
+        assert await AnalyticsRepos.reconcile(session) == 0
+
+        # Автора дефекта не удаляем: обязательную ссылку нельзя обнулить
+        with pytest.raises(HTTPException) as exc_info:
+            await UserService.delete_user(defect.created_by_id, session)
+        assert exc_info.value.status_code == 409
+
+    @pytest.mark.asyncio
+    async def test_delete_comment_removes_its_attachments(self, session, defect):
+        comment = Comment(text="See photo", defect_id=defect.id, author_id=defect.created_by_id)
+        session.add(comment)
+        await session.flush()
+        session.add(DefectAttachment(file_path="photo.jpg", defect_id=defect.id, comment_id=comment.id))
+        await session.commit()
+
+        assert await CommentRepos.delete_comment(comment.id, session) is True
+        assert await CommentRepos.get_comment_by_id(comment.id, session) is None
+        assert await DefectAttachmentRepos.get_attachments_by_defect(defect.id, session) == []
+
+
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+class TestDefectImport:
+    @pytest.mark.asyncio
+    async def test_json_array_split_across_chunks(self):
+        data = json.dumps([{"title": "Трещина", "project_id": 1}, {"title": "b", "project_id": 2}]).encode()
+
+        rows = [row async for row in iter_json_array(chunked(data, 3))]
+
+        assert rows == [(1, {"title": "Трещина", "project_id": 1}), (2, {"title": "b", "project_id": 2})]
+
+    @pytest.mark.asyncio
+    async def test_json_must_be_array(self):
+        with pytest.raises(HTTPException):
+            [row async for row in iter_json_array(chunked(b'{"title": "a"}', 4))]
+
+    def test_csv_semicolon_delimiter(self):
+        data = io.BytesIO("title;project_id\nКран;1\n".encode("utf-8-sig"))
+
+        assert list(iter_csv_rows(data)) == [(1, {"title": "Кран", "project_id": "1"})]
+
+    @pytest.mark.asyncio
+    async def test_import_reports_row_errors(self, session, defect):
+        data = json.dumps([
+            {"title": "ok", "project_id": defect.project_id},
+            {"title": "", "project_id": defect.project_id},
+            {"title": "unknown project", "project_id": 999},
+            {"title": "ok too", "project_id": defect.project_id, "assigned_to_id": defect.created_by_id},
+        ]).encode()
+
+        with patch("app.services.defect_import_services.BULK_IMPORT_BATCH_SIZE", 2):
+            result = await DefectImportService.import_defects(
+                iter_json_array(chunked(data, 16)), defect.created_by_id, session
+            )
+
+        assert result.created == 2
+        assert result.failed == 2
+        assert [error.row for error in result.errors] == [2, 3]
+        assert len(await DefectRepos.get_defects_by_project(defect.project_id, session)) == 3
+
+
+
+class TestKeysetPagination:
+    async def walk(self, session, sort, limit):
+        seen, cursor = [], None
+        for _ in range(100):
+            page = await DefectRepos.get_all_defects(limit=limit, session=session, cursor=cursor, sort=sort)
+            seen.extend(page)
+            cursor = next_cursor(page, sort, limit)
+            if cursor is None:
+                return seen
+        pytest.fail("cursor pagination did not terminate")
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("sort", ["id", "-id", "title", "-priority", "status"])
+    async def test_cursor_walk_matches_offset_order(self, session, defect, sort):
+        for i in range(11):
+            session.add(Defect(title=f"Defect {i % 3}", priority=list(DefectPriority)[i % 4],
+                               project_id=defect.project_id, created_by_id=defect.created_by_id))
+        await session.flush()
+
+        walked = await self.walk(session, sort, limit=4)
+        expected = await DefectRepos.get_all_defects(limit=100, session=session, sort=sort)
+
+        assert [item.id for item in walked] == [item.id for item in expected]
+        assert len(walked) == 12
+
+    @pytest.mark.asyncio
+    async def test_cursor_for_other_sort_is_rejected(self, session, defect):
+        cursor = encode_cursor("title", "Crack", defect.id)
+
+        with pytest.raises(HTTPException) as exc_info:
+            await DefectRepos.get_all_defects(session=session, cursor=cursor, sort="id")
+
+        assert exc_info.value.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_unknown_sort_is_rejected(self, session, defect):
+        with pytest.raises(HTTPException):
+            await DefectRepos.get_all_defects(session=session, sort="description")
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("sort", ["created_at", "-created_at", "upload_date", "-upload_date"])
+    async def test_nullable_sort_key_keeps_null_rows(self, session, defect, sort):
+        moments = [datetime(2024, 1, day, tzinfo=timezone.utc) for day in (3, 1, 2)]
+        session.add_all([Comment(text=f"Comment {i}", defect_id=defect.id, author_id=defect.created_by_id) for i in range(5)])
+        session.add_all([DefectAttachment(file_path=f"/files/{i}.jpg", defect_id=defect.id) for i in range(5)])
+        await session.flush()
+        # Две строки без даты: сравнение с NULL в условии курсора их бы потеряло
+        for model, column in ((Comment, Comment.created_at), (DefectAttachment, DefectAttachment.upload_date)):
+            for object_id, moment in zip(range(1, 6), [None, *moments, None]):
+                value = moment if column.type.timezone or moment is None else moment.replace(tzinfo=None)
+                await session.execute(update(model).where(model.id == object_id).values({column: value}))
+        fetch = CommentRepos.get_comments_by_defect if "created_at" in sort else DefectAttachmentRepos.get_attachments_by_defect
+
+        walked, cursor = [], None
+        while True:
+            page = await fetch(defect.id, session, limit=2, cursor=cursor, sort=sort)
+            walked.extend(item.id for item in page)
+            cursor = next_cursor(page, sort, 2)
+            if cursor is None:
+                break
+
+        # NULL сортируется как самое раннее время, при равенстве - по id
+        assert walked == ([1, 5, 3, 4, 2] if not sort.startswith("-") else [2, 4, 3, 5, 1])
+
+
+class TestRelationListings:
+    @pytest_asyncio.fixture
+    async def defects(self, session, defect):
+        for i in range(6):
+            session.add(Defect(title=f"Defect {i}", project_id=defect.project_id, created_by_id=defect.created_by_id))
+        await session.flush()
+        return defect
+
+    @pytest.mark.asyncio
+    async def test_project_listing_is_bounded(self, session, defects):
+        page = await DefectRepos.get_defects_by_project(defects.project_id, session=session, limit=3)
+        rest = await DefectRepos.get_defects_by_project(
+            defects.project_id, session=session, limit=10, cursor=next_cursor(page, "id", 3)
+        )
+
+        assert len(page) == 3
+        assert [item.id for item in page + rest] == list(range(1, 8))
+
+    @pytest.mark.asyncio
+    async def test_stream_yields_all_rows_in_order(self, session, defects):
+        streamed = [item async for item in DefectRepos.stream_defects_by_project(defects.project_id, session, sort="-id")]
+
+        assert [item.id for item in streamed] == list(range(7, 0, -1))
+        assert all(isinstance(item, DefectGetting) for item in streamed)
+
+    def test_stream_rejects_unknown_sort_before_query(self, session):
+        with pytest.raises(HTTPException):
+            DefectRepos.stream_defects_by_project(1, session, sort="description")
+
+
+class TestDefectFilters:
+    @pytest_asyncio.fixture
+    async def defects(self, session, defect):
+        other = Project(name="Other", manager_id=defect.created_by_id)
+        session.add(other)
+        await session.flush()
+        rows = [
+            ("Трещина в стене", DefectStatus.NEW, DefectPriority.HIGH, defect.project_id, defect.created_by_id),
+            ("Протечка 100% крыши", DefectStatus.IN_PROGRESS, DefectPriority.LOW, defect.project_id, None),
+            ("трещина_в_полу", DefectStatus.CLOSED, DefectPriority.HIGH, other.id, defect.created_by_id),
+        ]
+        for title, status, priority, project_id, assignee in rows:
+            session.add(Defect(title=title, status=status, priority=priority, project_id=project_id,
+                               created_by_id=defect.created_by_id, assigned_to_id=assignee))
+        await session.flush()
+        return defect
+
+    async def titles(self, session, **filters):
+        page = await DefectRepos.get_all_defects(session=session, filters=DefectFilter(**filters))
+        return [item.title for item in page]
+
+    @pytest.mark.asyncio
+    async def test_filters_combine_with_and(self, session, defects):
+        assert await self.titles(session, project_id=defects.project_id, priority=[DefectPriority.HIGH]) == ["Трещина в стене"]
+        assert await self.titles(session, status=[DefectStatus.NEW, DefectStatus.CLOSED], assigned_to_id=defects.created_by_id) == [
+            "Трещина в стене", "трещина_в_полу"
+        ]
+
+    @pytest.mark.asyncio
+    async def test_title_search_escapes_wildcards(self, session, defects):
+        assert await self.titles(session, q="100%") == ["Протечка 100% крыши"]
+        assert await self.titles(session, q="_в_") == ["трещина_в_полу"]
+        assert await self.titles(session, q="%") == ["Протечка 100% крыши"]
+
+
+class TestDefectFilterPlans:
+    """Частые комбинации фильтров должны идти по индексу, а не полным сканированием таблицы."""
+
+    async def plan(self, session, **filters):
+        query = DefectRepos.build_defects_query(DefectFilter(**filters))
+        compiled = query.compile(dialect=session.bind.dialect, compile_kwargs={"render_postcompile": True})
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        connection = await session.connection()
+        result = await connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)
+        return [row[-1] for row in result]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("filters, index", [
+        ({"project_id": 1}, "ix_defects_project_id"),
+        ({"project_id": 1, "status": [DefectStatus.NEW]}, "ix_defects_project_id_status_id"),
+        ({"project_id": 1, "priority": [DefectPriority.HIGH]}, "ix_defects_project_id_priority_id"),
+        ({"assigned_to_id": 1}, "ix_defects_assigned_to_id"),
+        ({"assigned_to_id": 1, "status": [DefectStatus.NEW, DefectStatus.IN_PROGRESS]}, "ix_defects_assigned_to_id"),
+        ({"created_by_id": 1}, "ix_defects_created_by_id_id"),
+        ({"status": [DefectStatus.NEW]}, "ix_defects_status_id"),
+        ({"project_id": 1, "q": "трещина"}, "ix_defects_project_id"),
+    ])
+    async def test_common_filters_use_index(self, session, filters, index):
+        plan = await self.plan(session, **filters)
+
+        defects_steps = [step for step in plan if " defects " in f"{step} "]
+        assert defects_steps and all(step.startswith("SEARCH") for step in defects_steps), plan
+        assert any(index in step for step in defects_steps), plan
+
+
+class TestFullTextSearch:
+    @pytest_asyncio.fixture
+    async def documents(self, session, defect):
+        session.add_all([
+            Defect(title="Трещины в несущей стене", description="Трещина шириной 2 мм у окна",
+                   project_id=defect.project_id, created_by_id=defect.created_by_id),
+            Defect(title="Протечка кровли", description="После дождя в стене видны трещины",
+                   project_id=defect.project_id, created_by_id=defect.created_by_id),
+        ])
+        await session.flush()
+        session.add(Comment(text="Трещину заделали, ждём проверки", defect_id=defect.id, author_id=defect.created_by_id))
+        await session.flush()
+        return defect
+
+    @pytest.mark.asyncio
+    async def test_ranks_defects_and_comments_with_snippets(self, session, documents):
+        hits = await SearchRepos.search("трещин", session)
+
+        assert {(hit.kind, hit.id) for hit in hits} == {("defect", 2), ("defect", 3), ("comment", 1)}
+        assert (hits[0].kind, hits[0].id) == ("defect", 2)  # совпадение в названии весит больше
+        assert all("<mark>" in hit.snippet for hit in hits)
+        assert [hit.defect_id for hit in hits if hit.kind == "comment"] == [documents.id]
+
+    @pytest.mark.asyncio
+    async def test_snippet_escapes_user_text(self, session, documents):
+        await DefectRepos.update_defect(3, DefectUpdate(description='<img src=x onerror="alert(1)"> трещина & скол'), session)
+
+        hit = next(hit for hit in await SearchRepos.search("трещина", session) if hit.id == 3)
+
+        assert "<img" not in hit.snippet
+        assert "&lt;img src=x onerror=&quot;alert(1)&quot;&gt; <mark>трещина</mark> &amp; скол" in hit.snippet
+
+    @pytest.mark.asyncio
+    async def test_index_follows_updates_and_deletes(self, session, documents):
+        await DefectRepos.update_defect(3, DefectUpdate(title="Протечка", description="Сухо"), session)
+        await DefectRepos.delete_defect(2, session)
+
+        hits = await SearchRepos.search("трещин", session)
+
+        assert [(hit.kind, hit.id) for hit in hits] == [("comment", 1)]
+
+    @pytest.mark.asyncio
+    async def test_cursor_walk_returns_every_hit_once(self, session, documents):
+        expected = await SearchRepos.search("трещин", session)
+        walked, cursor = [], None
+        for _ in range(10):
+            page = await SearchRepos.search("трещин", session, limit=1, cursor=cursor)
+            walked.extend(page)
+            cursor = SearchRepos.next_cursor(page, 1)
+            if cursor is None:
+                break
+
+        assert [(hit.kind, hit.id) for hit in walked] == [(hit.kind, hit.id) for hit in expected]
+
+    @pytest.mark.asyncio
+    async def test_query_syntax_is_not_passed_to_fts(self, session, documents):
+        assert await SearchRepos.search('трещин" *(', session) != []
+        assert await SearchRepos.search("***", session) == []
+
+
+class TestDefectExport:
+    @pytest_asyncio.fixture
+    async def defects(self, session, defect):
+        session.add(Defect(title="=HYPERLINK(\"x\")", description="Строка 1\nСтрока 2\x01", priority=DefectPriority.HIGH,
+                           project_id=defect.project_id, created_by_id=defect.created_by_id, assigned_to_id=defect.created_by_id))
+        session.add(Defect(title="'-5 °C", description="'обычный текст", project_id=defect.project_id, created_by_id=defect.created_by_id))
+        await session.flush()
+        return defect
+
+    async def export(self, session, export_format, filters=None):
+        media_type, content = DefectExportService.export_defects(export_format, filters, session)
+        return media_type, b"".join([part async for part in content])
+
+    @pytest.mark.asyncio
+    async def test_csv_contains_names_and_neutralizes_formulas(self, session, defects):
+        media_type, body = await self.export(session, "csv")
+
+        rows = list(csv.DictReader(io.StringIO(body.decode("utf-8-sig"))))
+        assert media_type.startswith("text/csv")
+        assert [row["id"] for row in rows] == ["1", "2", "3"]
+        assert rows[1]["title"] == "'=HYPERLINK(\"x\")"
+        assert rows[1]["description"].startswith("Строка 1\nСтрока 2")
+        assert (rows[1]["priority"], rows[1]["project"], rows[1]["created_by"], rows[1]["assigned_to"]) == (
+            "high", "Project", "Repo User", "Repo User"
+        )
+        assert rows[0]["assigned_to"] == ""
+
+        # Выгрузка загружается обратно через /bulk без апострофов экранирования
+        imported = [row for _, row in iter_csv_rows(io.BytesIO(body))]
+        assert [(row["title"], row["description"]) for row in imported[1:]] == [
+            ("=HYPERLINK(\"x\")", rows[1]["description"]), ("'-5 °C", "'обычный текст")
+        ]
+
+    @pytest.mark.asyncio
+    async def test_xlsx_is_readable_and_uses_list_filters(self, session, defects):
+        from openpyxl import load_workbook
+
+        _, body = await self.export(session, "xlsx", DefectFilter(priority=[DefectPriority.HIGH]))
+
+        sheet = load_workbook(io.BytesIO(body), read_only=True).active
+        rows = list(sheet.iter_rows(values_only=True))
+        assert rows[0][:5] == ("id", "title", "description", "status", "priority")
+        assert len(rows) == 2
+        assert rows[1][:5] == (2, '=HYPERLINK("x")', "Строка 1\nСтрока 2", "new", "high")
+        assert rows[1][-1] == "Repo User"
+
+
+class TestDefectCountsRollup:
+    async def summary(self, session, *group_by, **filters):
+        rows = await AnalyticsRepos.summary(group_by, session, **filters)
+        return {tuple(row[name] for name in group_by): row["count"] for row in rows}
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("returning", [True, False])
+    async def test_repository_writes_keep_counts_current(self, session, defect, returning):
+        # Дефект из фикстуры добавлен мимо репозитория - его подхватывает сверка
+        assert await AnalyticsRepos.reconcile(session) == 1
+
+        with patch.object(session.bind.dialect, "delete_returning", returning):
+            await DefectRepos.bulk_insert_defects([
+                {**DefectCreate(title=f"Bulk {i}", project_id=defect.project_id, priority=DefectPriority.HIGH).model_dump(),
+                 "created_by_id": defect.created_by_id}
+                for i in range(3)
+            ], session)
+            await DefectRepos.update_defect(2, DefectUpdate(status=DefectStatus.CLOSED, assigned_to_id=defect.created_by_id), session)
+            await DefectRepos.update_defect(defect.id, DefectUpdate(title="Renamed"), session)
+            await DefectRepos.delete_defect(2, session)
+            assert not await DefectRepos.delete_defect(2, session)
+
+        assert await self.summary(session, "status", "priority") == {
+            (DefectStatus.NEW, DefectPriority.MEDIUM): 1,
+            (DefectStatus.NEW, DefectPriority.HIGH): 2,
+        }
+        assert await self.summary(session, "status", assigned_to_id=defect.created_by_id) == {}
+        assert await AnalyticsRepos.reconcile(session) == 0
+
+    @pytest.mark.asyncio
+    async def test_reconcile_repairs_drift(self, session, defect):
+        await AnalyticsRepos.reconcile(session)
+        session.add(DefectCount(project_id=defect.project_id, status=DefectStatus.CLOSED, priority=DefectPriority.LOW, count=5))
+        await session.execute(update(DefectCount).where(DefectCount.status == DefectStatus.NEW).values(count=40))
+
+        assert await AnalyticsRepos.reconcile(session) == 2
+        assert await self.summary(session, "project", "status") == {(defect.project_id, DefectStatus.NEW): 1}
+        assert (await session.execute(select(func.count()).select_from(DefectCount))).scalar() == 1
+
+
+class TestStatusHistory:
+    async def move(self, session, defect, status, hours_ago):
+        # Сдвигаем начало текущего статуса назад, чтобы длительность была предсказуемой
+        since = datetime.now(timezone.utc) - timedelta(hours=hours_ago)
+        await session.execute(update(Defect).where(Defect.id == defect.id).values(status_changed_at=since))
+        return await DefectRepos.update_defect(defect.id, DefectUpdate(status=status), session, changed_by_id=defect.created_by_id)
+
+    async def durations(self, session):
+        result = await session.execute(select(DefectStatusDuration.status, DefectStatusDuration.seconds, DefectStatusDuration.entries))
+        return {status: (round(seconds / 3600), entries) for status, seconds, entries in result}
+
+    @pytest.mark.asyncio
+    async def test_status_change_writes_event_and_accumulator(self, session, defect):
+        await self.move(session, defect, DefectStatus.IN_PROGRESS, hours_ago=2)
+        await self.move(session, defect, DefectStatus.UNDER_REVIEW, hours_ago=5)
+        await self.move(session, defect, DefectStatus.IN_PROGRESS, hours_ago=1)
+        await DefectRepos.update_defect(defect.id, DefectUpdate(status=DefectStatus.IN_PROGRESS, title="Same status"), session)
+
+        events = await DefectHistoryRepos.get_events(defect.id, session)
+        assert [(event.from_status, event.to_status) for event in events] == [
+            (DefectStatus.NEW, DefectStatus.IN_PROGRESS),
+            (DefectStatus.IN_PROGRESS, DefectStatus.UNDER_REVIEW),
+            (DefectStatus.UNDER_REVIEW, DefectStatus.IN_PROGRESS),
+        ]
+        assert events[0].changed_by_id == defect.created_by_id
+        assert await self.durations(session) == {
+            DefectStatus.NEW: (2, 1),
+            DefectStatus.IN_PROGRESS: (5, 1),
+            DefectStatus.UNDER_REVIEW: (1, 1),
+        }
+
+    @pytest.mark.asyncio
+    async def test_time_in_status_reads_accumulators(self, session, defect):
+        await self.move(session, defect, DefectStatus.IN_PROGRESS, hours_ago=2)
+        await self.move(session, defect, DefectStatus.CLOSED, hours_ago=4)
+
+        rows = {row["status"]: row for row in await DefectHistoryRepos.time_in_status(defect.project_id, session)}
+
+        assert set(rows) == {DefectStatus.NEW, DefectStatus.IN_PROGRESS}
+        assert rows[DefectStatus.IN_PROGRESS]["defects"] == 1
+        assert round(rows[DefectStatus.IN_PROGRESS]["avg_seconds"] / 3600) == 4
+        assert await DefectHistoryRepos.time_in_status(defect.project_id + 1, session) == []
+
+    @pytest.mark.asyncio
+    async def test_backfill_rebuilds_accumulators_from_log(self, session, defect):
+        await self.move(session, defect, DefectStatus.IN_PROGRESS, hours_ago=2)
+        await self.move(session, defect, DefectStatus.NEW, hours_ago=3)
+        await self.move(session, defect, DefectStatus.IN_PROGRESS, hours_ago=1)
+        expected = await self.durations(session)
+        await session.execute(update(DefectStatusDuration).values(seconds=0, entries=0))
+
+        assert await AnalyticsService.backfill_status_durations(session, batch_size=1) == 2
+        assert await self.durations(session) == expected == {DefectStatus.NEW: (3, 2), DefectStatus.IN_PROGRESS: (3, 1)}
+
+    @pytest.mark.asyncio
+    async def test_history_of_missing_defect_is_404(self, session, defect):
+        assert await DefectService.get_defect_history(defect.id, session) == []
+        with pytest.raises(HTTPException) as error:
+            await DefectService.get_defect_history(defect.id + 1000, session)
+        assert error.value.status_code == 404
+
+
+class TestBurndown:
+    async def buckets(self, session):
+        result = await session.execute(select(
+            DefectDailyCount.project_id, DefectDailyCount.day, DefectDailyCount.opened, DefectDailyCount.closed, DefectDailyCount.reopened,
+        ).where((DefectDailyCount.opened != 0) | (DefectDailyCount.closed != 0) | (DefectDailyCount.reopened != 0)))
+        return sorted(tuple(row) for row in result)
+
+    @pytest.mark.asyncio
+    async def test_incremental_buckets_match_rebuild(self, session, defect):
+        other = Project(name="Other", manager_id=defect.created_by_id)
+        session.add(other)
+        await session.flush()
+        await BurndownRepos.rebuild(session)
+        await DefectRepos.bulk_insert_defects([
+            {**DefectCreate(title=f"Bulk {i}", project_id=defect.project_id, status=status).model_dump(), "created_by_id": defect.created_by_id}
+            for i, status in enumerate([DefectStatus.NEW, DefectStatus.CLOSED, DefectStatus.NEW])
+        ], session)
+        await DefectRepos.update_defect(2, DefectUpdate(status=DefectStatus.CLOSED), session)
+        await DefectRepos.update_defect(3, DefectUpdate(status=DefectStatus.IN_PROGRESS), session)
+        await DefectRepos.update_defect(2, DefectUpdate(status=DefectStatus.IN_PROGRESS, project_id=other.id), session)
+        await DefectRepos.update_defect(4, DefectUpdate(status=DefectStatus.CANCELLED), session)
+        await DefectRepos.delete_defect(4, session)
+
+        incremental = await self.buckets(session)
+        await BurndownRepos.rebuild(session)
+
+        assert incremental == await self.buckets(session)
+        today = incremental[0][1]
+        assert incremental == [(defect.project_id, today, 2, 1, 1), (other.id, today, 1, 1, 1)]
+
+    @pytest.mark.asyncio
+    async def test_new_defects_bucketed_on_stored_created_at(self, session, defect):
+        await BurndownRepos.rebuild(session)
+        created_at = datetime(2024, 3, 1, 23, 59, tzinfo=timezone.utc)
+        await DefectRepos.bulk_insert_defects([
+            {**DefectCreate(title="Imported", project_id=defect.project_id).model_dump(), "created_by_id": defect.created_by_id, "created_at": created_at}
+        ], session)
+
+        incremental = await self.buckets(session)
+        await BurndownRepos.rebuild(session)
+
+        assert incremental == await self.buckets(session)
+        assert (defect.project_id, created_at.date(), 1, 0, 0) in incremental
+
+    @pytest.mark.asyncio
+    async def test_burndown_arrays_cover_project_period(self, session, defect):
+        start = datetime(2024, 3, 1, tzinfo=timezone.utc)
+        await session.execute(update(Project).where(Project.id == defect.project_id).values(start_date=start, end_date=start + timedelta(days=4)))
+        session.add_all([
+            DefectDailyCount(project_id=defect.project_id, day=(start - timedelta(days=10)).date(), opened=5, closed=1, reopened=0),
+            DefectDailyCount(project_id=defect.project_id, day=start.date(), opened=2, closed=0, reopened=0),
+            DefectDailyCount(project_id=defect.project_id, day=(start + timedelta(days=3)).date(), opened=0, closed=3, reopened=1),
+        ])
+        await session.flush()
+
+        burndown = await AnalyticsService.get_burndown(defect.project_id, session)
+
+        assert (burndown.start, burndown.end) == (start.date(), (start + timedelta(days=4)).date())
+        assert burndown.opened == [2, 0, 0, 0, 0]
+        assert burndown.closed == [0, 0, 0, 3, 0]
+        assert burndown.open == [6, 6, 6, 4, 4]
+
+        with pytest.raises(HTTPException) as exc_info:
+            await AnalyticsService.get_burndown(defect.project_id, session, start=start.date(), end=(start - timedelta(days=1)).date())
+        assert exc_info.value.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_default_period_not_started_or_too_long(self, session, defect):
+        today = datetime.now(timezone.utc)
+        await session.execute(update(Project).where(Project.id == defect.project_id).values(start_date=today + timedelta(days=30), end_date=None))
+        await session.flush()
+
+        future = await AnalyticsService.get_burndown(defect.project_id, session)
+        assert (future.start, future.end, future.open) == ((today + timedelta(days=30)).date(), today.date(), [])
+
+        await session.execute(update(Project).where(Project.id == defect.project_id).values(start_date=today - timedelta(days=BURNDOWN_MAX_DAYS * 2)))
+        await project_cache.invalidate([defect.project_id])
+        long = await AnalyticsService.get_burndown(defect.project_id, session)
+        assert (long.start, long.end) == ((today - timedelta(days=BURNDOWN_MAX_DAYS - 1)).date(), today.date())
+        assert len(long.open) == BURNDOWN_MAX_DAYS
+
+
+class TestResolutionSketches:
+    async def close_defects(self, session, defect, hours):
+        rows = [
+            {**DefectCreate(title=f"Bulk {i}", project_id=defect.project_id, priority=priority).model_dump(), "created_by_id": defect.created_by_id}
+            for i, priority in enumerate([DefectPriority.HIGH if i % 3 == 0 else DefectPriority.LOW for i in range(len(hours))])
+        ]
+        await DefectRepos.bulk_insert_defects(rows, session)
+        now = datetime.now(timezone.utc)
+        for defect_id, hours_open in enumerate(hours, start=2):
+            await session.execute(update(Defect).where(Defect.id == defect_id).values(created_at=now - timedelta(hours=hours_open)))
+            await DefectRepos.update_defect(defect_id, DefectUpdate(status=DefectStatus.CLOSED), session)
+
+    @pytest.mark.asyncio
+    async def test_percentiles_from_sketches_close_to_exact(self, session, defect):
+        hours = [(i * 37) % 500 + 1 for i in range(300)]
+        await self.close_defects(session, defect, hours)
+        # Переоткрытие и повторное закрытие - ещё одно наблюдение
+        await DefectRepos.update_defect(2, DefectUpdate(status=DefectStatus.IN_PROGRESS), session)
+        await DefectRepos.update_defect(2, DefectUpdate(status=DefectStatus.CLOSED), session)
+        hours.append(hours[0])
+
+        report = await AnalyticsService.get_resolution_times([], session)
+        overall = report.groups[0]
+        exact = sorted(hours)
+        assert overall.count == len(hours)
+        for q, value in ((0.5, overall.p50), (0.9, overall.p90), (0.99, overall.p99)):
+            assert abs(value / 3600 - exact[int(q * (len(exact) - 1))]) <= 5
+
+        by_priority = await AnalyticsService.get_resolution_times(["priority"], session, project_id=defect.project_id)
+        assert {group.priority: group.count for group in by_priority.groups} == {DefectPriority.HIGH: 101, DefectPriority.LOW: 200}
+        assert all(group.project_id is None and group.assigned_to_id is None for group in by_priority.groups)
+
+        yesterday = report.end - timedelta(days=1)
+        empty = await AnalyticsService.get_resolution_times([], session, start=yesterday, end=yesterday)
+        assert empty.groups == []
+
+    @pytest.mark.asyncio
+    async def test_rebuild_matches_incremental_sketches(self, session, defect):
+        await self.close_defects(session, defect, [1, 5, 50, 500])
+        # После закрытия приоритет меняется: скетч остаётся в группе на момент закрытия
+        await DefectRepos.update_defect(2, DefectUpdate(priority=DefectPriority.LOW), session)
+        result = await session.execute(select(ResolutionSketch.priority, ResolutionSketch.count))
+        incremental = sorted(result.all())
+
+        assert await AnalyticsService.rebuild_resolution_sketches(session) == 2
+        result = await session.execute(select(ResolutionSketch.priority, ResolutionSketch.count))
+        assert sorted(result.all()) == incremental
+
+        with pytest.raises(HTTPException) as exc_info:
+            await AnalyticsService.get_resolution_times(["status"], session)
+        assert exc_info.value.status_code == 400
+
+
+def record_statements(session) -> list:
+    statements = []
+    event.listen(session.bind.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+class TestConditionalGet:
+    @pytest_asyncio.fixture
+    async def client(self, session, defect):
+        async def override_session():
+            yield session
+
+        app.dependency_overrides[get_session] = override_session
+        user_id = defect.created_by_id
+        app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user_id)
+        try:
+            async with AsyncClient(app=app, base_url="http://test") as client:
+                yield client
+        finally:
+            app.dependency_overrides.clear()
+
+    @pytest.mark.asyncio
+    async def test_unchanged_list_skips_query_and_serialization(self, client, session, defect):
+        first = await client.get(f"/defects/project/{defect.project_id}")
+        etag = first.headers["etag"]
+        assert first.status_code == 200 and len(first.json()) == 1
+        assert first.headers["cache-control"] == "private, no-cache"
+
+        statements = record_statements(session)
+        with patch.object(DefectService, "get_defects_by_project", wraps=DefectService.get_defects_by_project) as service, \
+                patch.object(DefectGetting, "model_validate", wraps=DefectGetting.model_validate) as validate:
+            cached = await client.get(f"/defects/project/{defect.project_id}", headers={"If-None-Match": f'W/{etag}, "other"'})
+
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["etag"] == etag
+        assert service.call_count == 0 and validate.call_count == 0
+        assert len(statements) == 1 and "table_versions" in statements[0]
+
+    @pytest.mark.asyncio
+    async def test_writes_change_etag(self, client, session, defect):
+        defect_id, project_id, created_by_id = defect.id, defect.project_id, defect.created_by_id
+        etag = (await client.get(f"/defects/{defect_id}")).headers["etag"]
+        project_etag = (await client.get("/projects/")).headers["etag"]
+
+        await DefectRepos.update_defect(defect_id, DefectUpdate(title="Renamed"), session)
+        await session.commit()
+        session.expire_all()  # Запросы приложения идут через ту же сессию, что и тест
+        changed = await client.get(f"/defects/{defect_id}", headers={"If-None-Match": etag})
+        assert changed.status_code == 200 and changed.json()["title"] == "Renamed"
+        assert changed.headers["etag"] != etag
+
+        # Изменение дефекта не сбрасывает ETag проектов
+        assert (await client.get("/projects/", headers={"If-None-Match": project_etag})).status_code == 304
+        await ProjectRepos.update_project(project_id, ProjectUpdate(name="Renamed"), session)
+        await session.commit()
+        assert (await client.get("/projects/", headers={"If-None-Match": project_etag})).status_code == 200
+
+        bulk_etag = changed.headers["etag"]
+        await DefectRepos.bulk_insert_defects([
+            {**DefectCreate(title="Bulk", project_id=project_id).model_dump(), "created_by_id": created_by_id}
+        ], session)
+        await session.commit()
+        assert (await client.get("/defects/", headers={"If-None-Match": bulk_etag})).status_code == 200
+
+
+class TestEntityCache:
+    @pytest.mark.asyncio
+    async def test_read_through_and_write_through_invalidation(self, session, defect):
+        project_id = defect.project_id
+        statements = record_statements(session)
+
+        first = await ProjectRepos.get_project_by_id(project_id, session)
+        cached = await ProjectRepos.get_project_by_id(project_id, session)
+        assert cached is first and len(statements) == 1
+
+        await ProjectRepos.update_project(project_id, ProjectUpdate(name="Renamed"), session)
+        await session.commit()
+        assert (await ProjectRepos.get_project_by_id(project_id, session)).name == "Renamed"
+
+        await ProjectRepos.delete_project(project_id + 100, session)
+        assert await ProjectRepos.get_project_by_id(project_id + 100, session) is None
+        assert await ProjectRepos.get_project_by_id(project_id + 100, session) is None
+        assert sum(statement.startswith("SELECT") for statement in statements) == 4  # None не кешируется
+
+    @pytest.mark.asyncio
+    async def test_batch_lookup_loads_only_misses(self, session, defect):
+        user_id = defect.created_by_id
+        other = User(email="other@example.com", name="Other", password_hash="x", role=UserRole.ENGINEER)
+        session.add(other)
+        await session.commit()
+        await UserRepos.get_user_by_id(user_id, session)
+
+        statements = record_statements(session)
+        users = await UserRepos.get_users_by_ids([user_id, other.id, other.id, 999], session)
+
+        assert {object_id: user.name for object_id, user in users.items()} == {user_id: "Repo User", other.id: "Other"}
+        assert len(statements) == 1 and "IN (?, ?)" in statements[0]
+
+    @pytest.mark.asyncio
+    async def test_user_update_invalidates_principal_cache(self, session, defect):
+        user = await UserRepos.get_user_by_id(defect.created_by_id, session)
+        principal_cache.set_user(user)
+
+        await UserRepos.update_user(user.id, UserUpdate(name="Renamed"), session)
+        await session.commit()
+
+        assert principal_cache.get_user(user.id) is None
+        assert (await UserRepos.get_user_by_id(user.id, session)).name == "Renamed"
+
+    @pytest.mark.asyncio
+    async def test_invalidation_waits_for_commit(self, session, defect):
+        project = await ProjectRepos.get_project_by_id(defect.project_id, session)
+
+        await ProjectRepos.update_project(project.id, ProjectUpdate(name="Rolled back"), session)
+        # До commit другие запросы видят старую строку, кеш с ней согласован
+        assert await ProjectRepos.get_project_by_id(project.id, session) is project
+        await session.rollback()
+        assert await ProjectRepos.get_project_by_id(project.id, session) is project
+
+        await ProjectRepos.update_project(project.id, ProjectUpdate(name="Renamed"), session)
+        await session.commit()
+        assert (await ProjectRepos.get_project_by_id(project.id, session)).name == "Renamed"
+
+    @pytest.mark.asyncio
+    async def test_etag_route_refreshes_stale_cache(self, api_client, session, defect):
+        project = await ProjectRepos.get_project_by_id(defect.project_id, session)
+        # Строка изменена, а сброс кеша ещё не дошёл (другой воркер, нет NOTIFY)
+        await session.execute(update(Project).where(Project.id == project.id).values(name="Changed elsewhere"))
+        await VersionRepos.bump(Project.__tablename__, session)
+        await session.commit()
+
+        response = await api_client.get(f"/projects/{project.id}")
+        assert response.json()["name"] == "Changed elsewhere"
+
+        # Запись перечитана при текущем счётчике, следующий ответ с тем же ETag - из кеша
+        statements = record_statements(session)
+        assert (await api_client.get(f"/projects/{project.id}")).json()["name"] == "Changed elsewhere"
+        assert not any("FROM projects" in statement for statement in statements)
+
+    @pytest.mark.asyncio
+    async def test_notification_from_other_worker_invalidates(self, session, defect):
+        project = await ProjectRepos.get_project_by_id(defect.project_id, session)
+        # Другой воркер изменил проект в обход этого процесса и прислал NOTIFY
+        await session.execute(update(Project).where(Project.id == project.id).values(name="Changed elsewhere"))
+        await session.commit()
+        assert (await ProjectRepos.get_project_by_id(project.id, session)).name == project.name
+
+        listener = InvalidationListener(engine=None)
+        listener._on_notify(None, 0, "entity_cache", f"projects:{project.id}")
+        listener._on_notify(None, 0, "entity_cache", "garbage")
+        await asyncio.gather(*listener._pending)
+
+        assert (await ProjectRepos.get_project_by_id(project.id, session)).name == "Changed elsewhere"
+
+
+class TestDefectFull:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("comments", [1, 25])
+    async def test_loads_everything_within_query_budget(self, session, defect, comments):
+        defect_id, user_id = defect.id, defect.created_by_id
+        assignee = User(email="assignee@example.com", name="Assignee", password_hash="x", role=UserRole.ENGINEER)
+        session.add(assignee)
+        await session.flush()
+        await session.execute(update(Defect).where(Defect.id == defect_id).values(assigned_to_id=assignee.id))
+        authors = [user_id, assignee.id]
+        session.add_all([Comment(text=f"Comment {i}", defect_id=defect_id, author_id=authors[i % 2]) for i in range(comments)])
+        session.add_all([DefectAttachment(file_path=f"/files/{i}.jpg", defect_id=defect_id) for i in range(3)])
+        await session.commit()
+        session.expunge_all()
+
+        statements = record_statements(session)
+        full = await DefectService.get_defect_full(defect_id, session)
+
+        assert len(statements) == 3
+        assert full.project.name == "Project"
+        assert (full.creator.name, full.assignee.name) == ("Repo User", "Assignee")
+        assert [comment.text for comment in full.comments] == [f"Comment {i}" for i in range(comments)]
+        assert {comment.author.name for comment in full.comments} == ({"Repo User", "Assignee"} if comments > 1 else {"Repo User"})
+        assert len(full.attachments) == 3
+
+    @pytest.mark.asyncio
+    async def test_missing_defect_and_unassigned(self, session, defect):
+        full = await DefectService.get_defect_full(defect.id, session)
+        assert full.assignee is None and full.comments == [] and full.attachments == []
+
+        with pytest.raises(HTTPException) as exc_info:
+            await DefectService.get_defect_full(defect.id + 1, session)
+        assert exc_info.value.status_code == 404
+
+
+@pytest_asyncio.fixture
+async def api_client(session, defect):
+    """HTTP-клиент приложения на тестовой сессии от имени автора дефекта."""
+    async def override_session():
+        yield session
+
+    app.dependency_overrides[get_session] = override_session
+    user_id = defect.created_by_id
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user_id)
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            yield client
+    finally:
+        app.dependency_overrides.clear()
+
+
+class TestSparseFields:
+    @pytest.mark.asyncio
+    async def test_selects_only_requested_columns(self, session, defect):
+        session.expunge_all()
+        statements = record_statements(session)
+        defects = await DefectRepos.get_all_defects(session=session, sort="-priority", projection=Projection(fields=("title", "status")))
+
+        assert len(statements) == 1
+        select_list = statements[0].split(" FROM ")[0]
+        assert "defects.title" in select_list and "defects.status" in select_list
+        assert "defects.description" not in select_list and "defects.project_id" not in select_list
+        # id и ключ сортировки нужны для курсора
+        assert defects[0].model_dump() == {"id": defect.id, "priority": DefectPriority.MEDIUM, "title": "Crack", "status": DefectStatus.NEW}
+
+    @pytest.mark.asyncio
+    async def test_includes_from_subqueries_and_cache(self, session, defect):
+        defect_id, user_id, project_id = defect.id, defect.created_by_id, defect.project_id
+        session.add_all([Comment(text=f"Comment {i}", defect_id=defect_id, author_id=user_id) for i in range(3)])
+        await DefectRepos.bulk_insert_defects([
+            {**DefectCreate(title="Assigned", project_id=project_id, assigned_to_id=user_id).model_dump(), "created_by_id": user_id}
+        ], session)
+        await session.commit()
+        session.expunge_all()
+
+        statements = record_statements(session)
+        projection = Projection(fields=("title",), include=("assignee", "project", "comment_count"))
+        await DefectRepos.get_defects_by_project(project_id, session, projection=projection)
+        # Пользователи и проекты страницы догружаются по одному запросу на таблицу, дальше - из кеша
+        assert len(statements) == 3 and sum(" IN (" in statement for statement in statements) == 2
+        statements.clear()
+        defects = await DefectRepos.get_defects_by_project(project_id, session, projection=projection)
+
+        assert len(statements) == 1
+        assert [item.model_dump() for item in defects] == [
+            {"id": defect_id, "title": "Crack", "assignee": None, "project": {"id": project_id, "name": "Project"}, "comment_count": 3},
+            {"id": defect_id + 1, "title": "Assigned", "assignee": {"id": user_id, "name": "Repo User"}, "project": {"id": project_id, "name": "Project"}, "comment_count": 0},
+        ]
+
+    @pytest.mark.asyncio
+    async def test_unknown_names_rejected(self, session, defect):
+        for projection in (Projection(fields=("password_hash",)), Projection(include=("comments",))):
+            with pytest.raises(HTTPException) as exc_info:
+                await DefectService.get_all_defects(session=session, projection=projection)
+            assert exc_info.value.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_http_default_shape_and_sparse_response(self, api_client, session, defect):
+        client = api_client
+        defect_id, user_id, project_id = defect.id, defect.created_by_id, defect.project_id
+        session.add(Comment(text="Comment", defect_id=defect_id, author_id=user_id))
+        await session.commit()
+
+        full = await client.get("/defects/")
+        assert set(full.json()[0]) == set(DefectGetting.model_fields)
+        assert "etag" in full.headers
+
+        sparse = await client.get("/defects/", params={"fields": "id,title", "include": "comment_count", "limit": 1})
+        assert sparse.json() == [{"id": defect_id, "title": "Crack", "comment_count": 1}]
+        assert "x-next-cursor" in sparse.headers
+        # Число комментариев не отражено в счётчике defects, поэтому без ETag
+        assert "etag" not in sparse.headers
+
+        comments = await client.get(f"/comments/defect/{defect_id}", params={"fields": "text", "include": "author,defect"})
+        assert comments.json()[0]["author"] == {"id": user_id, "name": "Repo User"}
+        assert comments.json()[0]["defect"] == {"id": defect_id, "title": "Crack"}
+
+        projects = await client.get("/projects/", params={"fields": "name", "include": "manager,defect_count"})
+        assert projects.json() == [{"id": project_id, "name": "Project", "manager": {"id": user_id, "name": "Repo User"}, "defect_count": 1}]
+
+        assert (await client.get("/projects/", params={"fields": "name,budget"})).status_code == 400
+
+
+class TestListSerialization:
+    @pytest.mark.asyncio
+    async def test_lists_validated_once_and_shape_unchanged(self, api_client, session, defect):
+        defect_id, user_id = defect.id, defect.created_by_id
+        session.add_all([Comment(text=f"Comment {i}", defect_id=defect_id, author_id=user_id) for i in range(5)])
+        await session.commit()
+        result = await session.execute(select(Comment).order_by(Comment.id))
+        expected = [CommentGetting.model_validate(comment).model_dump(mode="json") for comment in result.scalars().all()]
+
+        statements = record_statements(session)
+        with patch.object(CommentGetting, "model_validate", wraps=CommentGetting.model_validate) as validate:
+            response = await api_client.get(f"/comments/defect/{defect_id}", params={"limit": 5})
+
+        assert response.json() == expected
+        assert response.headers["content-type"] == "application/json"
+        assert "x-next-cursor" in response.headers
+        assert validate.call_count == 0
+        # Колонки схемы, а не ORM-объекты
+        assert "comments.text" in statements[0] and "comments.id" in statements[0]
+
+        users = await api_client.get("/users/")
+        assert users.json() == [{"id": user_id, "email": "repo@example.com", "name": "Repo User", "role": "engineer"}]
+
+    @pytest.mark.asyncio
+    async def test_content_negotiation(self, api_client, session, defect):
+        import msgpack
+        plain = await api_client.get("/defects/")
+        rows = plain.json()
+
+        packed = await api_client.get("/defects/", headers={"Accept": "application/msgpack"})
+        assert packed.headers["content-type"] == "application/msgpack"
+        assert msgpack.unpackb(packed.content) == rows
+
+        columnar = await api_client.get("/defects/", headers={"Accept": "application/vnd.columnar+json"})
+        assert columnar.headers["content-type"] == "application/vnd.columnar+json"
+        assert columnar.json() == {key: [row[key] for row in rows] for key in rows[0]}
+        assert columnar.headers["vary"] == "Accept"
+
+        # У каждого представления свой ETag: JSON из кеша не подходит клиенту MessagePack
+        etags = {plain.headers["etag"], packed.headers["etag"], columnar.headers["etag"]}
+        assert len(etags) == 3
+        assert (await api_client.get("/defects/", headers={"Accept": "application/msgpack", "If-None-Match": plain.headers["etag"]})).status_code == 200
+        assert (await api_client.get("/defects/", headers={"Accept": "application/msgpack", "If-None-Match": packed.headers["etag"]})).status_code == 304
+
+
+
+@pytest.fixture
+def storage(tmp_path):
+    from app.core.derivatives import DerivativePipeline
+    from app.core.storage import LocalStorage
+    local = LocalStorage(str(tmp_path / "attachments"))
+    pipeline = DerivativePipeline(local, kind="thread", workers=2)
+    with patch("app.services.attachment_services.attachment_storage", local), \
+            patch("app.services.attachment_services.derivative_pipeline", pipeline), \
+            patch("app.api.attachment.derivative_pipeline", pipeline), \
+            patch("app.core.derivatives.derivative_pipeline", pipeline):
+        yield local
+    pipeline.shutdown()
+
+
+class TestAttachmentUpload:
+    @pytest.mark.asyncio
+    async def test_upload_is_content_addressed(self, api_client, storage, defect):
+        import hashlib
+        content = b"photo bytes " * 10000
+        digest = hashlib.sha256(content).hexdigest()
+
+        first = await api_client.post("/attachments/upload", data={"defect_id": str(defect.id)},
+                                      files={"file": ("../../crack.jpg", content, "image/jpeg")})
+        assert first.status_code == 201
+        body = first.json()
+        assert body["file_path"] == digest
+        assert (body["file_name"], body["content_type"], body["size"]) == ("crack.jpg", "image/jpeg", len(content))
+        assert storage.path(digest).read_bytes() == content
+
+        # Та же фотография ещё раз: новая запись, содержимое не дублируется
+        second = await api_client.post("/attachments/upload", data={"defect_id": str(defect.id)},
+                                       files={"file": ("copy.jpg", content, "image/jpeg")})
+        assert second.status_code == 201
+        assert second.json()["id"] != body["id"] and second.json()["file_path"] == digest
+        blobs = [path for path in storage.root.rglob("*") if path.is_file()]
+        assert blobs == [storage.path(digest)]
+
+    @pytest.mark.asyncio
+    async def test_rejected_uploads(self, api_client, storage, defect):
+        not_multipart = await api_client.post("/attachments/upload", json={"defect_id": defect.id})
+        assert not_multipart.status_code == 415
+
+        missing_defect = await api_client.post("/attachments/upload", data={"defect_id": "999999"}, files={"file": ("a.txt", b"x")})
+        assert missing_defect.status_code == 404
+
+        no_file = await api_client.post("/attachments/upload", data={"defect_id": str(defect.id)}, files={"other": ("a.txt", b"x")})
+        assert no_file.status_code == 422
+
+        with patch("app.core.uploads.ATTACHMENT_MAX_BYTES", 10):
+            too_large = await api_client.post("/attachments/upload", data={"defect_id": str(defect.id)}, files={"file": ("a.bin", b"x" * 100)})
+        assert too_large.status_code == 413
+        # Недописанный файл не остаётся во временном каталоге
+        assert list(storage.tmp.iterdir()) == []
+
+        two_files = await api_client.post("/attachments/upload", data={"defect_id": str(defect.id)},
+                                          files=[("file", ("a.txt", b"first")), ("file", ("b.txt", b"second"))])
+        assert two_files.status_code == 422
+
+        # defect_id после файла: проверить дефект до записи нельзя
+        boundary = "test-boundary"
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="a.txt"\r\n\r\nlate\r\n'
+                f'--{boundary}\r\nContent-Disposition: form-data; name="defect_id"\r\n\r\n{defect.id}\r\n--{boundary}--\r\n')
+        late_field = await api_client.post("/attachments/upload", content=body.encode(),
+                                           headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+        assert late_field.status_code == 422
+
+        with patch.object(DefectAttachmentRepos, "create_uploaded_attachment", side_effect=RuntimeError("db down")):
+            failed = await api_client.post("/attachments/upload", data={"defect_id": str(defect.id)}, files={"file": ("a.txt", b"lost")})
+        assert failed.status_code == 500
+
+    @pytest.mark.asyncio
+    async def test_orphans_collected_only_without_references(self, api_client, storage, session, defect):
+        import hashlib
+        import os
+        import time
+        from app.services.attachment_services import DefectAttachmentService
+        kept = await api_client.post("/attachments/upload", data={"defect_id": str(defect.id)}, files={"file": ("a.txt", b"kept")})
+        with patch.object(DefectAttachmentRepos, "create_uploaded_attachment", side_effect=RuntimeError("db down")):
+            failed = await api_client.post("/attachments/upload", data={"defect_id": str(defect.id)}, files={"file": ("b.txt", b"orphan")})
+        assert failed.status_code == 500
+        # Запрос не удаляет своё содержимое: его могла разделять параллельная загрузка
+        orphan = hashlib.sha256(b"orphan").hexdigest()
+        assert storage.path(orphan).exists()
+
+        old = time.time() - 7200
+        for digest in (orphan, kept.json()["file_path"]):
+            os.utime(storage.path(digest), (old, old))
+        assert await DefectAttachmentService.collect_orphan_blobs(session, grace=3600) == 1
+        assert not storage.path(orphan).exists() and storage.path(kept.json()["file_path"]).exists()
+
+        # Повторная загрузка того же содержимого продлевает ему жизнь, пока создаётся запись
+        writer = await storage.writer()
+        await writer.write(b"kept")
+        assert not (await writer.commit()).created
+        await session.execute(delete(DefectAttachment))
+        assert await DefectAttachmentService.collect_orphan_blobs(session, grace=3600) == 0
+
+
+class TestAttachmentDownload:
+    @pytest_asyncio.fixture
+    async def uploaded(self, api_client, storage, defect):
+        content = bytes(range(256)) * 40
+        response = await api_client.post("/attachments/upload", data={"defect_id": str(defect.id)},
+                                         files={"file": ("план этажа.pdf", content, "application/pdf")})
+        return response.json(), content
+
+    @pytest.mark.asyncio
+    async def test_full_and_conditional(self, api_client, uploaded):
+        attachment, content = uploaded
+        url = f"/attachments/{attachment['id']}/content"
+        response = await api_client.get(url)
+        assert response.status_code == 200
+        assert response.content == content
+        assert response.headers["etag"] == f'"{attachment["file_path"]}"'
+        assert response.headers["content-type"] == "application/pdf"
+        assert response.headers["content-length"] == str(len(content))
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["cache-control"] == "private, no-cache"
+        assert response.headers["content-disposition"].startswith("inline; filename=")
+        assert "filename*=UTF-8''%D0%BF%D0%BB%D0%B0%D0%BD" in response.headers["content-disposition"]
+
+        versioned = await api_client.get(url, params={"v": attachment["file_path"]})
+        assert "immutable" in versioned.headers["cache-control"]
+
+        cached = await api_client.get(url, headers={"If-None-Match": response.headers["etag"]})
+        assert cached.status_code == 304 and cached.content == b""
+
+        head = await api_client.head(url)
+        assert head.status_code == 200 and head.content == b""
+        assert head.headers["content-length"] == str(len(content))
+
+    @pytest.mark.asyncio
+    async def test_ranges(self, api_client, uploaded):
+        attachment, content = uploaded
+        url = f"/attachments/{attachment['id']}/content"
+        size = len(content)
+
+        single = await api_client.get(url, headers={"Range": "bytes=100-199"})
+        assert single.status_code == 206
+        assert single.content == content[100:200]
+        assert single.headers["content-range"] == f"bytes 100-199/{size}"
+
+        suffix = await api_client.get(url, headers={"Range": "bytes=-10"})
+        assert suffix.content == content[-10:]
+
+        multi = await api_client.get(url, headers={"Range": "bytes=0-9, 5000-5009"})
+        assert multi.status_code == 206
+        media_type, _, boundary = multi.headers["content-type"].partition("; boundary=")
+        assert media_type == "multipart/byteranges"
+        parts = [part for part in multi.content.split(f"--{boundary}".encode()) if part.strip(b"-\r\n")]
+        assert len(parts) == 2
+        head, _, body = parts[1].partition(b"\r\n\r\n")
+        assert f"Content-Range: bytes 5000-5009/{size}".encode() in head
+        assert body[:-2] == content[5000:5010]
+        assert multi.headers["content-length"] == str(len(multi.content))
+
+        unsatisfiable = await api_client.get(url, headers={"Range": f"bytes={size}-"})
+        assert unsatisfiable.status_code == 416
+        assert unsatisfiable.headers["content-range"] == f"bytes */{size}"
+
+        # If-Range с чужим ETag: у клиента другая версия, отдаём всё
+        stale = await api_client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+        assert stale.status_code == 200 and stale.content == content
+        fresh = await api_client.get(url, headers={"Range": "bytes=0-9", "If-Range": single.headers["etag"]})
+        assert fresh.status_code == 206 and fresh.content == content[:10]
+
+    @pytest.mark.asyncio
+    async def test_legacy_attachment_has_no_content(self, api_client, storage, defect):
+        created = await api_client.post("/attachments/", json={"file_path": "photos/crack.jpg", "defect_id": defect.id})
+        response = await api_client.get(f"/attachments/{created.json()['id']}/content")
+        assert response.status_code == 404
+
+
+@pytest.fixture
+def uploads(storage, tmp_path):
+    from app.core.resumable import ResumableUploads
+    resumable = ResumableUploads(storage, str(tmp_path / "attachments" / "uploads"), ttl=3600)
+    with patch("app.services.attachment_services.resumable_uploads", resumable):
+        yield resumable
+
+
+class TestResumableUpload:
+    CHUNK_HEADERS = {"Content-Type": "application/offset+octet-stream"}
+
+    async def patch_chunk(self, api_client, upload_id: str, offset: int, data: bytes):
+        return await api_client.patch(f"/attachments/uploads/{upload_id}", content=data,
+                                      headers={**self.CHUNK_HEADERS, "Upload-Offset": str(offset)})
+
+    @pytest.mark.asyncio
+    async def test_resume_and_commit(self, api_client, uploads, storage, defect):
+        import hashlib
+        content = b"site video " * 50000
+        created = await api_client.post("/attachments/uploads", json={
+            "defect_id": defect.id, "size": len(content), "file_name": "обход.mp4", "content_type": "video/mp4"})
+        assert created.status_code == 201
+        upload = created.json()
+        assert upload["offset"] == 0 and created.headers["location"] == f"/attachments/uploads/{upload['id']}"
+        # Срок - по ttl экземпляра (в фикстуре час), а не по глобальной настройке
+        expires_in = datetime.fromisoformat(upload["expires_at"]) - datetime.now(timezone.utc)
+        assert timedelta(minutes=59) < expires_in <= timedelta(hours=1)
+
+        first = await self.patch_chunk(api_client, upload["id"], 0, content[:200000])
+        assert first.status_code == 204 and first.headers["upload-offset"] == "200000"
+        assert "location" not in first.headers
+
+        # Связь оборвалась: клиент спрашивает, сколько дошло, и продолжает с этого места
+        progress = await api_client.head(f"/attachments/uploads/{upload['id']}")
+        assert progress.headers["upload-offset"] == "200000"
+        assert progress.headers["upload-length"] == str(len(content))
+        conflict = await self.patch_chunk(api_client, upload["id"], 0, content[:10])
+        assert conflict.status_code == 409 and conflict.headers["upload-offset"] == "200000"
+
+        # Следующий кусок пришёл в другой воркер: хеш пересчитывается по файлу
+        uploads._hashes.clear()
+        last = await self.patch_chunk(api_client, upload["id"], 200000, content[200000:])
+        assert last.status_code == 204 and last.headers["upload-offset"] == str(len(content))
+        attachment = (await api_client.get(last.headers["location"])).json()
+        assert attachment["file_path"] == hashlib.sha256(content).hexdigest()
+        assert (attachment["file_name"], attachment["size"]) == ("обход.mp4", len(content))
+        assert storage.path(attachment["file_path"]).read_bytes() == content
+        assert not uploads._data(upload["id"]).exists()
+
+        # Ответ на последний PATCH потерялся: повтор не создаёт второе вложение
+        retry = await self.patch_chunk(api_client, upload["id"], len(content), b"")
+        assert retry.status_code == 204 and retry.headers["location"] == last.headers["location"]
+        count = await api_client.get(f"/attachments/defect/{defect.id}")
+        assert len(count.json()) == 1
+
+    @pytest.mark.asyncio
+    async def test_rejected_requests(self, api_client, uploads, defect):
+        created = (await api_client.post("/attachments/uploads", json={"defect_id": defect.id, "size": 10})).json()
+        url = f"/attachments/uploads/{created['id']}"
+
+        wrong_type = await api_client.patch(url, content=b"abc", headers={"Upload-Offset": "0"})
+        assert wrong_type.status_code == 415
+        too_long = await self.patch_chunk(api_client, created["id"], 0, b"x" * 11)
+        assert too_long.status_code == 413
+        assert (await api_client.post("/attachments/uploads", json={"defect_id": 999999, "size": 10})).status_code == 404
+        with patch("app.services.attachment_services.ATTACHMENT_MAX_BYTES", 5):
+            assert (await api_client.post("/attachments/uploads", json={"defect_id": defect.id, "size": 10})).status_code == 413
+
+        # Отмена во время PATCH ждёт его окончания
+        async with uploads.open(created["id"], defect.created_by_id):
+            assert (await api_client.delete(url)).status_code == 423
+        app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=defect.created_by_id + 1)
+        assert (await api_client.head(url)).status_code == 404
+        app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=defect.created_by_id)
+        assert (await api_client.delete(url)).status_code == 204
+        assert (await api_client.head(url)).status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_cleanup_abandoned(self, api_client, uploads, storage, defect):
+        import os
+        import time
+        abandoned = (await api_client.post("/attachments/uploads", json={"defect_id": defect.id, "size": 10})).json()
+        active = (await api_client.post("/attachments/uploads", json={"defect_id": defect.id, "size": 10})).json()
+        await self.patch_chunk(api_client, abandoned["id"], 0, b"12345")
+        stale_tmp = storage.tmp / "upload-crashed"
+        storage.tmp.mkdir(parents=True, exist_ok=True)
+        stale_tmp.write_bytes(b"x")
+        old = time.time() - 7200
+        for path in (uploads._data(abandoned["id"]), uploads._meta(abandoned["id"]), stale_tmp):
+            os.utime(path, (old, old))
+
+        assert (await api_client.head(f"/attachments/uploads/{abandoned['id']}")).status_code == 404
+        assert await uploads.cleanup() == 3
+        assert sorted(path.name for path in uploads.root.iterdir()) == sorted([f"{active['id']}.part", f"{active['id']}.json"])
+        assert (await api_client.head(f"/attachments/uploads/{active['id']}")).status_code == 200
+
+
+class TestAttachmentDerivatives:
+    @staticmethod
+    def jpeg(width: int, height: int) -> bytes:
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new("RGB", (width, height), (180, 90, 30)).save(buffer, "JPEG")
+        return buffer.getvalue()
+
+    async def upload(self, api_client, defect, content: bytes, content_type: str) -> dict:
+        response = await api_client.post("/attachments/upload", data={"defect_id": str(defect.id)},
+                                         files={"file": ("photo.jpg", content, content_type)})
+        return response.json()
+
+    @pytest.mark.asyncio
+    async def test_thumbnails_and_preview(self, api_client, storage, defect):
+        from PIL import Image
+        from app.services.attachment_services import derivative_pipeline
+        attachment = await self.upload(api_client, defect, self.jpeg(2000, 1500), "image/jpeg")
+        await derivative_pipeline.wait(attachment["file_path"])
+        url = f"/attachments/{attachment['id']}/derivatives"
+
+        tag = f'{attachment["file_path"]}.thumb-256.256x256.q80.webp'
+        assert attachment["derivatives"]["thumb-256"] == tag
+        listed = await api_client.get(f"/attachments/defect/{defect.id}")
+        assert listed.json()[-1]["derivatives"] == attachment["derivatives"]
+        thumb = await api_client.get(f"{url}/thumb-256", params={"v": attachment["file_path"]})
+        assert thumb.status_code == 200
+        assert thumb.headers["content-type"] == "image/webp"
+        # Размер, качество и формат входят в ETag: после смены настроек старая копия не подойдёт
+        assert thumb.headers["etag"] == f'"{tag}"'
+        assert thumb.headers["cache-control"] == "private, no-cache"
+        assert Image.open(io.BytesIO(thumb.content)).size == (256, 256)
+        assert "immutable" in (await api_client.get(f"{url}/thumb-256", params={"v": tag})).headers["cache-control"]
+
+        preview = await api_client.get(f"{url}/preview")
+        assert Image.open(io.BytesIO(preview.content)).size == (1600, 1200)
+        assert preview.headers["cache-control"] == "private, no-cache"
+        # Производные лежат рядом с оригиналом
+        assert sorted(path.name for path in storage.path(attachment["file_path"]).parent.iterdir()) == sorted(
+            [attachment["file_path"]] + [f"{attachment['file_path']}.{variant}.q80.webp" for variant in ("preview.1600x1600", "thumb-256.256x256", "thumb-128.128x128")])
+
+    @pytest.mark.asyncio
+    async def test_original_while_pending(self, api_client, storage, defect):
+        from app.services.attachment_services import derivative_pipeline
+        content = self.jpeg(640, 480)
+        attachment = await self.upload(api_client, defect, content, "image/jpeg")
+        digest = attachment["file_path"]
+        await derivative_pipeline.wait(digest)
+        for path in storage.path(digest).parent.glob(f"{digest}.*"):
+            path.unlink()
+
+        pending = await api_client.get(f"/attachments/{attachment['id']}/derivatives/thumb-128")
+        assert pending.status_code == 200 and pending.content == content
+        assert pending.headers["content-type"] == "image/jpeg"
+        assert pending.headers["etag"] == f'"{digest}"' and pending.headers["cache-control"] == "private, no-cache"
+
+        await derivative_pipeline.wait(digest)
+        ready = await api_client.get(f"/attachments/{attachment['id']}/derivatives/thumb-128")
+        assert ready.headers["content-type"] == "image/webp"
+
+    @pytest.mark.asyncio
+    async def test_unsupported_content(self, api_client, storage, defect):
+        from app.services.attachment_services import derivative_pipeline
+        document = await self.upload(api_client, defect, b"plain text", "text/plain")
+        assert document["derivatives"] is None
+        assert (await api_client.get(f"/attachments/{document['id']}/derivatives/preview")).status_code == 404
+
+        image = await self.upload(api_client, defect, self.jpeg(64, 64), "image/jpeg")
+        assert (await api_client.get(f"/attachments/{image['id']}/derivatives/huge")).status_code == 404
+
+        broken = await self.upload(api_client, defect, b"not really a jpeg", "image/jpeg")
+        await derivative_pipeline.wait(broken["file_path"])
+        assert broken["file_path"] in derivative_pipeline._failed
+        fallback = await api_client.get(f"/attachments/{broken['id']}/derivatives/preview")
+        assert fallback.status_code == 200 and fallback.content == b"not really a jpeg"
+
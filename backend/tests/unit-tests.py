@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 from unittest.mock import Mock, patch, AsyncMock
 from fastapi import HTTPException
@@ -8,6 +9,18 @@ from app.schemas.user import UserCreate, LoginRequest
 from app.repository.auth_repos import AuthRepos
 from app.services.auth_services import AuthService
 from app.core.security import hash_password, verify_password
+from app.core.hashing import PasswordHasher
+from app.core.principal_cache import PrincipalCache
+from app.core.sketch import TDigest
+import bisect
+import json
+import random
+from app.core import security
+from jose import jwt
+from app.core.config import SECRET_KEY, ALGORITHM
+from app.database import instrumentation
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
 
 
 class TestAuthReposUnit:
@@ -15,8 +28,7 @@ class TestAuthReposUnit:
     async def test_register_user_success(self):
         mock_session = AsyncMock(spec=AsyncSession)
         mock_session.execute.return_value = Mock(scalar=Mock(return_value=None))
-        mock_session.commit = AsyncMock()
-        mock_session.refresh = AsyncMock()
+        mock_session.flush = AsyncMock()
         
         email = "test@example.com"
         name = "Test User"
@@ -25,7 +37,8 @@ class TestAuthReposUnit:
         user_id = await AuthRepos.register_user(email, name, password, role, mock_session)
         assert user_id is not None
         mock_session.add.assert_called_once()
-        mock_session.commit.assert_called_once()
+        mock_session.flush.assert_called_once()
+        mock_session.commit.assert_not_called()
     
     @pytest.mark.asyncio
     async def test_register_user_duplicate_email(self):
@@ -171,4 +184,384 @@ class TestSecurityUnit:
         
         verification_result = verify_password(wrong_password, hashed)
         
-        assert verification_result is False
\ No newline at end of file
+        assert verification_result is False
+
+
+class TestPasswordHasherUnit:
+    @pytest.mark.asyncio
+    async def test_hash_and_verify_in_pool(self):
+        hasher = PasswordHasher(kind="thread", workers=2, max_concurrency=2)
+        try:
+            hashed = await hasher.hash("pool_password")
+
+            assert await hasher.verify("pool_password", hashed) is True
+            assert await hasher.verify("other_password", hashed) is False
+            assert verify_password("pool_password", hashed) is True
+        finally:
+            hasher.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_metrics_are_collected(self):
+        hasher = PasswordHasher(kind="thread", workers=1, max_concurrency=1)
+        try:
+            await asyncio.gather(*(hasher.hash(f"password_{i}") for i in range(3)))
+
+            metrics = hasher.metrics.snapshot()
+            assert metrics["calls"] == 3
+            assert metrics["in_flight"] == 0
+            assert metrics["hash_time_total"] > 0
+            assert metrics["queue_wait_max"] >= metrics["queue_wait_avg"] >= 0
+        finally:
+            hasher.shutdown()
+
+    def test_unknown_executor_kind(self):
+        with pytest.raises(ValueError):
+            PasswordHasher(kind="fiber")
+
+
+
+class TestTDigestUnit:
+    def rank_errors(self, digest, data, quantiles=(0.5, 0.9, 0.99)):
+        # Ошибка по рангу: какая доля точных значений меньше оценки, минус q
+        ordered = sorted(data)
+        return {q: abs(bisect.bisect_left(ordered, digest.quantile(q)) / len(ordered) - q) for q in quantiles}
+
+    @pytest.mark.parametrize("distribution", ["exponential", "lognormal", "uniform"])
+    def test_quantiles_close_to_exact(self, distribution):
+        rng = random.Random(7)
+        generate = {
+            "exponential": lambda: rng.expovariate(1 / 86400),
+            "lognormal": lambda: rng.lognormvariate(10, 1.5),
+            "uniform": lambda: rng.uniform(0, 10 ** 6),
+        }[distribution]
+        data = [generate() for _ in range(50000)]
+        digest = TDigest()
+        digest.update(data)
+
+        errors = self.rank_errors(digest, data)
+        assert errors[0.5] < 0.01 and errors[0.9] < 0.005 and errors[0.99] < 0.002
+
+    def test_merged_daily_sketches_match_single_sketch(self):
+        rng = random.Random(11)
+        data = [rng.expovariate(1 / 3600) for _ in range(30000)]
+        days = [TDigest() for _ in range(365)]
+        for value in data:
+            rng.choice(days).add(value)
+
+        merged = TDigest()
+        for day in days:
+            merged.merge(TDigest.from_bytes(day.to_bytes()))
+
+        assert merged.count == len(data)
+        assert (merged.min, merged.max) == (min(data), max(data))
+        assert len(merged.means) <= 2 * merged.compression
+        assert max(self.rank_errors(merged, data).values()) < 0.01
+
+    def test_small_and_empty_digests(self):
+        assert TDigest().quantile(0.5) is None
+        digest = TDigest.from_bytes(TDigest().to_bytes())
+        digest.update([5.0, 1.0, 3.0])
+        assert digest.quantile(0) == 1.0
+        assert digest.quantile(0.5) == 3.0
+        assert digest.quantile(1) == 5.0
+
+
+class TestSerializationUnit:
+    def test_orjson_matches_pydantic_json(self):
+        from datetime import datetime, timedelta, timezone
+        from app.core.serialization import dump_models, dumps, validate_rows
+        from app.schemas.comment import CommentWithAuthor
+        from app.schemas.user import UserRole as SchemaUserRole
+
+        author = {"id": 1, "email": "a@example.com", "name": "Автор", "role": SchemaUserRole.ENGINEER}
+        moments = [
+            datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+            datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=timezone(timedelta(hours=3))),
+            datetime(2024, 1, 2, 3, 4, 5),
+        ]
+        keys = ("id", "text", "created_at", "defect_id", "author_id", "author")
+        rows = [(i, "Текст \"в кавычках\"", moment, 7, 1, author) for i, moment in enumerate(moments)]
+        items = validate_rows(CommentWithAuthor, keys, rows)
+
+        assert [item.author.role for item in items] == [SchemaUserRole.ENGINEER] * 3
+        expected = "[" + ",".join(item.model_dump_json() for item in items) + "]"
+        assert json.loads(dumps(dump_models(items))) == json.loads(expected)
+        # Время в том же виде, что у pydantic, а не только равное после разбора
+        assert [item["created_at"] for item in json.loads(dumps(dump_models(items)))] == [item.model_dump(mode="json")["created_at"] for item in items]
+        # Схему без dump_models не сериализуем: её __dict__ не знает о computed- и исключённых полях
+        with pytest.raises(TypeError):
+            dumps(items)
+
+    def test_adapter_built_once_per_schema(self):
+        from app.core.serialization import list_adapter
+        from app.schemas.comment import CommentGetting
+
+        assert list_adapter(CommentGetting) is list_adapter(CommentGetting)
+
+
+class TestListFormatsUnit:
+    @pytest.mark.parametrize("accept, expected", [
+        (None, "application/json"),
+        ("*/*", "application/json"),
+        ("application/msgpack", "application/msgpack"),
+        ("application/x-msgpack", "application/msgpack"),
+        ("application/json;q=0.5, application/vnd.columnar+json", "application/vnd.columnar+json"),
+        ("application/msgpack;q=0.2, application/json;q=0.9", "application/json"),
+        ("text/html, application/vnd.columnar+msgpack;q=0.1", "application/vnd.columnar+msgpack"),
+        ("text/html", "application/json"),
+        ("application/msgpack;q=abc", "application/json"),
+    ])
+    def test_negotiate(self, accept, expected):
+        from app.core.serialization import negotiate
+        assert negotiate(accept).media_type == expected
+
+    def test_formats_decode_to_same_values(self):
+        import msgpack
+        from datetime import datetime, timezone
+        from app.core.serialization import LIST_FORMATS, dump_models, dumps, validate_rows
+        from app.schemas.comment import CommentGetting
+
+        keys = ("id", "text", "created_at", "defect_id", "author_id")
+        moments = [datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc), datetime(2024, 1, 2, 3, 4, 5, 678901)]
+        items = validate_rows(CommentGetting, keys, [(i, f"Текст {i}", moment, 7, 1) for i, moment in enumerate(moments)])
+        rows = json.loads(dumps(dump_models(items)))
+
+        assert msgpack.unpackb(LIST_FORMATS["application/msgpack"].render(items)) == rows
+        expected_columns = {key: [row[key] for row in rows] for key in keys}
+        assert json.loads(LIST_FORMATS["application/vnd.columnar+json"].render(items)) == expected_columns
+        assert msgpack.unpackb(LIST_FORMATS["application/vnd.columnar+msgpack"].render(items)) == expected_columns
+        assert json.loads(LIST_FORMATS["application/vnd.columnar+json"].render([])) == {}
+
+
+class TestByteRangesUnit:
+    @pytest.mark.parametrize("header, expected", [
+        (None, None),
+        ("bytes=0-99", [(0, 99)]),
+        ("bytes=900-", [(900, 999)]),
+        ("bytes=-100", [(900, 999)]),
+        ("bytes=-5000", [(0, 999)]),
+        ("bytes=950-2000", [(950, 999)]),
+        ("bytes=500-599, 0-9", [(0, 9), (500, 599)]),
+        ("bytes=0-10, 5-20, 21-30", [(0, 30)]),
+        ("bytes=1000-", []),
+        ("bytes=-0", []),
+        ("bytes=10-5", None),
+        ("bytes=abc", None),
+        ("bytes=-", None),
+        ("items=0-5", None),
+        (",".join(["bytes=0-1"] + ["5-6"] * 16), None),
+    ])
+    def test_parse_ranges(self, header, expected):
+        from app.core.file_response import parse_ranges
+        assert parse_ranges(header, 1000) == expected
+
+    def test_empty_file_has_no_satisfiable_range(self):
+        from app.core.file_response import parse_ranges
+        assert parse_ranges("bytes=0-", 0) == []
+        assert parse_ranges("bytes=-10", 0) == []
+
+    def test_content_disposition(self):
+        from app.core.file_response import content_disposition
+        assert content_disposition("фото.jpg", "image/jpeg") == "inline; filename=\"____.jpg\"; filename*=UTF-8''%D1%84%D0%BE%D1%82%D0%BE.jpg"
+        assert content_disposition("page.html", "text/html") == "attachment; filename=\"page.html\"; filename*=UTF-8''page.html"
+        assert content_disposition(None, "application/zip") == "attachment"
+        assert content_disposition(None, "image/svg+xml") == "attachment"
+        assert content_disposition(None, "Image/SVG+XML; charset=utf-8") == "attachment"
+
+    def test_portable_file_access(self, tmp_path, monkeypatch):
+        import os
+        from app.core.file_response import _read_at
+        from app.core.resumable import _try_lock
+
+        path = tmp_path / "data.bin"
+        path.write_bytes(b"0123456789")
+        first, second = os.open(path, os.O_RDWR), os.open(path, os.O_RDWR)
+        try:
+            assert _try_lock(first) and not _try_lock(second)
+            # Windows: pread нет, читаем через lseek
+            monkeypatch.delattr(os, "pread")
+            assert _read_at(second, 4, 3) == b"3456"
+        finally:
+            os.close(first)
+            os.close(second)
+
+
+class TestDerivativesUnit:
+    def test_render_respects_orientation_and_alpha(self, tmp_path):
+        from PIL import Image
+        from app.core.derivatives import render_derivatives
+
+        source = tmp_path / "rotated.jpg"
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Снято повёрнутым на 90 градусов
+        Image.new("RGB", (3000, 2000), (10, 20, 30)).save(source, "JPEG", exif=exif)
+        targets = {name: str(tmp_path / f"rotated.{name}.webp") for name in ("preview", "thumb-128")}
+        assert render_derivatives(str(source), targets, "WEBP", 80) == 2
+        assert Image.open(targets["preview"]).size == (1067, 1600)
+        assert Image.open(targets["thumb-128"]).size == (128, 128)
+
+        transparent = tmp_path / "plan.png"
+        Image.new("RGBA", (300, 100), (0, 0, 0, 0)).save(transparent)
+        small = {"preview": str(tmp_path / "plan.preview.jpeg")}
+        render_derivatives(str(transparent), small, "JPEG", 80)
+        # Меньше рамки превью - не увеличиваем; у JPEG нет альфа-канала
+        assert Image.open(small["preview"]).size == (300, 100)
+        assert Image.open(small["preview"]).mode == "RGB"
+        assert [path.name for path in tmp_path.iterdir() if path.name.startswith(".derivative-")] == []
+
+    def test_undecodable_and_oversized_images(self, tmp_path):
+        from PIL import Image
+        from app.core.derivatives import UndecodableImage, render_derivatives
+
+        garbage = tmp_path / "garbage.jpg"
+        garbage.write_bytes(b"not an image")
+        targets = {"thumb-128": str(tmp_path / "out.webp")}
+        with pytest.raises(UndecodableImage):
+            render_derivatives(str(garbage), targets, "WEBP", 80)
+
+        limit = Image.MAX_IMAGE_PIXELS
+        source = tmp_path / "bomb.png"
+        Image.new("RGB", (40, 40)).save(source)
+        with pytest.raises(UndecodableImage):
+            render_derivatives(str(source), targets, "WEBP", 80, max_pixels=1000)
+        # Лимит передаётся явно: глобальная настройка Pillow, общая для потоков, не меняется
+        assert Image.MAX_IMAGE_PIXELS == limit
+        assert render_derivatives(str(source), targets, "WEBP", 80, max_pixels=1600) == 1
+
+    @pytest.mark.asyncio
+    async def test_only_undecodable_content_is_marked_failed(self, tmp_path):
+        from concurrent.futures.process import BrokenProcessPool
+        from app.core.derivatives import DerivativePipeline, UndecodableImage
+        from app.core.storage import LocalStorage
+
+        storage = LocalStorage(str(tmp_path))
+        writer = await storage.writer()
+        await writer.write(b"image")
+        digest = (await writer.commit()).digest
+        pipeline = DerivativePipeline(storage, kind="thread", workers=1)
+        try:
+            for error in (BrokenProcessPool(), OSError("No space left on device")):
+                with patch("app.core.derivatives.render_derivatives", side_effect=error):
+                    pipeline.schedule(digest, "image/jpeg")
+                    await pipeline.wait(digest)
+                assert digest not in pipeline._failed
+                # Сломанный пул сброшен, следующая задача создаст новый
+                assert (pipeline._executor is None) == isinstance(error, BrokenProcessPool)
+
+            with patch("app.core.derivatives.render_derivatives", side_effect=UndecodableImage("broken")):
+                pipeline.schedule(digest, "image/jpeg")
+                await pipeline.wait(digest)
+            assert digest in pipeline._failed
+        finally:
+            pipeline.shutdown()
+
+
+class TestPrincipalCacheUnit:
+    def make_session(self):
+        mock_user = Mock(spec=User)
+        mock_user.id = 1
+        mock_user.email = "cached@example.com"
+        mock_user.name = "Cached User"
+        mock_user.role = UserRole.ENGINEER
+        mock_session = AsyncMock(spec=AsyncSession)
+        mock_session.execute.return_value = Mock(scalar_one_or_none=Mock(return_value=mock_user))
+        return mock_session
+
+    @pytest.mark.asyncio
+    async def test_second_request_skips_users_lookup(self):
+        token = jwt.encode({"user_id": 1}, SECRET_KEY, algorithm=ALGORITHM)
+        mock_session = self.make_session()
+
+        with patch.object(security, "principal_cache", PrincipalCache(enabled=True)) as cache:
+            first = await security.get_current_user(token, mock_session)
+            second = await security.get_current_user(token, mock_session)
+
+            assert first == second
+            assert first.email == "cached@example.com"
+            assert mock_session.execute.await_count == 1
+            assert cache.users.stats()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_invalidate_user_forces_lookup(self):
+        token = jwt.encode({"user_id": 1}, SECRET_KEY, algorithm=ALGORITHM)
+        mock_session = self.make_session()
+
+        with patch.object(security, "principal_cache", PrincipalCache(enabled=True)) as cache:
+            await security.get_current_user(token, mock_session)
+            cache.invalidate_user(1)
+            await security.get_current_user(token, mock_session)
+
+            assert mock_session.execute.await_count == 2
+            assert cache.tokens.stats()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_disabled_cache(self):
+        token = jwt.encode({"user_id": 1}, SECRET_KEY, algorithm=ALGORITHM)
+        mock_session = self.make_session()
+
+        with patch.object(security, "principal_cache", PrincipalCache(enabled=False)):
+            await security.get_current_user(token, mock_session)
+            await security.get_current_user(token, mock_session)
+
+            assert mock_session.execute.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_invalid_token(self):
+        with patch.object(security, "principal_cache", PrincipalCache(enabled=True)) as cache:
+            with pytest.raises(HTTPException) as exc_info:
+                await security.get_current_user("not-a-token", AsyncMock(spec=AsyncSession))
+
+            assert exc_info.value.status_code == 401
+            assert len(cache.tokens) == 0
+
+
+
+class TestQueryInstrumentationUnit:
+    @pytest.mark.asyncio
+    async def test_request_stats_and_repeated_shapes(self):
+        engine = create_async_engine("sqlite+aiosqlite://")
+        instrumentation.instrument_engine(engine)
+        try:
+            stats = instrumentation.start_request_stats()
+            async with engine.connect() as conn:
+                for i in range(5):
+                    await conn.execute(text("SELECT :value"), {"value": i})
+                await conn.execute(text("SELECT 1"))
+
+            assert stats.statements == 6
+            assert stats.total_time >= stats.slowest_time > 0
+            assert stats.repeated_shapes(threshold=5) == {"SELECT ?": 5}
+        finally:
+            instrumentation._current_stats.set(None)
+            await engine.dispose()
+
+    @pytest.mark.asyncio
+    async def test_slow_query_is_logged_with_parameters(self, caplog):
+        engine = create_async_engine("sqlite+aiosqlite://")
+        instrumentation.instrument_engine(engine)
+        try:
+            with patch.object(instrumentation, "SLOW_QUERY_THRESHOLD_MS", 0):
+                with caplog.at_level("WARNING", logger="app.sql.slow"):
+                    async with engine.connect() as conn:
+                        await conn.execute(text("SELECT :value"), {"value": "secret-ish"})
+
+            record = next(r for r in caplog.records if r.name == "app.sql.slow")
+            assert '"event": "slow_query"' in record.getMessage()
+            assert "secret-ish" in record.getMessage()
+        finally:
+            await engine.dispose()
+
+    def test_sample_parameters_truncates(self):
+        sample = instrumentation.sample_parameters([("x" * 500, 1)] * 10, limit=1)
+
+        assert len(sample) == 3
+        assert sample[0] == [repr("x" * 500)[:100]]
+
+
+class TestUpsertInsertUnit:
+    def test_unsupported_dialect_is_a_configuration_error(self):
+        from app.repository.base_repos import upsert_insert
+        session = Mock()
+        session.bind.dialect.name = "mysql"
+        with pytest.raises(ValueError, match="mysql"):
+            upsert_insert(session)